@@ -14,14 +14,33 @@
 from __future__ import annotations
 
 import re
+import csv
+import bisect
+import random
+import json
+import pickle
+import sqlite3
 import time
+import threading
+import os
 import base64
-from datetime import datetime
+import functools
+import zlib
+import uuid
+try:
+    import fcntl
+except ImportError:  # Windows: sin candado entre procesos
+    fcntl = None
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
 import gspread
 import pandas as pd
 import streamlit as st
 from google.oauth2.service_account import Credentials
+from gspread.utils import numericise_all, rowcol_to_a1
 from PIL import Image
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -61,6 +80,75 @@ USUARIOS: dict[str, dict] = {
 
 TIPOS_PIEZA = ["Parabrisas", "Medallón", "Puerta", "Aleta", "Costado"]
 
+# Orden de columnas de cada hoja (las hojas de sucursal comparten encabezados)
+ENCABEZADOS_INVENTARIO = ["CLAVE", "NOMBRE", "RACK", "CANTIDAD", "FECHA"]
+ENCABEZADOS: dict[str, list[str]] = {
+    "Movimientos": ["FECHA", "CLAVE", "TIPO", "DETALLE", "CANTIDAD", "PRECIO", "USUARIO", "SUCURSAL"],
+    "Traslados_Pendientes": ["FECHA", "CLAVE", "NOMBRE", "CANTIDAD", "ORIGEN", "DESTINO", "ID"],
+}
+# Llave del índice posicional por hoja (las de inventario usan CLAVE + RACK)
+LLAVES_INDICE: dict[str, tuple[str, ...]] = {"Traslados_Pendientes": ("ID",)}
+
+# Segundos tras los que una hoja en caché se revalida en segundo plano (mientras tanto se sirve tal cual)
+RECONCILIACION_SEG = 600
+# Revalidación barata: filas de encabezado del centinela por hoja, y edad máxima sin descarga completa
+# aunque la revisión del libro o el centinela no muestren cambios (ediciones a mano a media hoja)
+CENTINELA_FILAS = 20
+RECONCILIACION_MAX_SEG = 3600
+REVALIDACION_REINTENTO_SEG = 30
+# Tope de memoria para los DataFrames compartidos entre sesiones
+CACHE_MAX_MB = 256
+# Hilos para la carga hoja por hoja cuando la lectura en bloque no es posible
+CARGA_HILOS = 3
+
+# Archivo de la bitácora: la hoja viva conserva sólo los últimos MOV_VENTANA_DIAS;
+# lo anterior se mueve a particiones mensuales "Movimientos_AAAA_MM"
+MOV_VENTANA_DIAS = 60
+ARCHIVO_REVISION_SEG = 6 * 3600
+MOV_PAGINA = 200
+
+# Backend de almacenamiento: "sheets", "sqlite" o "sqlite+sheets" (SQLite primario + espejo en Sheets)
+STORAGE_BACKEND = os.environ.get("GLASS_STORAGE", "sheets")
+SQLITE_PATH = os.environ.get("GLASS_SQLITE_PATH", "inventario_local.sqlite")
+# Con espejo, una escritura que falló se reintenta (en orden, desde la salida local) tras estos segundos
+ESPEJO_REINTENTO_SEG = 30
+
+# Instantáneas locales (Parquet) de las hojas grandes para arrancar sin esperar a Sheets; "" las desactiva
+SNAPSHOT_DIR = os.environ.get("GLASS_SNAPSHOT_DIR", ".instantaneas")
+SNAPSHOT_VERSION = 1
+# Hojas de sólo anexar: se ponen al día leyendo únicamente las filas nuevas
+SOLO_ANEXAR = {"Movimientos"}
+INSTANTANEAS = set(SUCURSALES) | SOLO_ANEXAR
+
+# Spool local de la bitácora: los movimientos se encolan aquí y se envían en lotes
+SPOOL_PATH = "movimientos_spool.sqlite"
+# Archivos de candado por hoja: serializan las escrituras de la app y de mantenimiento.py
+BLOQUEOS_DIR = os.environ.get("GLASS_LOCK_DIR", ".bloqueos")
+MOV_LOTE = 500
+MOV_REINTENTO_SEG = 30
+
+# Importación de pedidos desde archivo: filas leídas por bloque, claves escritas por lote
+# (cada lote es un batch_get de filas candidatas, así que se mantiene corto) y errores mostrados
+PEDIDO_BLOQUE = 50_000
+PEDIDO_LOTE = 500
+PEDIDO_ERRORES_MAX = 200
+
+# Cuota de la API de Sheets por usuario (cuenta de servicio) y por minuto, compartida por todas las sesiones
+SHEETS_LECTURAS_MIN = 60
+SHEETS_ESCRITURAS_MIN = 60
+# Reintentos ante 429/5xx con espera exponencial con jitter (segundos)
+SHEETS_REINTENTOS = 5
+SHEETS_ESPERA_BASE = 1.0
+SHEETS_ESPERA_MAX = 32.0
+
+# Intentos de una escritura condicional cuando otra escritura cambió la existencia leída
+CONFLICTO_REINTENTOS = 3
+CONFLICTO_MSG = "La existencia cambió mientras se registraba la operación. Intenta de nuevo."
+SIN_ID_MSG = "El traslado no tiene ID (fila agregada a mano). Pulsa «🔄 Sincronizar con Sheets» para asignárselo e intenta de nuevo."
+
+# Operaciones medidas que se conservan en memoria para el diagnóstico
+TELEMETRIA_MAX = 2000
+
 C_NAVY       = "#138A27"
 C_BLUE       = "#1E3A8A"
 C_BLUE_LT    = "#2563EB"
@@ -157,7 +245,12 @@ def _clean(text) -> str:
     return " ".join(str(text).strip().upper().split())
 
 def _normalize_rack(raw) -> str:
-    t = _clean(raw)
+    return _rack_canon("" if raw is None else str(raw))
+
+@functools.lru_cache(maxsize=4096)
+def _rack_canon(text: str) -> str:
+    # Memo crudo → canónico: los racks son un vocabulario pequeño que se repite en cada carga
+    t = _clean(text)
     if not t:
         return "RACK SIN ASIGNAR"
     if re.fullmatch(r"\d+", t):
@@ -172,6 +265,230 @@ def _normalize_rack(raw) -> str:
         return f"RACK {suffix}" if suffix else "RACK SIN ASIGNAR"
     return f"RACK {t}"
 
+def _clean_series(s: pd.Series) -> pd.Series:
+    """
+    _clean vectorizado e idéntico celda por celda. Lo que ya viene limpio
+    (ASCII imprimible, sin espacios al borde ni dobles) sólo necesita
+    mayúsculas; el resto, poco frecuente, pasa por el camino escalar.
+    """
+    t = s.astype(str)
+    raros = t.str.contains(r"[^\x20-\x7e]|^ | $|  ", regex=True, na=True)
+    out = t.str.upper()
+    return out.where(~raros, s[raros].map(_clean)) if raros.any() else out
+
+def _normalize_rack_series(s: pd.Series) -> pd.Series:
+    """_normalize_rack sobre los valores únicos (memo) y reexpansión por códigos."""
+    faltan = s.isna()
+    t = s.astype(str).where(~faltan, "")
+    codes, uniques = pd.factorize(t)
+    canon = pd.Series(pd.array([_rack_canon(u) for u in uniques], dtype="str").take(codes), index=s.index)
+    return canon.where(~faltan, s[faltan].map(_normalize_rack)) if faltan.any() else canon
+
+def _to_int(value) -> int:
+    n = pd.to_numeric(value, errors="coerce")
+    return 0 if pd.isna(n) else int(n)
+
+# ═══════════════════════════════════════════════════════════════════════════
+# TELEMETRÍA DE OPERACIONES
+# ═══════════════════════════════════════════════════════════════════════════
+# Cada operación medida junta lo que costó en Sheets: llamadas de gspread,
+# peticiones HTTP, bytes enviados/recibidos, espera por cuota, reintentos y
+# tiempo total. Lo que ocurre fuera de una operación (hilos de fondo) se
+# registra como una operación propia por llamada.
+
+_tele_local = threading.local()
+
+@st.cache_resource
+def _telemetria() -> dict:
+    return {"lock": threading.Lock(), "ops": deque(maxlen=TELEMETRIA_MAX)}
+
+@contextmanager
+def _medicion(op: str):
+    """Mide el bloque como la operación `op`; si ya hay una en curso en el hilo, se suma a ésa."""
+    if getattr(_tele_local, "actual", None) is not None:
+        yield _tele_local.actual
+        return
+    reg = {"op": op, "inicio": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "seg": 0.0, "ok": True, "llamadas": 0, "http": 0,
+           "bytes_in": 0, "bytes_out": 0, "api_seg": 0.0, "espera_cuota_seg": 0.0, "reintentos": 0, "detalle": []}
+    _tele_local.actual = reg
+    t0 = time.perf_counter()
+    try:
+        yield reg
+    except Exception:
+        reg["ok"] = False
+        raise
+    finally:
+        _tele_local.actual = None
+        reg["seg"] = time.perf_counter() - t0
+        tele = _telemetria()
+        with tele["lock"]: tele["ops"].append(reg)
+
+def _medido(op: str):
+    """Decorador de operaciones: las que retornan (bool, str, ...) registran su bool como 'ok'."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            with _medicion(op) as reg:
+                res = fn(*args, **kwargs)
+                if isinstance(res, tuple) and res and isinstance(res[0], bool) and reg["op"] == op: reg["ok"] = res[0]
+                return res
+        return envoltura
+    return deco
+
+def _tele_llamada(reg: dict, hoja: str, metodo: str, seg: float, espera: float, reintentos: int):
+    reg["llamadas"] += 1
+    reg["api_seg"] += seg
+    reg["espera_cuota_seg"] += espera
+    reg["reintentos"] += reintentos
+    reg["detalle"].append({"hoja": hoja, "metodo": metodo, "seg": round(seg, 4)})
+
+def _tele_http(resp, *args, **kwargs):
+    """Hook de respuesta de requests: cuenta cada petición HTTP real y sus bytes."""
+    reg = getattr(_tele_local, "actual", None)
+    if reg is None: return
+    body = getattr(resp.request, "body", None) or b""
+    reg["http"] += 1
+    reg["bytes_out"] += len(body)
+    reg["bytes_in"] += len(resp.content or b"")
+
+# ═══════════════════════════════════════════════════════════════════════════
+# CLIENTE DE GOOGLE SHEETS (CUOTA, REINTENTOS, LECTURAS COMPARTIDAS)
+# ═══════════════════════════════════════════════════════════════════════════
+
+# Métodos de gspread que sólo leen: consumen cuota de lectura y se pueden compartir
+LECTURAS = {"get_all_values", "get_all_records", "col_values", "get", "batch_get", "values_batch_get", "worksheets", "worksheet", "cell", "get_lastUpdateTime"}
+# Escrituras que no se pueden repetir sin riesgo de duplicar si Sheets ya las aplicó
+NO_IDEMPOTENTES = {"append_row", "append_rows", "add_worksheet"}
+# Ídem a nivel libro: un batchUpdate puede llevar appendCells/deleteDimension
+NO_IDEMPOTENTES_LIBRO = {"batch_update"}
+
+class _TokenBucket:
+    """Cubeta de fichas: ráfagas de hasta `por_minuto` llamadas y después una cada 60/por_minuto s."""
+
+    def __init__(self, por_minuto: int):
+        self.capacidad = float(por_minuto)
+        self.fichas = float(por_minuto)
+        self.ritmo = por_minuto / 60.0
+        self.t = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        while True:
+            with self.lock:
+                ahora = time.monotonic()
+                self.fichas = min(self.capacidad, self.fichas + (ahora - self.t) * self.ritmo)
+                self.t = ahora
+                if self.fichas >= 1:
+                    self.fichas -= 1
+                    return
+                espera = (1 - self.fichas) / self.ritmo
+            time.sleep(espera)
+
+
+def _api_status(e: Exception) -> int | None:
+    if not isinstance(e, gspread.exceptions.APIError): return None
+    code = getattr(e, "code", -1)
+    return code if isinstance(code, int) and code > 0 else getattr(getattr(e, "response", None), "status_code", None)
+
+
+class SheetsClient:
+    """
+    Única puerta hacia gspread. Cada llamada toma una ficha de la cubeta de
+    lectura o de escritura, se reintenta ante 429 y 5xx con espera
+    exponencial con jitter (los 5xx sólo si la llamada es idempotente) y, si
+    es una lectura idéntica a otra que ya está en vuelo, espera el resultado
+    de ésa en lugar de repetir la petición. Los handles de worksheet se
+    guardan para no pedir los metadatos de la hoja en cada operación.
+    """
+
+    def __init__(self, spreadsheet):
+        self.raw = spreadsheet
+        self.spreadsheet = _Proxy(self, spreadsheet, "*")
+        self.cubetas = {"lectura": _TokenBucket(SHEETS_LECTURAS_MIN), "escritura": _TokenBucket(SHEETS_ESCRITURAS_MIN)}
+        self.lock = threading.Lock()
+        self.en_vuelo: dict[tuple, Future] = {}
+        self.hojas: dict[str, _Proxy] = {}
+        session = getattr(getattr(spreadsheet, "client", None), "session", None)
+        if session is not None: session.hooks.setdefault("response", []).append(_tele_http)
+
+    def worksheet(self, name: str) -> _Proxy:
+        ws = self.hojas.get(name)
+        if ws is None:
+            ws = self.hojas[name] = _Proxy(self, self.call("*", "worksheet", self.raw.worksheet, name), name)
+        return ws
+
+    def forget(self, name: str | None = None):
+        """Descarta handles (todos o uno) tras crear/borrar hojas o un WorksheetNotFound."""
+        with self.lock:
+            if name is None: self.hojas.clear()
+            else: self.hojas.pop(name, None)
+
+    def call(self, hoja: str, metodo: str, fn, *args, **kwargs):
+        if metodo not in LECTURAS:
+            repetible = metodo not in NO_IDEMPOTENTES and not (hoja == "*" and metodo in NO_IDEMPOTENTES_LIBRO)
+            return self._retry(metodo, repetible, fn, *args, **kwargs)
+        clave = (hoja, metodo, repr(args), repr(sorted(kwargs.items())))
+        with self.lock:
+            fut = self.en_vuelo.get(clave)
+            propio = fut is None
+            if propio: fut = self.en_vuelo[clave] = Future()
+        if not propio: return fut.result()
+        try:
+            fut.set_result(self._retry(metodo, True, fn, *args, **kwargs))
+        except Exception as e:
+            fut.set_exception(e)
+        finally:
+            with self.lock: self.en_vuelo.pop(clave, None)
+        return fut.result()
+
+    def _retry(self, metodo: str, repetible: bool, fn, *args, **kwargs):
+        cubeta = self.cubetas["lectura" if metodo in LECTURAS else "escritura"]
+        hoja = getattr(getattr(fn, "__self__", None), "title", "*")
+        with _medicion(f"({metodo})") as reg:
+            t0, espera = time.perf_counter(), 0.0
+            for intento in range(SHEETS_REINTENTOS + 1):
+                t_espera = time.perf_counter()
+                cubeta.take()
+                espera += time.perf_counter() - t_espera
+                try:
+                    res = fn(*args, **kwargs)
+                    _tele_llamada(reg, hoja, metodo, time.perf_counter() - t0 - espera, espera, intento)
+                    return res
+                except gspread.exceptions.APIError as e:
+                    status = _api_status(e)
+                    transitorio = status == 429 or (status is not None and status >= 500 and repetible)
+                    if not transitorio or intento == SHEETS_REINTENTOS:
+                        _tele_llamada(reg, hoja, metodo, time.perf_counter() - t0 - espera, espera, intento)
+                        raise
+                    t_espera = time.perf_counter()
+                    time.sleep(random.uniform(0, min(SHEETS_ESPERA_MAX, SHEETS_ESPERA_BASE * 2 ** intento)))
+                    espera += time.perf_counter() - t_espera
+
+
+class _Proxy:
+    """Envuelve un Spreadsheet/Worksheet de gspread: sus métodos pasan por SheetsClient.call."""
+
+    def __init__(self, client: SheetsClient, obj, hoja: str):
+        self._client, self._obj, self._hoja = client, obj, hoja
+
+    def __getattr__(self, attr):
+        val = getattr(self._obj, attr)
+        if not callable(val): return val
+        def llamada(*args, **kwargs):
+            try:
+                res = self._client.call(self._hoja, attr, val, *args, **kwargs)
+            except gspread.exceptions.WorksheetNotFound:
+                self._client.forget()
+                raise
+            if attr in ("add_worksheet", "del_worksheet"): self._client.forget()
+            return res
+        return llamada
+
+
+@st.cache_resource
+def _client() -> SheetsClient:
+    return SheetsClient(_connect_gsheets())
+
 # ═══════════════════════════════════════════════════════════════════════════
 # CONEXIÓN Y DATOS
 # ═══════════════════════════════════════════════════════════════════════════
@@ -183,196 +500,1856 @@ def _connect_gsheets():
     return gspread.authorize(creds).open("Inventario_Cristales")
 
 def _sheet(name: str):
-    return _connect_gsheets().worksheet(name)
+    return _client().worksheet(name)
 
-def _load_df(sheet_name: str) -> pd.DataFrame:
-    ws = _sheet(sheet_name)
-    records = ws.get_all_records()
-    df = pd.DataFrame(records)
+def _headers(sheet_name: str) -> list[str]:
+    if sheet_name.startswith("Movimientos"): return ENCABEZADOS["Movimientos"]  # incluye particiones Movimientos_AAAA_MM
+    return ENCABEZADOS.get(sheet_name, ENCABEZADOS_INVENTARIO)
+
+def _row_runs(rows) -> list[tuple[int, int]]:
+    """Agrupa filas en tramos contiguos [(inicio, fin)] ordenados de arriba hacia abajo."""
+    runs = []
+    for r in sorted(set(rows)):
+        if runs and r == runs[-1][1] + 1: runs[-1] = (runs[-1][0], r)
+        else: runs.append((r, r))
+    return runs
+
+def _normalize_df(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return df
-    if "CLAVE" in df.columns: df["CLAVE"] = df["CLAVE"].apply(_clean)
-    if "RACK" in df.columns: df["RACK"] = df["RACK"].apply(_normalize_rack)
+    if "CLAVE" in df.columns: df["CLAVE"] = _clean_series(df["CLAVE"])
+    if "RACK" in df.columns: df["RACK"] = _normalize_rack_series(df["RACK"])
     if "NOMBRE" in df.columns: df["NOMBRE"] = df["NOMBRE"].astype(str)
     if "CANTIDAD" in df.columns: df["CANTIDAD"] = pd.to_numeric(df["CANTIDAD"], errors="coerce").fillna(0).astype(int)
+    if "ID" in df.columns: df["ID"] = df["ID"].astype(str)
+    return _compactar(df)
+
+# ── Modelo compacto en memoria ───────────────────────────────────────────
+# Los frames de la caché se guardan con tipos compactos: las columnas de
+# pocos valores distintos como categorías (con categorías ordenadas, así
+# ordenar o agrupar da lo mismo que con texto), CANTIDAD como int32 y FECHA
+# como datetime si toda la columna viene en FORMATO_FECHA (si no, se deja
+# como texto para no perder lo capturado a mano). _a_valores hace el camino
+# inverso para escribir un frame de vuelta al almacenamiento.
+
+CATEGORICAS = ("NOMBRE", "RACK", "TIPO", "SUCURSAL")
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+
+def _compactar(df: pd.DataFrame) -> pd.DataFrame:
+    """Convierte en su lugar las columnas que aún no están en su tipo compacto."""
+    for c in CATEGORICAS:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype): df[c] = df[c].astype(str).astype("category")
+    if "CANTIDAD" in df.columns and df["CANTIDAD"].dtype != "int32": df["CANTIDAD"] = df["CANTIDAD"].astype("int32")
+    if "FECHA" in df.columns and not pd.api.types.is_datetime64_any_dtype(df["FECHA"]):
+        texto = df["FECHA"].astype(str)
+        fechas = pd.to_datetime(texto, format=FORMATO_FECHA, errors="coerce")
+        if (fechas.notna() | texto.eq("")).all(): df["FECHA"] = fechas
     return df
 
+def _concat_compacto(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+    """pd.concat que conserva las categorías (unión ordenada) en lugar de degradar la columna a texto."""
+    if b.empty: return a
+    if a.empty: return _compactar(b.reset_index(drop=True))
+    a, b = a.copy(deep=False), b.copy(deep=False)
+    for c in CATEGORICAS:
+        if c in a.columns and c in b.columns and not a[c].cat.categories.equals(b[c].cat.categories):
+            categorias = a[c].cat.categories.union(b[c].cat.categories)
+            a[c], b[c] = a[c].cat.set_categories(categorias), b[c].cat.set_categories(categorias)
+    return _compactar(pd.concat([a, b], ignore_index=True))
+
+def _valor_compacto(df: pd.DataFrame, col: str, val):
+    """Valor de una celda escrita, en el tipo de su columna; agrega la categoría si es nueva."""
+    if col == "CANTIDAD": return _to_int(val)
+    if isinstance(df[col].dtype, pd.CategoricalDtype):
+        val = str(val)
+        if val not in df[col].cat.categories: df[col] = df[col].cat.set_categories(df[col].cat.categories.union([val]))
+        return val
+    if pd.api.types.is_datetime64_any_dtype(df[col]): return pd.to_datetime(val, format=FORMATO_FECHA) if val != "" else pd.NaT
+    return val
+
+def _memoria_frame(df: pd.DataFrame) -> tuple[int, int]:
+    """(bytes del frame compacto, bytes con la representación anterior: texto, CANTIDAD int64 y FECHA como texto)."""
+    previo = df.copy(deep=False)
+    for c in df.columns:
+        if isinstance(df[c].dtype, pd.CategoricalDtype): previo[c] = df[c].astype(str)
+        elif pd.api.types.is_datetime64_any_dtype(df[c]): previo[c] = df[c].dt.strftime(FORMATO_FECHA).fillna("")
+    if "CANTIDAD" in previo.columns: previo["CANTIDAD"] = previo["CANTIDAD"].astype("int64")
+    return int(df.memory_usage(deep=True).sum()), int(previo.memory_usage(deep=True).sum())
+
+def _a_valores(df: pd.DataFrame) -> list[list]:
+    """Filas del frame como valores de celda (texto y números, FECHA en FORMATO_FECHA y vacíos como "")."""
+    out = df.astype(object)
+    for c in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[c]): out[c] = df[c].dt.strftime(FORMATO_FECHA).astype(object)
+    return out.where(out.notna(), "").values.tolist()
+
+def _values_to_df(values: list[list]) -> pd.DataFrame:
+    """Encabezado + filas crudas → DataFrame normalizado, con la misma conversión numérica que get_all_records."""
+    if not values: return pd.DataFrame()
+    head = [str(h) for h in values[0]]
+    rows = [numericise_all((list(r) + [""] * len(head))[:len(head)]) for r in values[1:]]
+    return _normalize_df(pd.DataFrame(rows, columns=head))
+
+def _load_df(sheet_name: str) -> pd.DataFrame:
+    return _backend().load_table(sheet_name)
+
+def _load_many(sheet_names: list[str]) -> dict[str, pd.DataFrame]:
+    return _backend().load_tables(sheet_names)
+
+# ── Caché compartida entre sesiones ──────────────────────────────────────
+# Un solo juego de DataFrames por proceso: todas las sesiones leen los mismos
+# frames (solo lectura) y cada escritura publica un frame nuevo con una
+# versión mayor, de modo que las demás sesiones lo ven en su siguiente rerun.
+
+@st.cache_resource
+def _shared_cache() -> dict:
+    return {"lock": threading.RLock(), "hojas": {}, "seq": 0}
+
+def _cache_entry(sheet_name: str) -> dict | None:
+    """
+    Entrada de la caché o None si la hoja no está. Pasados RECONCILIACION_SEG
+    desde su última validación se sigue sirviendo (stale-while-revalidate) y
+    se lanza la revalidación en segundo plano.
+    """
+    e = _shared_cache()["hojas"].get(sheet_name)
+    if e is None: return None
+    if time.time() - e["cargado"] > RECONCILIACION_SEG: _revalidar_en_fondo()
+    e["acceso"] = time.time()
+    return e
+
+def _cache_put(sheet_name: str, df: pd.DataFrame, recargado: bool = True, revision: str | None = None, descargado: float | None = None) -> dict:
+    """
+    Publica un frame nuevo para la hoja. `recargado=False` indica un parche
+    local (delta): conserva la hora de carga, la revisión y el índice de la
+    entrada previa. `revision` es la revisión del almacenamiento con la que
+    se leyó el frame y `descargado` la hora de la descarga (por omisión, ahora).
+    """
+    cache = _shared_cache()
+    with cache["lock"]:
+        prev = cache["hojas"].get(sheet_name)
+        cache["seq"] += 1
+        parche = not recargado and prev is not None
+        e = {
+            "df": df,
+            "version": cache["seq"],
+            # cargado: última vez que se confirmó vigente (descarga o revalidación)
+            "cargado": prev["cargado"] if parche else time.time(),
+            "descargado": prev["descargado"] if parche else descargado or time.time(),
+            "revision": prev["revision"] if parche else revision,
+            "acceso": time.time(),
+            "bytes": int(prev["bytes"] * len(df) / max(len(prev["df"]), 1)) if parche else int(df.memory_usage(deep=True).sum()),
+            "idx": prev["idx"] if parche else None,
+            "busq": None,
+            "derivados": {},
+            # El índice de claves se revalida contra las claves con stock de cada versión
+            "kidx": prev["kidx"] if prev else None,
+        }
+        cache["hojas"][sheet_name] = e
+        _cache_evict(keep=sheet_name)
+    return e
+
+def _cache_drop(sheet_name: str):
+    cache = _shared_cache()
+    with cache["lock"]: cache["hojas"].pop(sheet_name, None)
+
+def _cache_evict(keep: str):
+    """Libera las hojas usadas hace más tiempo mientras se exceda CACHE_MAX_MB."""
+    hojas = _shared_cache()["hojas"]
+    total = sum(e["bytes"] for e in hojas.values())
+    for name, e in sorted(hojas.items(), key=lambda kv: kv[1]["acceso"]):
+        if total <= CACHE_MAX_MB * 1024 * 1024: break
+        if name == keep: continue
+        total -= e["bytes"]
+        del hojas[name]
+
+def _data_version(sheet_name: str) -> int:
+    e = _cache_entry(sheet_name)
+    return e["version"] if e else 0
+
+# ── Instantáneas locales (arranque en frío) ──────────────────────────────
+# Con Google Sheets como almacenamiento, cada carga completa de una hoja de
+# INSTANTANEAS se guarda en SNAPSHOT_DIR como Parquet (tipos ya normalizados)
+# con un JSON de control. Una hoja que no está en la caché (proceso recién
+# iniciado) se publica desde su instantánea de inmediato y un hilo la
+# revalida (_revalidar): si el libro no cambió desde que se guardó no se
+# descarga nada, la bitácora lee sólo sus filas nuevas y las demás hojas
+# sólo se descargan si su centinela no cuadra, sin hacer esperar a nadie.
+
+def _instantaneas_activas() -> bool:
+    return STORAGE_BACKEND == "sheets" and bool(SNAPSHOT_DIR)
+
+@st.cache_resource
+def _instantaneas() -> dict:
+    return {"pool": ThreadPoolExecutor(max_workers=1), "sincronizando": set(), "hilo": None, "errores": deque(maxlen=20)}
+
+def _instantanea_guardar(name: str, df: pd.DataFrame, revision: str | None):
+    """Escribe la instantánea de la hoja en segundo plano; un fallo sólo se anota en el diagnóstico."""
+    if not _instantaneas_activas() or name not in INSTANTANEAS: return
+    descargado = time.time()
+    def run():
+        try:
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            base = os.path.join(SNAPSHOT_DIR, name)
+            # Columnas con números y texto mezclados (numericise): se guardan como texto y se reconvierten al leer
+            mixtas = [c for c in df.columns if df[c].dtype == object]
+            df.astype({c: str for c in mixtas}).to_parquet(base + ".parquet.tmp", index=False)
+            with open(base + ".json.tmp", "w") as f:
+                json.dump({"version": SNAPSHOT_VERSION, "filas": len(df), "columnas": list(df.columns), "mixtas": mixtas,
+                           "revision": revision, "descargado": descargado, "guardado": datetime.now().isoformat(timespec="seconds")}, f)
+            os.replace(base + ".parquet.tmp", base + ".parquet")
+            os.replace(base + ".json.tmp", base + ".json")
+        except Exception as e:
+            _instantaneas()["errores"].append(f"{datetime.now():%Y-%m-%d %H:%M:%S} guardar {name}: {e}")
+    _instantaneas()["pool"].submit(run)
+
+def _instantanea_cargar(name: str) -> tuple[pd.DataFrame, dict] | None:
+    """(frame, control) de la instantánea o None si no hay, es de otra versión o no cuadra con su control."""
+    base = os.path.join(SNAPSHOT_DIR, name)
+    try:
+        with open(base + ".json") as f: meta = json.load(f)
+        if meta.get("version") != SNAPSHOT_VERSION: return None
+        df = pd.read_parquet(base + ".parquet")
+    except Exception:
+        return None  # sin instantánea, ilegible o sin pyarrow: carga normal desde Sheets
+    if len(df) != meta["filas"] or list(df.columns) != meta["columnas"]: return None
+    for c in meta["mixtas"]: df[c] = pd.Series(numericise_all(df[c].tolist()), index=df.index, dtype=object)
+    return df, meta
+
+def _publicar_carga(name: str, df: pd.DataFrame, revision: str | None = None) -> dict:
+    """Publica una carga completa en la caché y renueva su instantánea."""
+    e = _cache_put(name, df, revision=revision)
+    _instantanea_guardar(name, df, revision)
+    return e
+
+def _cola_nueva(name: str, df: pd.DataFrame) -> pd.DataFrame | None:
+    """
+    Hoja de sólo anexar al día leyendo desde su última fila conocida, que
+    sirve de centinela: si ya no coincide (p. ej. el archivo movió filas a
+    una partición) retorna None y la hoja se recarga completa.
+    """
+    n = len(df)
+    cola = _backend().read_tail(name, n + 1 if n else 2)
+    if n:
+        if cola.empty or list(cola.columns) != list(df.columns) or [str(v) for v in cola.iloc[0]] != [str(v) for v in df.iloc[-1]]: return None
+        cola = cola.iloc[1:]
+    return df if cola.empty else _concat_compacto(df, cola)
+
+def _desde_instantaneas(nombres: list[str]) -> list[str]:
+    """Publica las instantáneas de las hojas que no están en memoria y lanza su revalidación; retorna las publicadas."""
+    if not _instantaneas_activas(): return []
+    hojas, publicadas = _shared_cache()["hojas"], []
+    for name in nombres:
+        if name not in INSTANTANEAS or name in hojas: continue
+        copia = _instantanea_cargar(name)
+        if copia is None: continue
+        df, meta = copia
+        _cache_put(name, df, revision=meta.get("revision"), descargado=meta.get("descargado", 0.0))
+        publicadas.append(name)
+    if publicadas:
+        estado = _instantaneas()
+        estado["sincronizando"].update(publicadas)
+        def run():
+            try:
+                _revalidar(publicadas)
+            except Exception as ex:
+                estado["errores"].append(f"{datetime.now():%Y-%m-%d %H:%M:%S} sincronizar {', '.join(publicadas)}: {ex}")
+            finally:
+                estado["sincronizando"].difference_update(publicadas)
+        estado["hilo"] = threading.Thread(target=run, daemon=True)
+        estado["hilo"].start()
+    return publicadas
+
+# ── Revalidación barata (revisión del libro + centinela por hoja) ────────
+# Antes de descargar una hoja completa se pregunta si cambió: primero la
+# revisión de todo el almacenamiento (una llamada de metadatos); si cambió,
+# el centinela de cada hoja (filas, primeras CENTINELA_FILAS, última fila y
+# columna CANTIDAD), todas en una sola lectura, contra el frame en memoria.
+# Las escrituras de este proceso ya parcharon la caché, así que su centinela
+# cuadra y no provocan descargas.
+
+@st.cache_resource
+def _revalidacion() -> dict:
+    return {"lock": threading.Lock(), "ultimo_intento": 0.0, "errores": deque(maxlen=20)}
+
+def _huella_partes(filas: int, cabeza: pd.DataFrame, ultima: pd.DataFrame, cantidades: pd.Series | None) -> str:
+    # 5.0 y 5 valen lo mismo: la inferencia de tipos de pandas depende de cuántas filas se leyeron
+    txt = lambda v: "" if v is pd.NaT else str(int(v)) if isinstance(v, float) and v.is_integer() else str(v)
+    campo, registro = "\x1f", "\x1e"
+    renglones = [campo.join(map(str, cabeza.columns))]
+    renglones += [campo.join(map(txt, r)) for t in (cabeza, ultima) for r in t.itertuples(index=False)]
+    if cantidades is not None: renglones.append(campo.join(map(txt, cantidades.tolist())))
+    return f"{filas}:{zlib.crc32(registro.join(renglones).encode()):08x}"
+
+def _huella(df: pd.DataFrame) -> str:
+    """Centinela de un frame: número de filas + checksum de las primeras filas, la última y la columna CANTIDAD."""
+    return _huella_partes(len(df), df.head(CENTINELA_FILAS), df.tail(1), df["CANTIDAD"] if "CANTIDAD" in df.columns else None)
+
+def _publicar_si(name: str, df: pd.DataFrame, version: int | None, revision: str | None):
+    """
+    Publica una lectura hecha sobre la versión `version` de la hoja. Si una
+    escritura la parchó entretanto, la lectura pudo ser anterior a esa
+    escritura: la entrada se descarta y la siguiente consulta la recarga.
+    """
+    cache = _shared_cache()
+    with cache["lock"]:
+        e = cache["hojas"].get(name)
+        if e is None or e["version"] == version: _publicar_carga(name, df, revision)
+        elif version is not None: _cache_drop(name)
+
+@_medido("revalidación")
+def _revalidar(nombres: list[str]) -> list[str]:
+    """
+    Pone al día las hojas descargando sólo lo que cambió. Una hoja leída o
+    validada con la revisión vigente del libro no cambió; la bitácora (sólo
+    anexar) se lee desde su última fila conocida; las demás comparan su
+    centinela y sólo las que no cuadran se descargan completas. Pasado
+    RECONCILIACION_MAX_SEG desde la última descarga, la hoja se descarga
+    igual. Retorna las hojas que cambiaron.
+    """
+    backend, cache, ahora = _backend(), _shared_cache(), time.time()
+    revision = backend.revision()  # antes de leer: lo que cambie después se verá en la siguiente revisión
+    with cache["lock"]: vistas = {n: cache["hojas"][n] for n in nombres if n in cache["hojas"]}
+    vigentes, completas, por_centinela, nuevas = [], [n for n in nombres if n not in vistas], {}, {}
+    for n, e in vistas.items():
+        if ahora - e["descargado"] > RECONCILIACION_MAX_SEG: completas.append(n)
+        elif revision is not None and e["revision"] == revision: vigentes.append(n)
+        elif n in SOLO_ANEXAR:
+            df = _cola_nueva(n, e["df"])
+            if df is None: completas.append(n)
+            elif len(df) == len(e["df"]): vigentes.append(n)
+            else: nuevas[n] = df
+        else: por_centinela[n] = e
+    if por_centinela:
+        remotas = backend.huellas({n: len(e["df"]) for n, e in por_centinela.items()})
+        for n, e in por_centinela.items(): (vigentes if remotas.get(n) == _huella(e["df"]) else completas).append(n)
+    if completas: nuevas |= _load_many(completas)
+    with cache["lock"]:
+        for n in vigentes:
+            vistas[n]["cargado"], vistas[n]["revision"] = ahora, revision
+        for n, df in nuevas.items(): _publicar_si(n, df, vistas[n]["version"] if n in vistas else None, revision)
+    # Fuera del candado de la caché: la migración toma el de la hoja (mismo orden que las operaciones)
+    if "Traslados_Pendientes" in nuevas: _migrar_ids_traslados()
+    return list(nuevas)
+
+def _revalidar_en_fondo():
+    """Revalida en un hilo las hojas vencidas; una a la vez y, tras un fallo, no antes de REVALIDACION_REINTENTO_SEG."""
+    estado = _revalidacion()
+    if time.time() - estado["ultimo_intento"] < REVALIDACION_REINTENTO_SEG or not estado["lock"].acquire(blocking=False): return
+    estado["ultimo_intento"] = time.time()
+    vencidas = [n for n, e in list(_shared_cache()["hojas"].items()) if time.time() - e["cargado"] > RECONCILIACION_SEG]
+    def run():
+        try:
+            _revalidar(vencidas)
+            estado["ultimo_intento"] = 0.0
+        except Exception as ex:
+            estado["errores"].append(f"{datetime.now():%Y-%m-%d %H:%M:%S} revalidar {', '.join(vencidas)}: {ex}")
+        finally:
+            estado["lock"].release()
+    threading.Thread(target=run, daemon=True).start()
+
 def _init_session():
-    if not st.session_state.get("_data_loaded", False):
+    sheets = list(SUCURSALES.keys()) + ["Movimientos", "Traslados_Pendientes"]
+    faltantes = [name for name in sheets if _cache_entry(name) is None]
+    if faltantes:
         with st.spinner("⏳ Sincronizando inventario…"):
             try:
-                sheets = list(SUCURSALES.keys()) + ["Movimientos", "Traslados_Pendientes"]
-                for name in sheets: st.session_state[f"df_{name}"] = _load_df(name)
-                st.session_state["_data_loaded"] = True
+                t0 = time.perf_counter()
+                with _medicion("carga_inicial"):
+                    desde_copia = _desde_instantaneas(faltantes)
+                    if len(desde_copia) < len(faltantes):
+                        for name, df in _load_many([n for n in faltantes if n not in desde_copia]).items(): _publicar_carga(name, df)
+                if "Traslados_Pendientes" in faltantes: _migrar_ids_traslados()
+                st.session_state["_load_info"] = (time.perf_counter() - t0, len(faltantes))
             except Exception as e:
                 st.error(f"⚠️ Error de conexión con Google Sheets: {e}")
                 st.stop()
-
-def _refresh(sheet_name: str):
-    st.session_state[f"df_{sheet_name}"] = _load_df(sheet_name)
+    # Reintento periódico de la bitácora que quedó en el spool (cuota, reinicio)
+    if time.time() - _spool()["ultimo_intento"] > MOV_REINTENTO_SEG and _spool_pendientes():
+        _flush_movements()
+    _backend().replicar_espejo()
+    _archivar_si_toca()
+
+def _refresh(sheet_name: str) -> dict:
+    e = _publicar_carga(sheet_name, _load_df(sheet_name))
+    # Cada carga completa de los traslados asigna ID a las filas que llegaron sin él
+    return (_migrar_ids_traslados() or e) if sheet_name == "Traslados_Pendientes" else e
+
+def _apply_delta(delta: dict):
+    """
+    Aplica un delta de escritura sobre el frame compartido de la hoja (y sobre
+    su índice) sin volver a descargarla. Se parchea una copia superficial
+    porque otras sesiones pueden estar leyendo el frame anterior: con
+    copy-on-write sólo se duplican las columnas que el delta modifica. Si
+    el delta no cuadra con las filas en memoria la entrada se descarta para
+    recargarla.
+    """
+    sheet_name = delta["sheet"]
+    with _shared_cache()["lock"]:
+        e = _cache_entry(sheet_name)
+        if e is None: return
+        df = e["df"].copy(deep=False)
+        try:
+            for row, valores in delta["updated"].items():
+                for col, val in valores.items():
+                    if col not in df.columns: continue
+                    if not 0 <= row - 2 < len(df): raise KeyError(row)
+                    df.at[row - 2, col] = _valor_compacto(df, col, val)
+                    if col == "CANTIDAD": _index_set(sheet_name, row, val)
+            if delta["appended"]:
+                cols = list(df.columns) if len(df.columns) else _headers(sheet_name)
+                nuevas = [(list(r) + [""] * len(cols))[:len(cols)] for r in delta["appended"]]
+                df = _concat_compacto(df, _normalize_df(pd.DataFrame(nuevas, columns=cols)))
+                if sheet_name in SUCURSALES or sheet_name in LLAVES_INDICE: _index_append(sheet_name, delta["appended"])
+            if delta["deleted"]:
+                df = df.drop(index=[r - 2 for r in delta["deleted"]]).reset_index(drop=True)
+                _index_delete(sheet_name, delta["deleted"])
+            nueva = _cache_put(sheet_name, df, recargado=False)
+            if sheet_name in SUCURSALES: _red_delta(sheet_name, e["df"], e["version"], delta, nueva["version"])
+        except (KeyError, ValueError):
+            _cache_drop(sheet_name)
+
+@_medido("reconciliación")
+def _reconcile():
+    """Reconciliación bajo demanda: revalida todas las hojas y descarga sólo las que cambiaron."""
+    t0 = time.perf_counter()
+    sheets = list(SUCURSALES.keys()) + ["Movimientos", "Traslados_Pendientes"]
+    cambiadas = _revalidar(sheets)
+    _migrar_ids_traslados()
+    st.session_state["_load_info"] = (time.perf_counter() - t0, len(cambiadas))
 
 def _get_df(sheet_name: str) -> pd.DataFrame:
-    key = f"df_{sheet_name}"
-    if key not in st.session_state: _refresh(sheet_name)
-    return st.session_state.get(key, pd.DataFrame())
+    e = _cache_entry(sheet_name) or _refresh(sheet_name)
+    return e["df"]
+
+BUSQ_MEMO = 32  # filtros recientes recordados por versión de datos
+DERIVADOS_MEMO = 64  # datos derivados (stock, KPIs, racks por clave) recordados por versión de datos
+
+def _derivado(sheet_name: str, llave, fn):
+    """
+    fn(frame vigente), calculado una vez por versión de datos y compartido
+    entre sesiones: un rerun que no cambió los datos no lo recalcula. El
+    resultado es de solo lectura, como el frame.
+    """
+    e = _cache_entry(sheet_name) or _refresh(sheet_name)
+    memo = e["derivados"]
+    if llave not in memo:
+        if len(memo) >= DERIVADOS_MEMO: memo.pop(next(iter(memo)))
+        memo[llave] = fn(e["df"])
+    return memo[llave]
 
 def _get_df_stock(sheet_name: str) -> pd.DataFrame:
-    df = _get_df(sheet_name)
-    if df.empty or "CANTIDAD" not in df.columns: return df
-    return df[df["CANTIDAD"] > 0].copy()
+    return _derivado(sheet_name, "stock", lambda df: df if df.empty or "CANTIDAD" not in df.columns else df[df["CANTIDAD"] > 0])
+
+def _racks_clave(sheet_name: str, clave: str) -> dict:
+    """Filas con stock de una clave (de mayor a menor existencia), su nombre y las etiquetas del selector de rack."""
+    def calc(df: pd.DataFrame) -> dict:
+        filas = df[(df["CLAVE"] == clave) & (df["CANTIDAD"] > 0)]
+        nombre = filas["NOMBRE"].iloc[0] if len(filas) else ""
+        # ── MEJORA 1a: ordenar de mayor a menor stock para priorizar filas con existencia ──
+        filas = filas.sort_values(by="CANTIDAD", ascending=False)
+        etiquetas = (filas["RACK"].astype(str) + " (" + filas["CANTIDAD"].astype(str) + " pz disponible)").tolist()
+        return {"filas": filas, "nombre": nombre, "etiquetas": etiquetas}
+    return _derivado(sheet_name, ("racks", clave), calc)
+
+def _build_search(df: pd.DataFrame) -> dict:
+    """
+    Estructura de búsqueda del Panel de Control: una llave de texto por fila
+    (todas las columnas en mayúsculas, separadas por un carácter que no se
+    teclea) y las máscaras de categoría de las pestañas.
+    """
+    texto = pd.Series("", index=df.index, dtype="str")
+    for i, c in enumerate(df.columns):
+        texto = texto + ("\x1f" if i else "") + df[c].astype(str).str.upper()
+    nombre = df["NOMBRE"] if "NOMBRE" in df.columns else pd.Series("", index=df.index)
+    pb = nombre.str.contains("Parabrisas", case=False, na=False).to_numpy()
+    med = nombre.str.contains("Medallón", case=False, na=False).to_numpy()
+    return {"texto": texto, "pb": pb, "med": med, "otros": ~(pb | med), "memo": {}}
+
+def _get_search(sheet_name: str) -> tuple[pd.DataFrame, dict]:
+    """Frame vigente y su estructura de búsqueda; se construye una vez por versión y la comparten todas las sesiones."""
+    e = _cache_entry(sheet_name) or _refresh(sheet_name)
+    if e["busq"] is None: e["busq"] = _build_search(e["df"])
+    return e["df"], e["busq"]
+
+def _search_mask(busq: dict, filtro: str):
+    """Máscara (np.ndarray de bool) de las filas que contienen `filtro`, literal y sin distinguir mayúsculas."""
+    filtro = filtro.upper()
+    if filtro not in busq["memo"]:
+        if len(busq["memo"]) >= BUSQ_MEMO: busq["memo"].pop(next(iter(busq["memo"])))
+        busq["memo"][filtro] = busq["texto"].str.contains(filtro, regex=False, na=False).to_numpy()
+    return busq["memo"][filtro]
+
+SUGERENCIAS_TYPO = 10     # claves "¿quisiste decir?" cuando casi no hay coincidencias
+LIMITE_COINCIDENCIAS = 100
+
+def _grams(texto: str, n: int) -> set[str]:
+    return {texto[i:i + n] for i in range(len(texto) - n + 1)}
+
+def _rank_sub(clave: str, t: str) -> tuple:
+    # Exacta, luego prefijos cortos, luego la coincidencia más a la izquierda
+    return (clave.index(t), len(clave), clave)
+
+def _kidx_add(kidx: dict, c: str):
+    bisect.insort(kidx["claves"], c)
+    derechas, reversas = kidx["por_largo"].setdefault(len(c), ([], []))
+    bisect.insort(derechas, c)
+    bisect.insort(reversas, c[::-1])
+    for g in _grams(c, 1) | _grams(c, 2) | _grams(c, 3):
+        lista = kidx["ranking"].setdefault(g, [])
+        lista.insert(bisect.bisect_left(lista, _rank_sub(c, g), key=lambda x: _rank_sub(x, g)), c)
+
+def _kidx_remove(kidx: dict, c: str):
+    kidx["claves"].pop(bisect.bisect_left(kidx["claves"], c))
+    derechas, reversas = kidx["por_largo"][len(c)]
+    derechas.pop(bisect.bisect_left(derechas, c))
+    reversas.pop(bisect.bisect_left(reversas, c[::-1]))
+    for g in _grams(c, 1) | _grams(c, 2) | _grams(c, 3):
+        lista = kidx["ranking"][g]
+        del lista[bisect.bisect_left(lista, _rank_sub(c, g), key=lambda x: _rank_sub(x, g))]
+
+def _build_key_index(claves: list[str]) -> dict:
+    """
+    Índice de claves con stock: para cada n-grama de 1 a 3 caracteres sus
+    claves ya ordenadas por relevancia (una búsqueda corta es un corte de
+    lista; una larga se verifica sobre su trigrama más raro), más las claves
+    de cada longitud ordenadas al derecho y al revés para sugerir parecidos
+    por prefijo o sufijo.
+    """
+    ranking: dict[str, list[str]] = {}
+    por_largo: dict[int, tuple[list[str], list[str]]] = {}
+    for c in claves:
+        for g in _grams(c, 1) | _grams(c, 2) | _grams(c, 3): ranking.setdefault(g, []).append(c)
+        por_largo.setdefault(len(c), ([], []))[0].append(c)
+    for g, lista in ranking.items(): lista.sort(key=lambda x: _rank_sub(x, g))
+    for derechas, reversas in por_largo.values(): reversas.extend(sorted(c[::-1] for c in derechas))
+    return {"claves": list(claves), "ranking": ranking, "por_largo": por_largo, "version": None, "memo": {}}
+
+def _rango(ordenadas: list[str], prefijo: str) -> list[str]:
+    return ordenadas[bisect.bisect_left(ordenadas, prefijo):bisect.bisect_left(ordenadas, prefijo + "\uffff")]
+
+def _cuenta(ordenadas: list[str], prefijo: str) -> int:
+    return bisect.bisect_left(ordenadas, prefijo + "\uffff") - bisect.bisect_left(ordenadas, prefijo)
 
-def _search_keys(df: pd.DataFrame, term: str) -> list[str]:
-    if df.empty or "CLAVE" not in df.columns or not term: return []
+def _claves_stock(df: pd.DataFrame) -> list[str]:
+    pool = df.loc[df["CANTIDAD"] > 0, "CLAVE"] if {"CLAVE", "CANTIDAD"}.issubset(df.columns) else df.get("CLAVE", pd.Series([], dtype="str"))
+    return sorted(pool.astype(str).unique().tolist())
+
+@st.cache_resource
+def _indices_claves() -> dict:
+    return {"pool": ThreadPoolExecutor(max_workers=1), "lock": threading.Lock(), "pendientes": set()}
+
+def _key_index_en_fondo(sheet_name: str):
+    """
+    Construye el índice de claves de la hoja en un hilo y lo publica en su
+    entrada vigente (bajo el candado de la caché); mientras tanto
+    _search_keys busca directo sobre las claves con stock.
+    """
+    estado = _indices_claves()
+    with estado["lock"]:
+        if sheet_name in estado["pendientes"]: return
+        estado["pendientes"].add(sheet_name)
+    def run():
+        try:
+            e = _shared_cache()["hojas"].get(sheet_name)
+            if e is None or e["kidx"] is not None: return
+            kidx = _build_key_index(_claves_stock(e["df"]))
+            kidx["version"] = e["version"]
+            with _shared_cache()["lock"]:
+                # Si entre tanto se publicó otra versión, la siguiente consulta la parchea contra ésta
+                actual = _shared_cache()["hojas"].get(sheet_name)
+                if actual is not None and actual["kidx"] is None: actual["kidx"] = kidx
+        finally:
+            with estado["lock"]: estado["pendientes"].discard(sheet_name)
+    estado["pool"].submit(run)
+
+def _key_index(sheet_name: str, esperar: bool = False) -> dict | None:
+    """
+    Índice de claves con stock de la versión vigente. Se revalida con cada
+    versión pero sólo cambia si cambió el conjunto de claves con stock, y
+    entonces se parchea clave por clave (una alta o una venta que agota una
+    clave no reconstruye todo el índice); el parche y su versión se publican
+    juntos bajo el candado de la caché, igual que las búsquedas que lo leen.
+    La primera construcción (o una reconstrucción por un cambio grande) va
+    en segundo plano y retorna None hasta que esté lista, salvo con `esperar`.
+    """
+    e = _cache_entry(sheet_name) or _refresh(sheet_name)
+    kidx = e["kidx"]
+    if kidx is not None and kidx["version"] == e["version"]: return kidx
+    if kidx is None and not esperar:
+        _key_index_en_fondo(sheet_name)
+        return None
+    claves = _claves_stock(e["df"])
+    if kidx is None: kidx = _build_key_index(claves)
+    with _shared_cache()["lock"]:
+        if kidx["version"] != e["version"] and kidx["claves"] != claves:
+            actuales, nuevas = set(kidx["claves"]), set(claves)
+            if len(actuales ^ nuevas) > len(claves) // 10:
+                if not esperar:
+                    e["kidx"] = None
+                    _key_index_en_fondo(sheet_name)
+                    return None
+                kidx = _build_key_index(claves)
+            else:
+                for c in actuales - nuevas: _kidx_remove(kidx, c)
+                for c in nuevas - actuales: _kidx_add(kidx, c)
+                kidx["memo"].clear()
+        kidx["version"] = e["version"]
+        e["kidx"] = kidx
+    return kidx
+
+def _casi_igual(a: str, b: str) -> bool:
+    """Distancia de edición ≤ 1 (sustitución, inserción, borrado o transposición adyacente)."""
+    if abs(len(a) - len(b)) > 1 or a == b: return False
+    i = 0
+    while i < min(len(a), len(b)) and a[i] == b[i]: i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:] or (a[i + 2:] == b[i + 2:] and a[i:i + 2] == b[i:i + 2][::-1])
+    corta, larga = (a, b) if len(a) < len(b) else (b, a)
+    return corta[i:] == larga[i + 1:]
+
+def _search_keys(sheet_name: str, term: str) -> list[str]:
+    """
+    Claves con stock que contienen `term`, por relevancia: exacta, prefijos,
+    subcadenas (más a la izquierda primero) y, si casi no hay resultados,
+    claves a un error de dedo. Máximo LIMITE_COINCIDENCIAS. Los términos
+    recientes (BUSQ_MEMO) se recuerdan en el propio índice mientras no cambie
+    el conjunto de claves; el resultado es de solo lectura.
+    """
     t = _clean(term)
-    pool = df[df["CANTIDAD"] > 0] if "CANTIDAD" in df.columns else df
-    mask = pool["CLAVE"].str.contains(t, case=False, na=False)
-    return sorted(pool.loc[mask, "CLAVE"].unique().tolist())
+    if not t: return []
+    kidx = _key_index(sheet_name)
+    if kidx is None:
+        # Índice en construcción: recorrido directo de las claves con stock (sin sugerencias por error de dedo)
+        claves = _derivado(sheet_name, "claves_stock", _claves_stock)
+        return sorted((c for c in claves if t in c), key=lambda c: _rank_sub(c, t))[:LIMITE_COINCIDENCIAS]
+    with _shared_cache()["lock"]:
+        return _search_keys_idx(kidx, t)
+
+def _search_keys_idx(kidx: dict, t: str) -> list[str]:
+    memo = kidx["memo"]
+    if t in memo: return memo[t]
+    ranking = kidx["ranking"]
+    if len(t) <= 3:
+        res = ranking.get(t, [])[:LIMITE_COINCIDENCIAS]
+    else:
+        # Las claves que contienen t contienen todos sus trigramas: basta revisar las del más raro
+        raro = min((ranking.get(g, []) for g in _grams(t, 3)), key=len)
+        res = sorted((c for c in raro if t in c), key=lambda c: _rank_sub(c, t))[:LIMITE_COINCIDENCIAS]
+    if len(t) >= 3 and len(res) < SUGERENCIAS_TYPO:
+        # Una sola edición cambia la longitud a lo más en 1 y, para cualquier corte h, deja intacto t[:h] o la
+        # cola t[h + 1:]; se elige el corte con menos candidatas (conteo por bisect, sin recorrerlas)
+        largos = [kidx["por_largo"].get(n, ([], [])) for n in (len(t) - 1, len(t), len(t) + 1)]
+        h = min(range(1, len(t) - 1), key=lambda h: sum(_cuenta(d, t[:h]) + _cuenta(r, t[h + 1:][::-1]) for d, r in largos))
+        cerca = set()
+        for derechas, reversas in largos:
+            cerca.update(_rango(derechas, t[:h]), (r[::-1] for r in _rango(reversas, t[h + 1:][::-1])))
+        res += sorted(c for c in cerca - set(res) if _casi_igual(t, c))[:SUGERENCIAS_TYPO - len(res)]
+    if len(memo) >= BUSQ_MEMO: memo.pop(next(iter(memo), None), None)
+    memo[t] = res
+    return res
+
+# ── Existencias en la red (CLAVE × sucursal) ─────────────────────────────
+# Una columna por sucursal: CLAVE → {RACK: piezas}. Cada escritura la parcha
+# con su delta (sólo las claves tocadas); si el frame de la sucursal se
+# recargó, su columna se rearma desde él en la siguiente consulta.
+
+@st.cache_resource
+def _red() -> dict:
+    return {"lock": threading.Lock(), "suc": {}, "pivote": None}
+
+def _red_sucursal(df: pd.DataFrame) -> dict[str, dict[str, int]]:
+    """CLAVE → {RACK: piezas} de una sucursal (filas duplicadas sumadas)."""
+    if df.empty: return {}
+    g = df.groupby(["CLAVE", "RACK"], sort=False)["CANTIDAD"].sum()
+    out: dict[str, dict[str, int]] = {}
+    for (clave, rack), q in zip(g.index, g.tolist()): out.setdefault(clave, {})[rack] = q
+    return out
+
+def _red_columna(sheet_name: str) -> dict[str, dict[str, int]]:
+    e = _cache_entry(sheet_name) or _refresh(sheet_name)
+    red = _red()
+    with red["lock"]:
+        col = red["suc"].get(sheet_name)
+        if col is None or col["version"] != e["version"]:
+            col = red["suc"][sheet_name] = {"version": e["version"], "racks": _red_sucursal(e["df"])}
+            red["pivote"] = None
+        return col["racks"]
+
+def _red_delta(sheet_name: str, df_prev: pd.DataFrame, version_prev: int, delta: dict, version: int):
+    """Parcha la columna de la sucursal con un delta ya aplicado al frame `version_prev` → `version`."""
+    red = _red()
+    with red["lock"]:
+        col = red["suc"].get(sheet_name)
+        if col is None or col["version"] != version_prev: return  # se rearma al consultarla
+        racks = col["racks"]
+        def suma(clave, rack, q):
+            por_rack = racks.setdefault(clave, {})
+            por_rack[rack] = por_rack.get(rack, 0) + q
+        for row, valores in delta["updated"].items():
+            if "CANTIDAD" in valores:
+                suma(df_prev.at[row - 2, "CLAVE"], df_prev.at[row - 2, "RACK"], _to_int(valores["CANTIDAD"]) - int(df_prev.at[row - 2, "CANTIDAD"]))
+        for r in delta["appended"]: suma(_clean(r[0]), _normalize_rack(r[2]), _to_int(r[3]))
+        for row in delta["deleted"]:
+            cant = delta["updated"].get(row, {}).get("CANTIDAD", df_prev.at[row - 2, "CANTIDAD"])
+            suma(df_prev.at[row - 2, "CLAVE"], df_prev.at[row - 2, "RACK"], -_to_int(cant))
+        col["version"] = version
+        red["pivote"] = None
+
+def _stock_red(clave: str) -> dict[str, dict[str, int]]:
+    """Existencia de una CLAVE en cada sucursal: {hoja: {RACK: piezas}} (sólo racks con piezas)."""
+    clave = _clean(clave)
+    return {s: {r: q for r, q in _red_columna(s).get(clave, {}).items() if q > 0} for s in SUCURSALES}
+
+def _red_texto(clave: str, excluir: str | None = None) -> str:
+    """'Libramiento: 3 pz (RACK 1: 2, PISO: 1) · …' con las sucursales que tienen la clave."""
+    partes = [f"{SUCURSALES[s]}: {sum(racks.values())} pz ({', '.join(f'{r}: {q}' for r, q in sorted(racks.items(), key=lambda x: -x[1]))})"
+              for s, racks in _stock_red(clave).items() if racks and s != excluir]
+    return " · ".join(partes)
+
+def _matriz_stock() -> pd.DataFrame:
+    """Pivote CLAVE × sucursal (piezas) con TOTAL, armado una vez por versión de las columnas."""
+    for s in SUCURSALES: _red_columna(s)
+    red = _red()
+    with red["lock"]:
+        if red["pivote"] is None:
+            piv = pd.DataFrame({SUCURSALES[s]: {c: sum(r.values()) for c, r in red["suc"][s]["racks"].items()} for s in SUCURSALES}).fillna(0).astype(int)
+            piv["TOTAL"] = piv.sum(axis=1)
+            red["pivote"] = piv[piv["TOTAL"] > 0].sort_index().rename_axis("CLAVE").reset_index()
+        return red["pivote"]
+
+# ═══════════════════════════════════════════════════════════════════════════
+# ÍNDICE EN MEMORIA (CLAVE, RACK) → FILA
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _llave_indice(sheet_name: str) -> tuple[str, ...]:
+    return LLAVES_INDICE.get(sheet_name, ("CLAVE", "RACK"))
+
+def _build_index(df: pd.DataFrame, llave: tuple[str, ...] = ("CLAVE", "RACK")) -> dict:
+    """
+    Índice posicional de una hoja construido desde el DataFrame ya cargado:
+    la posición i corresponde a la fila i + 2 de Google Sheets. 'pos' apunta
+    a la primera fila de cada llave ((CLAVE, RACK) en inventario, (ID,) en
+    traslados), igual que el recorrido lineal original.
+    """
+    if df.empty or not {*llave, "CANTIDAD"}.issubset(df.columns):
+        claves, cant = [], []
+    else:
+        claves = list(zip(*(df[c].tolist() for c in llave)))
+        cant = df["CANTIDAD"].astype(int).tolist()
+    pos: dict[tuple[str, str], int] = {}
+    for i, key in enumerate(claves): pos.setdefault(key, i)
+    return {"claves": claves, "cant": cant, "pos": pos}
+
+def _get_index(sheet_name: str) -> dict:
+    e = _cache_entry(sheet_name) or _refresh(sheet_name)
+    if e["idx"] is None: e["idx"] = _build_index(e["df"], _llave_indice(sheet_name))
+    return e["idx"]
+
+def _cached_index(sheet_name: str) -> dict | None:
+    e = _shared_cache()["hojas"].get(sheet_name)
+    return e["idx"] if e else None
+
+def _index_lookup(ws, keys: list[tuple[str, str]], nombres: dict | None = None) -> dict[tuple[str, str], tuple[int | None, int]]:
+    """
+    Resuelve (CLAVE, RACK) → (fila, cantidad) desde el índice en memoria.
+    Una sola lectura ligera (columna CLAVE + filas candidatas) confirma que el
+    número de filas y la identidad de cada fila siguen vigentes y trae la
+    cantidad (y el NOMBRE, si se pide `nombres`) actual; si el índice está
+    desfasado se recarga la hoja.
+    """
+    sheet_name = ws.title
+    idx = _get_index(sheet_name)
+    filas = sorted({idx["pos"][k] + 2 for k in keys if k in idx["pos"]})
+    resp = ws.batch_get(["A:A"] + [f"A{r}:D{r}" for r in filas])
+    vigente = len(resp[0]) - 1 == len(idx["claves"])
+    frescas: dict[int, int] = {}
+    leidos: dict[int, str] = {}
+    for r, vr in zip(filas, resp[1:]):
+        vals = (list(vr[0]) if vr else []) + [""] * 4
+        if not vigente or (_clean(vals[0]), _normalize_rack(vals[2])) != idx["claves"][r - 2]:
+            vigente = False
+            break
+        frescas[r], leidos[r] = _to_int(vals[3]), str(vals[1])
+    if not vigente:
+        df = _refresh(sheet_name)["df"]
+        idx, frescas = _get_index(sheet_name), {}
+        # Recién descargada: el NOMBRE del frame es el actual
+        if "NOMBRE" in df.columns: leidos = {p + 2: str(df.at[p, "NOMBRE"]) for k in keys if (p := idx["pos"].get(k)) is not None}
+
+    out = {}
+    for k in keys:
+        p = idx["pos"].get(k)
+        if p is None:
+            out[k] = (None, 0)
+            continue
+        idx["cant"][p] = frescas.get(p + 2, idx["cant"][p])
+        out[k] = (p + 2, idx["cant"][p])
+        if nombres is not None: nombres[k] = leidos.get(p + 2, "")
+    return out
+
+def _id_lookup(ws, ids: list[str]) -> dict[str, tuple[int | None, int]]:
+    """
+    Resuelve ID de traslado → (fila, cantidad) desde el índice en memoria.
+    Una lectura ligera de las filas candidatas confirma que cada una sigue
+    siendo ese traslado y trae su cantidad actual; si alguna se corrió (otro
+    proceso borró filas) o un ID no está en el índice se recarga la hoja.
+    """
+    if any(not str(i).strip() for i in ids): raise ValueError(SIN_ID_MSG)
+    sheet_name, cols = ws.title, _headers(ws.title)
+    fin, p_id, p_cant = rowcol_to_a1(1, len(cols)).rstrip("1"), cols.index("ID"), cols.index("CANTIDAD")
+    for intento in range(2):
+        idx = _get_index(sheet_name)
+        filas = {i: idx["pos"][(i,)] + 2 for i in ids if (i,) in idx["pos"]}
+        orden = sorted(set(filas.values()))
+        resp = ws.batch_get([f"A{r}:{fin}{r}" for r in orden]) if orden else []
+        leidas = {r: (list(vr[0]) if vr else []) + [""] * len(cols) for r, vr in zip(orden, resp)}
+        if len(filas) == len(ids) and all(str(leidas[r][p_id]) == i for i, r in filas.items()) or intento: break
+        _refresh(sheet_name)
+    out = {}
+    for i in ids:
+        r = filas.get(i)
+        if r is None or str(leidas[r][p_id]) != i:
+            out[i] = (None, 0)
+            continue
+        idx["cant"][r - 2] = _to_int(leidas[r][p_cant])
+        out[i] = (r, idx["cant"][r - 2])
+    return out
+
+def _index_set(sheet_name: str, row: int, qty: int):
+    idx = _cached_index(sheet_name)
+    if idx and 0 <= row - 2 < len(idx["cant"]): idx["cant"][row - 2] = int(qty)
+
+def _llave_fila(sheet_name: str, fila: list) -> tuple:
+    """Llave del índice de una fila cruda (en el orden de columnas de la hoja)."""
+    cols = _headers(sheet_name)
+    fila = list(fila) + [""] * len(cols)
+    if sheet_name in SUCURSALES: return (_clean(fila[0]), _normalize_rack(fila[2]))
+    return tuple(str(fila[cols.index(c)]) for c in _llave_indice(sheet_name))
+
+def _index_append(sheet_name: str, rows: list[list]):
+    """Registra filas nuevas (en el orden de columnas de la hoja) al final del índice."""
+    idx = _cached_index(sheet_name)
+    if not idx: return
+    cols = _headers(sheet_name)
+    for r in rows:
+        key = _llave_fila(sheet_name, r)
+        idx["pos"].setdefault(key, len(idx["claves"]))
+        idx["claves"].append(key)
+        idx["cant"].append(_to_int((list(r) + [""] * len(cols))[cols.index("CANTIDAD")]))
+
+def _index_delete(sheet_name: str, rows: list[int]):
+    """Quita filas borradas del índice y recorre las posiciones siguientes."""
+    idx = _cached_index(sheet_name)
+    if not idx: return
+    for r in sorted(set(rows), reverse=True):
+        if 0 <= r - 2 < len(idx["claves"]):
+            del idx["claves"][r - 2]
+            del idx["cant"][r - 2]
+    idx["pos"] = {}
+    for i, key in enumerate(idx["claves"]): idx["pos"].setdefault(key, i)
+
+# ═══════════════════════════════════════════════════════════════════════════
+# CAPA DE ALMACENAMIENTO (BACKENDS INTERCAMBIABLES)
+# ═══════════════════════════════════════════════════════════════════════════
+# Las operaciones no hablan con gspread sino con un StorageBackend. En todas
+# las implementaciones las filas se numeran como en Google Sheets (encabezado
+# = fila 1, datos desde la fila 2) para que deltas e índice funcionen igual.
+
+class StorageBackend:
+    """Contrato mínimo de almacenamiento de las hojas del inventario."""
+
+    def load_table(self, name: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def load_tables(self, names: list[str]) -> dict[str, pd.DataFrame]:
+        return {n: self.load_table(n) for n in names}
+
+    def find_rows(self, name: str, keys: list[tuple[str, str]], nombres: dict | None = None) -> dict[tuple[str, str], tuple[int | None, int]]:
+        """
+        (CLAVE, RACK) → (fila, cantidad actual); (None, 0) si no existe. Con
+        `nombres` (un dict) lo llena con el NOMBRE actual de cada llave
+        encontrada, tomado de la misma lectura.
+        """
+        raise NotImplementedError
+
+    def find_ids(self, name: str, ids: list[str]) -> dict[str, tuple[int | None, int]]:
+        """ID (columna ID, p. ej. de traslados) → (fila, cantidad actual); (None, 0) si no existe."""
+        raise NotImplementedError
+
+    def update_cells(self, name: str, cambios: dict[int, dict]):
+        """Escribe {fila: {COLUMNA: valor}} (cantidades, fecha)."""
+        raise NotImplementedError
+
+    def update_cells_if(self, name: str, cambios: dict[int, dict], esperado: dict[int, int]) -> bool:
+        """
+        Como update_cells, pero sólo si la CANTIDAD de cada fila de `esperado`
+        sigue siendo la leída; False si hubo conflicto (no se escribió nada).
+        """
+        if not self._precondicion({name: esperado}): return False
+        self.update_cells(name, cambios)
+        return True
+
+    def append_rows(self, name: str, rows: list[list]):
+        raise NotImplementedError
+
+    def delete_rows(self, name: str, rows: list[int]):
+        raise NotImplementedError
+
+    def replace_table(self, name: str, values: list[list], previas: int | None = None):
+        """
+        Reemplaza la hoja completa por `values` (encabezado + filas).
+        `previas`: filas que tiene hoy la hoja, encabezado incluido, si el
+        llamador ya las conoce.
+        """
+        raise NotImplementedError
+
+    def append_movements(self, rows: list[list]):
+        self.append_rows("Movimientos", rows)
+
+    def write_batch(self, escrituras: list[tuple], esperado: dict[str, dict[int, int]] | None = None) -> bool:
+        """
+        Escrituras de varias hojas como una sola unidad, en orden:
+        ("update", hoja, {fila: {COLUMNA: valor}}), ("append", hoja, filas) o
+        ("delete", hoja, filas). `esperado` = {hoja: {fila: cantidad}} la
+        condiciona como update_cells_if. Sin soporte del almacenamiento se
+        verifica con una relectura y se aplican una por una.
+        """
+        if not self._precondicion(esperado or {}): return False
+        for tipo, name, arg in escrituras:
+            {"update": self.update_cells, "append": self.append_rows, "delete": self.delete_rows}[tipo](name, arg)
+        return True
+
+    def _precondicion(self, esperado: dict[str, dict[int, int]]) -> bool:
+        """
+        Relectura de las filas de `esperado` justo antes de escribir: cada una
+        sigue siendo la del índice en memoria (misma llave) y conserva la
+        CANTIDAD leída. False si otro proceso escribió en medio.
+        """
+        for name, filas in esperado.items():
+            for fila, cant in filas.items():
+                r = self.read_rows(name, fila, fila)
+                if not self._fila_vigente(name, fila, r.iloc[0].tolist() if len(r) else [], cant): return False
+        return True
+
+    @staticmethod
+    def _fila_vigente(name: str, fila: int, vals: list, cant: int) -> bool:
+        cols, idx = _headers(name), _cached_index(name)
+        vals = list(vals) + [""] * len(cols)
+        if idx and 0 <= fila - 2 < len(idx["claves"]) and _llave_fila(name, vals) != idx["claves"][fila - 2]: return False
+        return any(str(v) != "" for v in vals[:len(cols)]) and _to_int(vals[cols.index("CANTIDAD")]) == cant
+
+    def table_names(self, prefix: str = "") -> list[str]:
+        raise NotImplementedError
+
+    def ensure_table(self, name: str):
+        """Crea la hoja con su encabezado si todavía no existe."""
+        raise NotImplementedError
+
+    def count_rows(self, name: str) -> int:
+        """Número de filas de datos (sin encabezado)."""
+        return len(self.load_table(name))
+
+    def read_rows(self, name: str, start: int, end: int) -> pd.DataFrame:
+        """Filas [start, end] (numeración de Sheets) sin descargar el resto de la hoja."""
+        return self.load_table(name).iloc[max(start - 2, 0):max(end - 1, 0)].reset_index(drop=True)
+
+    def read_tail(self, name: str, start: int) -> pd.DataFrame:
+        """Filas desde `start` (numeración de Sheets) hasta el final, sin descargar las anteriores."""
+        return self.load_table(name).iloc[max(start - 2, 0):].reset_index(drop=True)
+
+    def espejo_pendientes(self) -> tuple[int, str | None]:
+        """Escrituras que aún no llegan al espejo y el último error; (0, None) sin espejo."""
+        return 0, None
+
+    def replicar_espejo(self, forzar: bool = False):
+        """Reintenta en segundo plano lo pendiente del espejo (sin `forzar`, a lo más cada ESPEJO_REINTENTO_SEG)."""
+
+    def revision(self) -> str | None:
+        """Marca que cambia con cada modificación del almacenamiento; None si no se sabe (se comparan centinelas)."""
+        return None
+
+    def huellas(self, conocidas: dict[str, int]) -> dict[str, str]:
+        """
+        Centinela (_huella) actual de cada hoja. `conocidas` = {hoja: filas
+        en memoria}, para que la implementación lea sólo lo necesario.
+        """
+        return {n: _huella(self.load_table(n)) for n in conocidas}
+
+
+class SheetsBackend(StorageBackend):
+    """Google Sheets vía gspread (spreadsheet 'Inventario_Cristales')."""
+
+    def load_table(self, name):
+        return _values_to_df(_sheet(name).get_all_values())
+
+    def load_tables(self, names):
+        """
+        Descarga varias hojas con una sola petición values:batchGet y arma los
+        DataFrames localmente. Si la petición en bloque falla (p. ej. respuesta
+        demasiado grande) se reparte hoja por hoja en un pool de CARGA_HILOS.
+        """
+        try:
+            resp = _client().spreadsheet.values_batch_get([f"'{n}'" for n in names])
+            return {n: _values_to_df(vr.get("values", [])) for n, vr in zip(names, resp["valueRanges"])}
+        except Exception:
+            with ThreadPoolExecutor(max_workers=CARGA_HILOS) as pool:
+                return dict(zip(names, pool.map(self.load_table, names)))
+
+    def find_rows(self, name, keys, nombres=None):
+        return _index_lookup(_sheet(name), keys, nombres)
+
+    def find_ids(self, name, ids):
+        return _id_lookup(_sheet(name), ids)
+
+    def update_cells(self, name, cambios):
+        cols = _headers(name)
+        data = [{"range": rowcol_to_a1(row, cols.index(c) + 1), "values": [[v]]} for row, vals in cambios.items() for c, v in vals.items()]
+        _sheet(name).batch_update(data, value_input_option="USER_ENTERED")
+
+    def append_rows(self, name, rows):
+        _sheet(name).append_rows(rows)
+
+    def delete_rows(self, name, rows):
+        # Todos los tramos contiguos en un solo batchUpdate (deleteDimension de abajo hacia arriba)
+        self.write_batch([("delete", name, rows)])
+
+    def replace_table(self, name, values, previas=None):
+        """
+        Reescritura en un solo batchUpdate: los valores nuevos desde A1 y las
+        filas sobrantes borradas (o la cuadrícula ampliada) en la misma
+        petición, así un error nunca deja la hoja vacía o a medias.
+        """
+        ws = _sheet(name)
+        if previas is None: previas = len(ws.get_all_values())
+        ancho = max(len(r) for r in values)
+        sid, requests = ws.id, []
+        if len(values) > previas:
+            requests.append({"appendDimension": {"sheetId": sid, "dimension": "ROWS", "length": len(values) - previas}})
+        requests.append({"updateCells": {"start": {"sheetId": sid, "rowIndex": 0, "columnIndex": 0}, "fields": "userEnteredValue",
+                                         "rows": [{"values": [self._celda(v) for v in (list(r) + [""] * ancho)[:ancho]]} for r in values]}})
+        if len(values) < previas:
+            requests.append({"deleteDimension": {"range": {"sheetId": sid, "dimension": "ROWS", "startIndex": len(values), "endIndex": previas}}})
+        _client().spreadsheet.batch_update({"requests": requests})
+
+    @staticmethod
+    def _celda(v) -> dict:
+        if hasattr(v, "item"): v = v.item()  # escalares de numpy
+        if isinstance(v, float) and v != v: v = ""  # NaN: celda vacía
+        tipo = "numberValue" if isinstance(v, (int, float)) and not isinstance(v, bool) else "stringValue"
+        return {"userEnteredValue": {tipo: v if tipo == "numberValue" else str(v)}}
+
+    def _precondicion(self, esperado):
+        # Todas las filas condicionadas en un solo values:batchGet (fila completa: llave + CANTIDAD)
+        filas = [(n, f, c) for n, conds in esperado.items() for f, c in conds.items()]
+        if not filas: return True
+        fin = {n: rowcol_to_a1(1, len(_headers(n))).rstrip("1") for n in esperado}
+        resp = _client().spreadsheet.values_batch_get([f"'{n}'!A{f}:{fin[n]}{f}" for n, f, _ in filas])["valueRanges"]
+        return all(self._fila_vigente(n, f, (vr.get("values") or [[]])[0], c) for (n, f, c), vr in zip(filas, resp))
+
+    def write_batch(self, escrituras, esperado=None):
+        """
+        Un solo spreadsheets.batchUpdate para todas las hojas: Sheets valida y
+        aplica todas las peticiones o ninguna. Sheets no tiene escritura
+        condicional, así que `esperado` se verifica con una relectura de esas
+        filas inmediatamente antes (el candado por hoja cubre a las demás
+        sesiones del proceso; la relectura, a los demás procesos).
+        """
+        if esperado and not self._precondicion(esperado): return False
+        requests = []
+        for tipo, name, arg in escrituras:
+            sid = _sheet(name).id
+            if tipo == "update":
+                cols = _headers(name)
+                requests += [{"updateCells": {"start": {"sheetId": sid, "rowIndex": fila - 1, "columnIndex": cols.index(c)},
+                                              "rows": [{"values": [self._celda(v)]}], "fields": "userEnteredValue"}}
+                             for fila, vals in arg.items() for c, v in vals.items()]
+            elif tipo == "append":
+                requests.append({"appendCells": {"sheetId": sid, "rows": [{"values": [self._celda(v) for v in r]} for r in arg], "fields": "userEnteredValue"}})
+            else:
+                requests += [{"deleteDimension": {"range": {"sheetId": sid, "dimension": "ROWS", "startIndex": start - 1, "endIndex": end}}}
+                             for start, end in reversed(_row_runs(arg))]
+        if requests: _client().spreadsheet.batch_update({"requests": requests})
+        return True
+
+    def table_names(self, prefix=""):
+        return [ws.title for ws in _client().spreadsheet.worksheets() if ws.title.startswith(prefix)]
+
+    def ensure_table(self, name):
+        if name in self.table_names(name): return
+        cols = _headers(name)
+        _client().spreadsheet.add_worksheet(title=name, rows=1, cols=len(cols))
+        _sheet(name).update([cols])
+
+    def count_rows(self, name):
+        return max(len(_sheet(name).col_values(1)) - 1, 0)
+
+    def read_rows(self, name, start, end):
+        cols = _headers(name)
+        values = _sheet(name).get(f"A{start}:{rowcol_to_a1(end, len(cols))}")
+        return _values_to_df([cols] + [list(r) for r in values])
+
+    def read_tail(self, name, start):
+        # Rango abierto hacia abajo ("A120:H"): una sola petición trae todo lo que haya desde `start`
+        cols = _headers(name)
+        values = _sheet(name).get(f"A{start}:{rowcol_to_a1(1, len(cols))[:-1]}")
+        return _values_to_df([cols] + [list(r) for r in values])
+
+    def revision(self):
+        # Metadatos del archivo (Drive): una llamada ligera que no descarga celdas
+        try:
+            return str(_client().spreadsheet.get_lastUpdateTime())
+        except Exception:
+            return None
+
+    def huellas(self, conocidas):
+        """
+        Todas las hojas en un solo values:batchGet de tres rangos cada una:
+        encabezado + primeras CENTINELA_FILAS, desde la última fila conocida
+        hasta el final (filas nuevas o faltantes) y la columna CANTIDAD.
+        """
+        rangos = []
+        for n, filas in conocidas.items():
+            cols = _headers(n)
+            ult = rowcol_to_a1(1, len(cols))[:-1]
+            cant = rowcol_to_a1(1, cols.index("CANTIDAD") + 1 if "CANTIDAD" in cols else 1)[:-1]
+            rangos += [f"'{n}'!A1:{ult}{CENTINELA_FILAS + 1}", f"'{n}'!A{filas + 1 if filas else 2}:{ult}", f"'{n}'!{cant}2:{cant}"]
+        resp = _client().spreadsheet.values_batch_get(rangos)["valueRanges"]
+        out = {}
+        for i, (n, conocidas_n) in enumerate(conocidas.items()):
+            cabeza, cola, cant = (resp[3 * i + j].get("values", []) for j in range(3))
+            if not cabeza:
+                out[n] = _huella(pd.DataFrame())
+                continue
+            filas = (conocidas_n - 1 if conocidas_n else 0) + len(cola)
+            cabeza = _values_to_df(cabeza[:filas + 1])
+            ultima = _values_to_df([list(cabeza.columns), cola[-1]]) if cola else cabeza.tail(0)
+            cantidades = None
+            if "CANTIDAD" in cabeza.columns:
+                valores = numericise_all([(r[0] if r else "") for r in cant] + [""] * max(filas - len(cant), 0))
+                cantidades = pd.to_numeric(pd.Series(valores[:filas], dtype=object), errors="coerce").fillna(0).astype(int)
+            out[n] = _huella_partes(filas, cabeza, ultima, cantidades)
+        return out
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Almacenamiento local indexado: una tabla por hoja con su posición 'fila'
+    y, en las de inventario, índice (CLAVE, RACK). Sirve para trabajar sin
+    conexión, pruebas de carga y pruebas locales. Con `mirror` cada escritura
+    se replica en segundo plano sobre otro backend (p. ej. Google Sheets): se
+    encola en la tabla '_espejo_salida' dentro de su misma transacción y un
+    solo hilo la envía en orden, borrando cada entrada al confirmarse. Si el
+    espejo falla, la cola se detiene ahí y se reintenta más tarde (entrega
+    al-menos-una-vez, como el spool de la bitácora).
+    """
+
+    def __init__(self, path: str, mirror: StorageBackend | None = None):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.lock = threading.RLock()
+        self.mirror = mirror
+        self._mirror_pool = ThreadPoolExecutor(max_workers=1) if mirror else None
+        self._replica = {"lock": threading.Lock(), "ultimo_intento": 0.0, "error": None}
+        for name in list(SUCURSALES) + list(ENCABEZADOS): self._ensure(name)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS _espejo_salida (id INTEGER PRIMARY KEY, metodo TEXT NOT NULL, args BLOB NOT NULL, "
+                          "creado REAL NOT NULL, intentos INTEGER NOT NULL DEFAULT 0, error TEXT)")
+        # Lo que quedó sin replicar en la corrida anterior sale primero
+        self.replicar_espejo(forzar=True)
+
+    @staticmethod
+    def _cols(name: str) -> str:
+        return ", ".join(f'"{c}"' for c in _headers(name))
+
+    def _ensure(self, name: str):
+        self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{name}" (fila INTEGER NOT NULL, {self._cols(name)})')
+        existentes = {r[1] for r in self.conn.execute(f'PRAGMA table_info("{name}")')}
+        for c in _headers(name):
+            if c not in existentes: self.conn.execute(f'ALTER TABLE "{name}" ADD COLUMN "{c}"')
+        self.conn.execute(f'CREATE INDEX IF NOT EXISTS "ix_{name}_fila" ON "{name}" (fila)')
+        if "RACK" in _headers(name):
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS "ix_{name}_clave_rack" ON "{name}" (CLAVE, RACK, fila)')
+        if "ID" in _headers(name):
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS "ix_{name}_id" ON "{name}" (ID)')
+
+    def _tx(self, fn, *args, espejo: tuple | None = None):
+        """Una transacción; `espejo` = (método, *args) se encola para el espejo dentro de ella."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                fn(*args)
+                if espejo: self._mirror(*espejo)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        self.replicar_espejo()
+
+    def _mirror(self, metodo: str, *args):
+        # Argumentos tal cual (llaves de fila int, escalares de numpy): pickle en vez de JSON
+        if self.mirror: self.conn.execute("INSERT INTO _espejo_salida (metodo, args, creado) VALUES (?, ?, ?)", (metodo, pickle.dumps(args), time.time()))
+
+    def _replicar(self):
+        """Envía la salida en orden; se detiene en el primer error y lo deja anotado en esa entrada."""
+        estado = self._replica
+        if not estado["lock"].acquire(blocking=False): return
+        try:
+            estado["ultimo_intento"] = time.time()
+            while True:
+                with self.lock:
+                    r = self.conn.execute("SELECT id, metodo, args FROM _espejo_salida ORDER BY id LIMIT 1").fetchone()
+                if not r:
+                    estado["error"] = None
+                    return
+                try:
+                    getattr(self.mirror, r[1])(*pickle.loads(r[2]))
+                except Exception as e:
+                    estado["error"] = f"{datetime.now():%Y-%m-%d %H:%M:%S} {r[1]}: {e}"
+                    with self.lock:
+                        self.conn.execute("UPDATE _espejo_salida SET intentos = intentos + 1, error = ? WHERE id = ?", (estado["error"], r[0]))
+                    return
+                with self.lock:
+                    self.conn.execute("DELETE FROM _espejo_salida WHERE id = ?", (r[0],))
+        finally:
+            estado["lock"].release()
+
+    def replicar_espejo(self, forzar=False):
+        # Tras un error, el siguiente intento espera ESPEJO_REINTENTO_SEG salvo que se fuerce
+        if not self.mirror: return
+        estado = self._replica
+        if forzar or not estado["error"] or time.time() - estado["ultimo_intento"] > ESPEJO_REINTENTO_SEG:
+            self._mirror_pool.submit(self._replicar)
+
+    def espejo_pendientes(self):
+        if not self.mirror: return 0, None
+        with self.lock:
+            n, error = self.conn.execute("SELECT COUNT(*), (SELECT error FROM _espejo_salida ORDER BY id LIMIT 1) FROM _espejo_salida").fetchone()
+        return n, error
+
+    def load_table(self, name):
+        cols = _headers(name)
+        with self.lock:
+            rows = self.conn.execute(f'SELECT {self._cols(name)} FROM "{name}" ORDER BY fila').fetchall()
+        # Misma conversión que una lectura de Sheets (valores como texto + numericise)
+        return _values_to_df([cols] + [["" if v is None else str(v) for v in r] for r in rows])
+
+    def find_rows(self, name, keys, nombres=None):
+        out = {}
+        with self.lock:
+            for clave, rack in keys:
+                r = self.conn.execute(f'SELECT fila, CANTIDAD, NOMBRE FROM "{name}" WHERE CLAVE = ? AND RACK = ? ORDER BY fila LIMIT 1', (clave, rack)).fetchone()
+                out[(clave, rack)] = (r[0], _to_int(r[1])) if r else (None, 0)
+                if r and nombres is not None: nombres[(clave, rack)] = "" if r[2] is None else str(r[2])
+        return out
+
+    def _update(self, name: str, cambios: dict[int, dict]):
+        for fila, vals in cambios.items():
+            sets = ", ".join(f'"{c}" = ?' for c in vals)
+            self.conn.execute(f'UPDATE "{name}" SET {sets} WHERE fila = ?', (*vals.values(), fila))
+
+    def _vigente(self, name: str, esperado: dict[int, int]) -> bool:
+        for fila, cant in esperado.items():
+            r = self.conn.execute(f'SELECT CANTIDAD FROM "{name}" WHERE fila = ?', (fila,)).fetchone()
+            if r is None or _to_int(r[0]) != cant: return False
+        return True
+
+    def find_ids(self, name, ids):
+        out = {}
+        with self.lock:
+            for i in ids:
+                r = self.conn.execute(f'SELECT fila, CANTIDAD FROM "{name}" WHERE ID = ? LIMIT 1', (i,)).fetchone()
+                out[i] = (r[0], _to_int(r[1])) if r else (None, 0)
+        return out
+
+    def update_cells(self, name, cambios):
+        self._tx(self._update, name, cambios, espejo=("update_cells", name, cambios))
+
+    def update_cells_if(self, name, cambios, esperado):
+        return self.write_batch([("update", name, cambios)], {name: esperado})
+
+    def _insert(self, name: str, rows: list[list]):
+        n = len(_headers(name))
+        base = self.conn.execute(f'SELECT COALESCE(MAX(fila), 1) FROM "{name}"').fetchone()[0]
+        self.conn.executemany(f'INSERT INTO "{name}" (fila, {self._cols(name)}) VALUES ({", ".join("?" * (n + 1))})',
+                              [(base + i + 1, *(list(r) + [""] * n)[:n]) for i, r in enumerate(rows)])
+
+    def append_rows(self, name, rows):
+        self._tx(self._insert, name, rows, espejo=("append_rows", name, rows))
+
+    def _delete(self, name: str, rows: list[int]):
+        for start, end in reversed(_row_runs(rows)):
+            self.conn.execute(f'DELETE FROM "{name}" WHERE fila BETWEEN ? AND ?', (start, end))
+            self.conn.execute(f'UPDATE "{name}" SET fila = fila - ? WHERE fila > ?', (end - start + 1, end))
+
+    def delete_rows(self, name, rows):
+        self._tx(self._delete, name, rows, espejo=("delete_rows", name, rows))
+
+    def write_batch(self, escrituras, esperado=None):
+        """Una sola transacción (compare-and-swap de `esperado` incluido); el espejo recibe el lote completo."""
+        vigente = True
+        def run():
+            nonlocal vigente
+            vigente = all(self._vigente(name, filas) for name, filas in (esperado or {}).items())
+            if not vigente: return
+            for tipo, name, arg in escrituras:
+                {"update": self._update, "append": self._insert, "delete": self._delete}[tipo](name, arg)
+            self._mirror("write_batch", escrituras)
+        self._tx(run)
+        return vigente
+
+    def replace_table(self, name, values, previas=None):
+        head, cols = [str(h) for h in values[0]], _headers(name)
+        rows = [[r[head.index(c)] if c in head and head.index(c) < len(r) else "" for c in cols] for r in values[1:]]
+        def run():
+            nonlocal previas
+            previas = self.conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0] + 1
+            self.conn.execute(f'DELETE FROM "{name}"')
+            self._insert(name, rows)
+            # Al replicarse en orden, el espejo tiene las mismas filas que la tabla antes del reemplazo
+            self._mirror("replace_table", name, values, previas)
+        self._tx(run)
+
+    def table_names(self, prefix=""):
+        with self.lock:
+            return [r[0] for r in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name") if r[0].startswith(prefix)]
+
+    def ensure_table(self, name):
+        self._tx(self._ensure, name, espejo=("ensure_table", name))
+
+    def count_rows(self, name):
+        with self.lock:
+            return self.conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+
+    def revision(self):
+        # data_version cambia con lo que escriben otras conexiones; total_changes, con lo que escribe ésta
+        with self.lock:
+            return f"{self.conn.execute('PRAGMA data_version').fetchone()[0]}:{self.conn.total_changes}"
+
+    def read_rows(self, name, start, end):
+        cols = _headers(name)
+        with self.lock:
+            rows = self.conn.execute(f'SELECT {self._cols(name)} FROM "{name}" WHERE fila BETWEEN ? AND ? ORDER BY fila', (start, end)).fetchall()
+        return _values_to_df([cols] + [["" if v is None else str(v) for v in r] for r in rows])
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            return not any(self.conn.execute(f'SELECT 1 FROM "{n}" LIMIT 1').fetchone() for n in list(SUCURSALES) + list(ENCABEZADOS))
+
+    def import_from(self, origen: StorageBackend):
+        """Copia todas las hojas desde otro backend (sin replicar al espejo)."""
+        for name, df in origen.load_tables(list(SUCURSALES) + list(ENCABEZADOS)).items():
+            cols = list(df.columns) or _headers(name)
+            values = [cols] + _a_valores(df)
+            mirror, self.mirror = self.mirror, None
+            try:
+                self.replace_table(name, values)
+            finally:
+                self.mirror = mirror
+
+
+@st.cache_resource
+def _backend() -> StorageBackend:
+    """Backend activo según STORAGE_BACKEND: 'sheets', 'sqlite' o 'sqlite+sheets' (SQLite primario con espejo en Sheets)."""
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteBackend(SQLITE_PATH)
+    if STORAGE_BACKEND == "sqlite+sheets":
+        sheets = SheetsBackend()
+        local = SQLiteBackend(SQLITE_PATH, mirror=sheets)
+        if local.is_empty(): local.import_from(sheets)
+        return local
+    return SheetsBackend()
 
 # ═══════════════════════════════════════════════════════════════════════════
 # CAPA DE ESCRITURA
 # ═══════════════════════════════════════════════════════════════════════════
 
-def _find_row(ws, clave: str, rack: str) -> tuple[int | None, int]:
-    records = ws.get_all_records()
-    for i, row in enumerate(records):
-        if _clean(row.get("CLAVE", "")) == clave and _normalize_rack(row.get("RACK", "")) == rack:
-            qty = int(pd.to_numeric(row.get("CANTIDAD", 0), errors="coerce") or 0)
-            return i + 2, qty
-    return None, 0
+def _find_rows(sheet_name: str, keys: list[tuple[str, str]]) -> dict[tuple[str, str], tuple[int | None, int]]:
+    return _backend().find_rows(sheet_name, keys)
 
-def _log_movement(clave, tipo, detalle, cantidad, precio, usuario, sucursal):
+def _find_row(sheet_name: str, clave: str, rack: str) -> tuple[int | None, int]:
+    return _find_rows(sheet_name, [(clave, rack)])[(clave, rack)]
+
+def _find_row_nombre(sheet_name: str, clave: str, rack: str) -> tuple[int | None, int, str]:
+    """Como _find_row, más el NOMBRE actual de la fila (de la misma lectura, no de la caché)."""
+    nombres: dict = {}
+    row, current = _backend().find_rows(sheet_name, [(clave, rack)], nombres)[(clave, rack)]
+    return row, current, nombres.get((clave, rack), "")
+
+def _find_transfer(traslado_id: str) -> tuple[int | None, int]:
+    """Fila y cantidad pendiente actuales de un traslado por su ID (sin releer la hoja)."""
+    # Un ID vacío coincidiría con cualquier otra fila sin ID
+    if not str(traslado_id).strip(): raise ValueError(SIN_ID_MSG)
+    return _backend().find_ids("Traslados_Pendientes", [traslado_id])[traslado_id]
+
+def _nuevo_id_traslado() -> str:
+    # Con prefijo para que numericise nunca lo convierta en número
+    return "T" + uuid.uuid4().hex[:11].upper()
+
+def _migrar_ids_traslados() -> dict | None:
+    """
+    Asigna ID a los traslados que no lo tienen (hojas anteriores a la columna
+    ID o filas agregadas a mano): una sola escritura con el encabezado y los
+    IDs faltantes. Corre tras cada carga completa de la hoja; si no falta
+    ninguno sólo mira el frame recién publicado. Las filas se vuelven a leer
+    bajo el candado de la hoja, así un borrado de otra sesión no corre los
+    IDs a otra fila. Retorna la entrada nueva de la caché si escribió.
+    """
+    df = _get_df("Traslados_Pendientes")
+    if not len(df.columns) or "ID" in df.columns and not (df["ID"].astype(str).str.strip() == "").any(): return None
+    with _sheet_lock("Traslados_Pendientes"):
+        df = _load_df("Traslados_Pendientes")
+        sin_id = range(len(df)) if "ID" not in df.columns else df.index[df["ID"].astype(str).str.strip() == ""]
+        if "ID" in df.columns and not len(sin_id): return _cache_put("Traslados_Pendientes", df)
+        # El encabezado va siempre: con SQLite primario la tabla ya tiene la columna pero el espejo en Sheets no
+        cambios = {1: {"ID": "ID"}} | {i + 2: {"ID": _nuevo_id_traslado()} for i in sin_id}
+        _backend().update_cells("Traslados_Pendientes", cambios)
+        # _cache_put y no _refresh: la recarga volvería a pasar por aquí
+        return _cache_put("Traslados_Pendientes", _load_df("Traslados_Pendientes"))
+
+def _delta(sheet_name: str, updated=None, appended=None, deleted=None) -> dict:
+    """Cambios de una escritura: {fila: {COLUMNA: valor}}, filas agregadas y filas borradas."""
+    return {"sheet": sheet_name, "updated": updated or {}, "appended": appended or [], "deleted": deleted or []}
+
+def _write_cells(sheet_name: str, cambios: dict[int, dict]) -> dict:
+    """Escribe {fila: {COLUMNA: valor}} en una sola llamada al backend y retorna su delta."""
+    _backend().update_cells(sheet_name, cambios)
+    return _delta(sheet_name, updated=cambios)
+
+class _CandadoHoja:
+    """
+    Candado reentrante de una hoja: un RLock entre las sesiones del proceso y
+    un flock sobre BLOQUEOS_DIR/<hoja>.lock entre procesos (la app en vivo y
+    mantenimiento.py). El archivo se bloquea en el primer acquire del hilo
+    dueño y se libera en el último release.
+    """
+
+    def __init__(self, sheet_name: str):
+        self.lock, self.nivel, self.fd = threading.RLock(), 0, None
+        self.path = os.path.join(BLOQUEOS_DIR, f"{sheet_name}.lock")
+
+    def acquire(self):
+        self.lock.acquire()
+        if self.nivel == 0 and fcntl and BLOQUEOS_DIR:
+            try:
+                os.makedirs(BLOQUEOS_DIR, exist_ok=True)
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            except Exception:
+                if self.fd is not None: os.close(self.fd)
+                self.fd = None
+                self.lock.release()
+                raise
+        self.nivel += 1
+
+    def release(self):
+        self.nivel -= 1
+        if self.nivel == 0 and self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+@st.cache_resource
+def _write_locks() -> dict:
+    return {"lock": threading.Lock(), "hojas": {}}
+
+def _sheet_lock(sheet_name: str) -> _CandadoHoja:
+    """Candado por hoja compartido por todas las sesiones y procesos: serializa leer-verificar-escribir en la misma hoja."""
+    locks = _write_locks()
+    with locks["lock"]:
+        if sheet_name not in locks["hojas"]: locks["hojas"][sheet_name] = _CandadoHoja(sheet_name)
+        return locks["hojas"][sheet_name]
+
+def _write_cells_if(sheet_name: str, cambios: dict[int, dict], esperado: dict[int, int]) -> dict | None:
+    """
+    Escritura condicional: aplica `cambios` sólo si la CANTIDAD de las filas
+    de `esperado` sigue siendo la leída (el backend las relee justo antes de
+    escribir, así se detecta también a otros procesos). Retorna el
+    delta o None si hubo conflicto (el llamador vuelve a leer sólo esas filas).
+    """
+    if not _backend().update_cells_if(sheet_name, cambios, esperado): return None
+    return _delta(sheet_name, updated=cambios)
+
+@contextmanager
+def _sheet_locks(*sheet_names: str):
+    """Candados de varias hojas, tomados siempre en el mismo orden para no interbloquear."""
+    locks = [_sheet_lock(n) for n in sorted(set(sheet_names))]
+    for l in locks: l.acquire()
     try:
-        ws = _sheet("Movimientos")
-        ws.append_row([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), clave, tipo, detalle, cantidad, precio, usuario, sucursal])
-    except Exception:
-        pass
+        yield
+    finally:
+        for l in reversed(locks): l.release()
+
+def _write_batch(escrituras: list[tuple], movimientos: list[list], esperado: dict[str, dict[int, int]] | None = None) -> bool:
+    """
+    Escribe una operación que toca varias hojas en un solo viaje atómico
+    (un batchUpdate del libro), con sus movimientos de bitácora dentro del
+    mismo lote; los que esperaban en el spool van delante para no desordenar
+    'Movimientos'. Aplica los deltas y retorna False si hubo conflicto con
+    `esperado` (en ese caso no se escribió nada).
+    """
+    sp = _spool()
+    with sp["flush_lock"]:
+        with sp["db_lock"]:
+            lote = sp["conn"].execute("SELECT id, fila FROM movimientos ORDER BY id LIMIT ?", (MOV_LOTE,)).fetchall()
+        # Con el spool muy atrasado la bitácora sigue su camino normal (detrás de lo pendiente)
+        en_lote = len(lote) < MOV_LOTE
+        if en_lote: escrituras = escrituras + [("append", "Movimientos", [json.loads(f) for _, f in lote] + movimientos)]
+        if not _backend().write_batch(escrituras, esperado): return False
+        if en_lote and lote:
+            with sp["db_lock"]:
+                sp["conn"].execute("DELETE FROM movimientos WHERE id <= ?", (lote[-1][0],))
+    campo = {"update": "updated", "append": "appended", "delete": "deleted"}
+    for tipo, name, arg in escrituras: _apply_delta(_delta(name, **{campo[tipo]: arg}))
+    if not en_lote:
+        _log_movements(movimientos)
+        _flush_movements()
+    return True
+
+def _write_append(sheet_name: str, rows: list[list]) -> dict:
+    _backend().append_rows(sheet_name, rows)
+    return _delta(sheet_name, appended=rows)
+
+def _write_delete(sheet_name: str, rows: list[int]) -> dict:
+    _backend().delete_rows(sheet_name, rows)
+    return _delta(sheet_name, deleted=list(rows))
+
+def _commit(*deltas: dict):
+    """Cierra una operación: aplica sus deltas y envía la bitácora encolada."""
+    for d in deltas: _apply_delta(d)
+    _flush_movements()
+
+# ── Bitácora con spool local ─────────────────────────────────────────────
+# Los movimientos se guardan primero en un SQLite local y se envían a
+# 'Movimientos' en lotes; sólo salen del spool cuando Sheets confirma la
+# escritura, así que sobreviven a un error de cuota o a un reinicio.
+
+@st.cache_resource
+def _spool() -> dict:
+    conn = sqlite3.connect(SPOOL_PATH, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS movimientos (id INTEGER PRIMARY KEY AUTOINCREMENT, fila TEXT NOT NULL, creado REAL NOT NULL)")
+    return {"conn": conn, "db_lock": threading.Lock(), "flush_lock": threading.Lock(), "ultimo_intento": 0.0}
+
+def _log_movement(clave, tipo, detalle, cantidad, precio, usuario, sucursal):
+    _log_movements([[datetime.now().strftime("%Y-%m-%d %H:%M:%S"), clave, tipo, detalle, cantidad, precio, usuario, sucursal]])
+
+def _log_movements(rows: list[list]):
+    """Encola movimientos en el spool; _flush_movements los envía con append_rows."""
+    if not rows: return
+    sp = _spool()
+    with sp["db_lock"]:
+        sp["conn"].executemany("INSERT INTO movimientos (fila, creado) VALUES (?, ?)", [(json.dumps(r, ensure_ascii=False, default=str), time.time()) for r in rows])
+
+def _spool_pendientes() -> int:
+    sp = _spool()
+    with sp["db_lock"]:
+        return sp["conn"].execute("SELECT COUNT(*) FROM movimientos").fetchone()[0]
+
+@_medido("envío_bitácora")
+def _flush_movements() -> bool:
+    """
+    Envía el spool a 'Movimientos' en lotes de MOV_LOTE filas (una llamada
+    append_rows por lote) y borra cada lote sólo después de confirmarse.
+    Entrega al-menos-una-vez: un corte entre el append y el borrado puede
+    duplicar el lote, nunca perderlo. Retorna False si quedó algo pendiente.
+    """
+    sp = _spool()
+    with sp["flush_lock"]:
+        sp["ultimo_intento"] = time.time()
+        while True:
+            with sp["db_lock"]:
+                lote = sp["conn"].execute("SELECT id, fila FROM movimientos ORDER BY id LIMIT ?", (MOV_LOTE,)).fetchall()
+            if not lote: return True
+            try:
+                rows = [json.loads(fila) for _, fila in lote]
+                _backend().append_movements(rows)
+            except Exception:
+                return False
+            with sp["db_lock"]:
+                sp["conn"].execute("DELETE FROM movimientos WHERE id <= ?", (lote[-1][0],))
+            _apply_delta(_delta("Movimientos", appended=rows))
 
+@_medido("alta")
 def op_alta(sheet, clave, nombre, rack_raw, qty, usuario):
     try:
-        ws = _sheet(sheet)
         clave = _clean(clave)
         rack = _normalize_rack(rack_raw)
         fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        row, current = _find_row(ws, clave, rack)
-        if row:
-            new_qty = current + qty
-            ws.update_cell(row, 4, new_qty)
-            ws.update_cell(row, 5, fecha)
-            msg = f"Stock actualizado en {rack}: {current} → {new_qty} pz."
+        for _ in range(CONFLICTO_REINTENTOS):
+            with _sheet_lock(sheet):
+                row, current = _find_row(sheet, clave, rack)
+                if row:
+                    new_qty = current + qty
+                    delta = _write_cells_if(sheet, {row: {"CANTIDAD": new_qty, "FECHA": fecha}}, {row: current})
+                    msg = f"Stock actualizado en {rack}: {current} → {new_qty} pz."
+                else:
+                    delta = _write_append(sheet, [[clave, nombre, rack, qty, fecha]])
+                    msg = f"Nuevo registro: {clave} en {rack} ({qty} pz)."
+                # El delta se aplica dentro del candado para que la siguiente lectura ya vea esta escritura
+                if delta: _apply_delta(delta); break
         else:
-            ws.append_row([clave, nombre, rack, qty, fecha])
-            msg = f"Nuevo registro: {clave} en {rack} ({qty} pz)."
+            return False, CONFLICTO_MSG
         _log_movement(clave, "Alta/Compra", f"Entrada en {rack}", qty, 0, usuario, sheet)
-        _refresh(sheet); _refresh("Movimientos")
+        _commit()
         return True, msg
     except Exception as e:
         return False, f"Error en Alta: {e}"
 
+@_medido("alta_masiva")
+def op_alta_masiva(sheet, lineas, nombre, usuario):
+    """
+    Alta masiva de un pedido: resuelve todas las filas con una sola consulta
+    al índice (CLAVE, RACK), fusiona en memoria las líneas repetidas y escribe todo en
+    bloque: un batch_update para las cantidades existentes, un append_rows para
+    los registros nuevos y un append_rows para la bitácora.
+    `lineas` es una lista de (clave_raw, cantidad, rack_raw).
+    Retorna (bool, str, list[dict]) con el resultado de cada línea.
+    """
+    resultados = [{"LINEA": i + 1, "CLAVE": _clean(c), "RACK": _normalize_rack(r), "CANTIDAD": q, "OK": False, "DETALLE": ""} for i, (c, q, r) in enumerate(lineas)]
+    try:
+        fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        # Agregado por (CLAVE, RACK) conservando el orden de aparición
+        agregados: dict[tuple[str, str], list[int]] = {}
+        for res in resultados:
+            if not res["CLAVE"]:
+                res["DETALLE"] = "Clave vacía."
+            elif res["CANTIDAD"] <= 0:
+                res["DETALLE"] = "Cantidad inválida."
+            else:
+                agregados.setdefault((res["CLAVE"], res["RACK"]), []).append(res["LINEA"] - 1)
+        if not agregados: return False, "No hay líneas válidas en el pedido.", resultados
+
+        escritas = []
+        with _sheet_lock(sheet):
+            for _ in range(CONFLICTO_REINTENTOS):
+                existentes = _find_rows(sheet, list(agregados))
+                cambios, esperado, nuevas, idx_upd, idx_new = {}, {}, [], [], []
+                for (clave, rack), idxs in agregados.items():
+                    total = sum(resultados[i]["CANTIDAD"] for i in idxs)
+                    row, current = existentes[(clave, rack)]
+                    if row:
+                        cambios[row], esperado[row] = {"CANTIDAD": current + total, "FECHA": fecha}, current
+                        idx_upd.extend(idxs)
+                    else:
+                        nuevas.append([clave, nombre, rack, total, fecha])
+                        idx_new.extend(idxs)
+                if not cambios: break
+                try:
+                    delta = _write_cells_if(sheet, cambios, esperado)
+                except Exception as e:
+                    for i in idx_upd: resultados[i]["DETALLE"] = f"Error de escritura: {e}"
+                    break
+                if delta:
+                    _apply_delta(delta)
+                    for i in idx_upd: resultados[i].update(OK=True, DETALLE="Stock actualizado.")
+                    escritas.extend(idx_upd)
+                    break
+            else:
+                for i in idx_upd: resultados[i]["DETALLE"] = CONFLICTO_MSG
+            if nuevas:
+                try:
+                    _apply_delta(_write_append(sheet, nuevas))
+                    for i in idx_new: resultados[i].update(OK=True, DETALLE="Nuevo registro.")
+                    escritas.extend(idx_new)
+                except Exception as e:
+                    for i in idx_new: resultados[i]["DETALLE"] = f"Error de escritura: {e}"
+
+        _log_movements([[fecha, resultados[i]["CLAVE"], "Alta/Compra", f"Entrada en {resultados[i]['RACK']}", resultados[i]["CANTIDAD"], 0, usuario, sheet] for i in sorted(escritas)])
+        _commit()
+        ok_count = len(escritas)
+        return ok_count > 0, f"{ok_count} de {len(resultados)} líneas registradas ({len(cambios)} actualizaciones, {len(nuevas)} registros nuevos).", resultados
+    except Exception as e:
+        for res in resultados:
+            if not res["OK"] and not res["DETALLE"]: res["DETALLE"] = f"Error en Alta: {e}"
+        return False, f"Error en Alta masiva: {e}", resultados
+
+@_medido("venta")
 def op_venta(sheet, clave, rack, detalle, qty, precio, usuario):
     try:
-        ws = _sheet(sheet)
         clave = _clean(clave)
         rack = _normalize_rack(rack)
-        row, current = _find_row(ws, clave, rack)
-        if not row: return False, f"No se encontró {clave} en {rack}."
-        if current < qty: return False, f"Stock insuficiente. Disponible: {current} pz."
-        new_qty = current - qty
-        ws.update_cell(row, 4, new_qty)
-        ws.update_cell(row, 5, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        for _ in range(CONFLICTO_REINTENTOS):
+            with _sheet_lock(sheet):
+                # Lectura fresca de la fila y escritura condicionada a la cantidad leída: dos mostradores no venden la misma pieza
+                row, current = _find_row(sheet, clave, rack)
+                if not row: return False, f"No se encontró {clave} en {rack}."
+                if current < qty: return False, f"Stock insuficiente. Disponible: {current} pz."
+                new_qty = current - qty
+                delta = _write_cells_if(sheet, {row: {"CANTIDAD": new_qty, "FECHA": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}}, {row: current})
+                if delta: _apply_delta(delta); break
+        else:
+            return False, CONFLICTO_MSG
         _log_movement(clave, "Venta/Instalación", f"{detalle} (desde {rack})", qty, precio, usuario, sheet)
-        _refresh(sheet); _refresh("Movimientos")
+        _commit()
         return True, f"Venta confirmada. Quedan {new_qty} pz en {rack}."
     except Exception as e:
         return False, f"Error en Venta: {e}"
 
+@_medido("envío_traslado")
 def op_send_transfer(sheet_origin, clave, rack, qty, dest_sheet, usuario):
+    """Descuento en origen, alta en Traslados_Pendientes y bitácora en un solo batchUpdate: todo o nada."""
     try:
-        ws = _sheet(sheet_origin)
         clave = _clean(clave)
         rack = _normalize_rack(rack)
-        row, current = _find_row(ws, clave, rack)
-        if not row: return False, f"No se encontró {clave} en {rack}."
-        if current < qty: return False, f"Stock insuficiente. Disponible: {current} pz."
-        nombre = ws.cell(row, 2).value or "Sin Nombre"
-        ws.update_cell(row, 4, current - qty)
-        fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        _sheet("Traslados_Pendientes").append_row([fecha, clave, nombre, qty, sheet_origin, dest_sheet])
-        _log_movement(clave, "Envío Traslado", f"De {sheet_origin}/{rack} → {SUCURSALES.get(dest_sheet, dest_sheet)}", qty, 0, usuario, sheet_origin)
-        _refresh(sheet_origin); _refresh("Traslados_Pendientes"); _refresh("Movimientos")
+        for _ in range(CONFLICTO_REINTENTOS):
+            with _sheet_locks(sheet_origin, "Traslados_Pendientes"):
+                row, current, nombre = _find_row_nombre(sheet_origin, clave, rack)
+                if not row: return False, f"No se encontró {clave} en {rack}."
+                if current < qty: return False, f"Stock insuficiente. Disponible: {current} pz."
+                nombre = nombre or "Sin Nombre"
+                fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                escrituras = [("update", sheet_origin, {row: {"CANTIDAD": current - qty}}),
+                              ("append", "Traslados_Pendientes", [[fecha, clave, nombre, qty, sheet_origin, dest_sheet, _nuevo_id_traslado()]])]
+                movs = [[fecha, clave, "Envío Traslado", f"De {sheet_origin}/{rack} → {SUCURSALES.get(dest_sheet, dest_sheet)}", qty, 0, usuario, sheet_origin]]
+                if _write_batch(escrituras, movs, {sheet_origin: {row: current}}): break
+        else:
+            return False, CONFLICTO_MSG
         return True, f"Traslado enviado. Quedan {current - qty} pz en {rack}."
     except Exception as e:
         return False, f"Error en traslado: {e}"
 
-def op_receive_transfer(dest_sheet, clave, nombre, qty, rack_raw, pending_row, usuario):
+def _alta_escritura(sheet, clave, nombre, rack, qty, fecha) -> tuple[tuple, dict]:
+    """Escritura de una entrada de stock para _write_batch: suma a la fila existente (condicionada) o agrega una nueva."""
+    row, current = _find_row(sheet, clave, rack)
+    if row: return ("update", sheet, {row: {"CANTIDAD": current + qty, "FECHA": fecha}}), {sheet: {row: current}}
+    return ("append", sheet, [[clave, nombre, rack, qty, fecha]]), {}
+
+@_medido("recepción_traslado")
+def op_receive_transfer(dest_sheet, clave, nombre, qty, rack_raw, traslado_id, usuario):
+    """
+    Entrada en el rack destino y baja del traslado (o descuento, si se recibe
+    sólo una parte) en un solo batchUpdate: todo o nada. El traslado se ubica
+    por su ID, así un borrado concurrente no hace recibir otra fila.
+    """
     try:
-        ok, msg = op_alta(dest_sheet, clave, nombre, rack_raw, qty, usuario)
-        if not ok: return False, msg
-        _sheet("Traslados_Pendientes").delete_rows(pending_row)
-        _log_movement(clave, "Recepción Traslado", f"Guardado en {_normalize_rack(rack_raw)}", qty, 0, usuario, dest_sheet)
-        _refresh("Traslados_Pendientes"); _refresh("Movimientos")
-        return True, f"{qty} pz de {clave} recibidas en {_normalize_rack(rack_raw)}."
+        clave, rack = _clean(clave), _normalize_rack(rack_raw)
+        for _ in range(CONFLICTO_REINTENTOS):
+            with _sheet_locks(dest_sheet, "Traslados_Pendientes"):
+                pend_row, pendiente = _find_transfer(traslado_id)
+                if not pend_row: return False, "El traslado ya no está pendiente (fue recibido o cancelado)."
+                if qty > pendiente: return False, f"Sólo quedan {pendiente} pz pendientes de este traslado."
+                parcial = qty < pendiente
+                fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                alta, esperado = _alta_escritura(dest_sheet, clave, nombre, rack, qty, fecha)
+                pend = ("update", "Traslados_Pendientes", {pend_row: {"CANTIDAD": pendiente - qty}}) if parcial else ("delete", "Traslados_Pendientes", [pend_row])
+                esperado["Traslados_Pendientes"] = {pend_row: pendiente}
+                movs = [[fecha, clave, "Alta/Compra", f"Entrada en {rack}", qty, 0, usuario, dest_sheet],
+                        [fecha, clave, "Recepción Traslado", f"Guardado en {rack}", qty, 0, usuario, dest_sheet]]
+                if _write_batch([alta, pend], movs, esperado): break
+        else:
+            return False, CONFLICTO_MSG
+        if parcial: return True, f"Ingreso parcial de {qty} pz al {rack}. Restan {pendiente - qty}."
+        return True, f"{qty} pz de {clave} recibidas en {rack}."
     except Exception as e:
         return False, f"Error al recibir traslado: {e}"
 
+@_medido("baja_traslado")
+def op_writeoff_transfer(sheet, clave, traslado_id, qty, precio, detalle, usuario):
+    """Baja inmediata (siniestro/venta) de piezas en tránsito: descuento del traslado y bitácora en un solo batchUpdate."""
+    try:
+        for _ in range(CONFLICTO_REINTENTOS):
+            with _sheet_lock("Traslados_Pendientes"):
+                pend_row, pendiente = _find_transfer(traslado_id)
+                if not pend_row: return False, "El traslado ya no está pendiente (fue recibido o cancelado)."
+                if qty > pendiente: return False, f"Sólo quedan {pendiente} pz pendientes de este traslado."
+                pend = ("update", "Traslados_Pendientes", {pend_row: {"CANTIDAD": pendiente - qty}}) if qty < pendiente else ("delete", "Traslados_Pendientes", [pend_row])
+                movs = [[datetime.now().strftime("%Y-%m-%d %H:%M:%S"), clave, "Venta/Instalación", detalle, qty, precio, usuario, sheet]]
+                if _write_batch([pend], movs, {"Traslados_Pendientes": {pend_row: pendiente}}): break
+        else:
+            return False, CONFLICTO_MSG
+        return True, "Baja total confirmada." if qty == pendiente else f"Baja parcial de {qty} pz."
+    except Exception as e:
+        return False, f"Error en baja: {e}"
+
+@_medido("cancelación_traslado")
 def op_cancel_transfer(origin_sheet, item, rack_return_raw, usuario):
+    """
+    Regreso al rack de origen de lo que sigue pendiente del traslado (ubicado
+    por su ID) y baja del traslado en un solo batchUpdate: todo o nada.
+    """
     try:
-        ws_p = _sheet("Traslados_Pendientes")
-        records = ws_p.get_all_records()
-        real_row = None
-        for i, row in enumerate(records):
-            if str(row.get("FECHA", "")) == str(item["FECHA"]) and _clean(row.get("CLAVE", "")) == _clean(item["CLAVE"]):
-                real_row = i + 2
-                break
-        if not real_row: return False, "El traslado ya fue aceptado por el destino."
-        qty = int(item["CANTIDAD"])
-        ok, msg = op_alta(origin_sheet, item["CLAVE"], item["NOMBRE"], rack_return_raw, qty, usuario)
-        if not ok: return False, f"Error al restaurar inventario: {msg}"
-        ws_p.delete_rows(real_row)
-        _log_movement(item["CLAVE"], "Cancelación Traslado", f"Regresado a {_normalize_rack(rack_return_raw)}", qty, 0, usuario, origin_sheet)
-        _refresh("Traslados_Pendientes"); _refresh("Movimientos")
+        clave, rack = _clean(item["CLAVE"]), _normalize_rack(rack_return_raw)
+        for _ in range(CONFLICTO_REINTENTOS):
+            with _sheet_locks(origin_sheet, "Traslados_Pendientes"):
+                real_row, qty = _find_transfer(str(item["ID"]))
+                if not real_row: return False, "El traslado ya fue aceptado por el destino."
+                fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                alta, esperado = _alta_escritura(origin_sheet, clave, item["NOMBRE"], rack, qty, fecha)
+                esperado["Traslados_Pendientes"] = {real_row: qty}
+                movs = [[fecha, clave, "Alta/Compra", f"Entrada en {rack}", qty, 0, usuario, origin_sheet],
+                        [fecha, clave, "Cancelación Traslado", f"Regresado a {rack}", qty, 0, usuario, origin_sheet]]
+                if _write_batch([alta, ("delete", "Traslados_Pendientes", [real_row])], movs, esperado): break
+        else:
+            return False, CONFLICTO_MSG
         return True, "Traslado cancelado. Material restaurado al inventario."
     except Exception as e:
         return False, f"Error al cancelar: {e}"
 
+@_medido("reubicación")
 def op_relocate(sheet, clave, nombre, rack_origin_raw, rack_dest_raw, qty, usuario):
     try:
         clave = _clean(clave)
         rack_origin = _normalize_rack(rack_origin_raw)
         rack_dest = _normalize_rack(rack_dest_raw)
         if rack_origin == rack_dest: return False, "El rack de destino es igual al de origen."
-        ws = _sheet(sheet)
-        row_o, qty_o = _find_row(ws, clave, rack_origin)
-        if not row_o: return False, "No se encontró el artículo origen."
-        if qty_o < qty: return False, f"Cantidad insuficiente en origen ({qty_o} pz)."
-        ws.update_cell(row_o, 4, qty_o - qty)
-        row_d, qty_d = _find_row(ws, clave, rack_dest)
-        if row_d:
-            ws.update_cell(row_d, 4, qty_d + qty)
+        for _ in range(CONFLICTO_REINTENTOS):
+            with _sheet_lock(sheet):
+                filas = _find_rows(sheet, [(clave, rack_origin), (clave, rack_dest)])
+                row_o, qty_o = filas[(clave, rack_origin)]
+                if not row_o: return False, "No se encontró el artículo origen."
+                if qty_o < qty: return False, f"Cantidad insuficiente en origen ({qty_o} pz)."
+                row_d, qty_d = filas[(clave, rack_dest)]
+                fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                # Ambos racks (o el descuento y la fila nueva) y la bitácora en un solo lote condicionado
+                if row_d:
+                    escrituras, esperado = [("update", sheet, {row_o: {"CANTIDAD": qty_o - qty}, row_d: {"CANTIDAD": qty_d + qty}})], {row_o: qty_o, row_d: qty_d}
+                else:
+                    escrituras, esperado = [("update", sheet, {row_o: {"CANTIDAD": qty_o - qty}}), ("append", sheet, [[clave, nombre, rack_dest, qty, fecha]])], {row_o: qty_o}
+                movs = [[fecha, clave, "Reubicación Interna", f"De {rack_origin} → {rack_dest}", qty, 0, usuario, sheet]]
+                if _write_batch(escrituras, movs, {sheet: esperado}): break
         else:
-            fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            ws.append_row([clave, nombre, rack_dest, qty, fecha])
-        _log_movement(clave, "Reubicación Interna", f"De {rack_origin} → {rack_dest}", qty, 0, usuario, sheet)
-        _refresh(sheet); _refresh("Movimientos")
+            return False, CONFLICTO_MSG
         return True, f"{qty} pz de {clave} movidas a {rack_dest}."
     except Exception as e:
         return False, f"Error en reubicación: {e}"
 
+def _plan_consolidacion(df: pd.DataFrame) -> pd.DataFrame:
+    """Hoja consolidada: una fila por CLAVE + RACK con la suma de cantidades (NOMBRE y FECHA de la última)."""
+    return df.groupby(["CLAVE", "RACK"], as_index=False).agg({"NOMBRE": "last", "CANTIDAD": "sum", "FECHA": "last"})[["CLAVE", "NOMBRE", "RACK", "CANTIDAD", "FECHA"]]
+
+def _plan_duplicados_cero(df: pd.DataFrame) -> list[int]:
+    """Filas (numeración de Sheets) con 0 piezas cuyo par CLAVE + RACK tiene otra fila con stock."""
+    con_stock = (df["CANTIDAD"] > 0).groupby([df["CLAVE"], df["RACK"]]).transform("any")
+    return (df.index[(df["CANTIDAD"] == 0) & con_stock] + 2).tolist()
+
+@_medido("consolidar_duplicados")
 def op_clean_duplicates(sheet):
+    """
+    Consolida las filas con la misma CLAVE + RACK (suma de cantidades) y
+    reescribe la hoja con un solo reemplazo de rango: valores nuevos desde A1
+    y filas sobrantes borradas en la misma petición.
+    """
     try:
-        ws = _sheet(sheet)
-        records = ws.get_all_records()
-        df = pd.DataFrame(records)
-        if df.empty: return True, "La hoja está vacía."
-        df["CLAVE"] = df["CLAVE"].apply(_clean)
-        df["RACK"] = df["RACK"].apply(_normalize_rack)
-        df["CANTIDAD"] = pd.to_numeric(df["CANTIDAD"], errors="coerce").fillna(0).astype(int)
-        before = len(df)
-        df_c = (df.groupby(["CLAVE", "RACK"], as_index=False).agg({"NOMBRE": "last", "CANTIDAD": "sum", "FECHA": "last"}))[["CLAVE", "NOMBRE", "RACK", "CANTIDAD", "FECHA"]]
-        removed = before - len(df_c)
-        if removed <= 0: return True, "Sin duplicados. La hoja ya está limpia."
-        ws.clear()
-        ws.update([df_c.columns.tolist()] + df_c.values.tolist())
-        _refresh(sheet)
+        with _sheet_lock(sheet):
+            df = _load_df(sheet)
+            if df.empty: return True, "La hoja está vacía."
+            before = len(df)
+            df_c = _plan_consolidacion(df)
+            removed = before - len(df_c)
+            if removed <= 0:
+                _cache_put(sheet, df)
+                return True, "Sin duplicados. La hoja ya está limpia."
+            _backend().replace_table(sheet, [df_c.columns.tolist()] + _a_valores(df_c), previas=before + 1)
+            # Lo escrito es df_c: se publica tal cual, sin volver a descargar la hoja
+            _publicar_carga(sheet, _normalize_df(df_c.reset_index(drop=True)))
         return True, f"{removed} filas duplicadas consolidadas. Racks normalizados."
     except Exception as e:
         return False, f"Error en limpieza: {e}"
@@ -382,50 +2359,279 @@ def op_clean_duplicates(sheet):
 # MEJORA 1b: LIMPIEZA DE DUPLICADOS CON 0 PIEZAS
 # ═══════════════════════════════════════════════════════════════════════════
 
-def limpiar_duplicados_cero(ws_inventario):
+@_medido("limpiar_duplicados_cero")
+def limpiar_duplicados_cero(sheet):
     """
-    Busca filas duplicadas (misma CLAVE + RACK + SUCURSAL) cuya CANTIDAD
-    sea 0 y las elimina de Google Sheets borrando de abajo hacia arriba
-    para no desplazar índices durante la eliminación.
+    Busca filas duplicadas (misma CLAVE + RACK) cuya CANTIDAD sea 0 cuando
+    el mismo par tiene otra fila con stock, y las elimina: los tramos
+    contiguos se borran juntos en una sola petición al backend.
     Retorna (bool, str) con el resultado de la operación.
     """
     try:
-        records = ws_inventario.get_all_records()
-        if not records:
-            return True, "La hoja está vacía. No hay nada que limpiar."
-
-        df = pd.DataFrame(records)
-        df["_row"] = range(2, len(df) + 2)  # índice de fila real en Google Sheets (1-based + encabezado)
-        df["CLAVE"] = df["CLAVE"].apply(_clean)
-        df["RACK"] = df["RACK"].apply(_normalize_rack)
-        df["CANTIDAD"] = pd.to_numeric(df["CANTIDAD"], errors="coerce").fillna(0).astype(int)
-
-        # Identificar grupos duplicados (misma CLAVE + RACK)
-        # Dentro de cada grupo, marcar como "candidata a borrar" la fila con CANTIDAD == 0
-        # si en ese grupo existe al menos una fila con CANTIDAD > 0
-        filas_a_borrar = []
-        grupos = df.groupby(["CLAVE", "RACK"])
-        for _, grupo in grupos:
-            if len(grupo) > 1:
-                # Hay duplicados en este par CLAVE-RACK
-                con_stock = grupo[grupo["CANTIDAD"] > 0]
-                sin_stock = grupo[grupo["CANTIDAD"] == 0]
-                if not con_stock.empty and not sin_stock.empty:
-                    # Sólo eliminamos las de 0 si hay al menos una con stock
-                    filas_a_borrar.extend(sin_stock["_row"].tolist())
-
-        if not filas_a_borrar:
-            return True, "No se encontraron duplicados con 0 piezas eliminables."
-
-        # Borrar de abajo hacia arriba para no correr los índices
-        for row_idx in sorted(filas_a_borrar, reverse=True):
-            ws_inventario.delete_rows(row_idx)
+        with _sheet_lock(sheet):
+            df = _load_df(sheet)
+            if df.empty:
+                return True, "La hoja está vacía. No hay nada que limpiar."
+            # Ya se descargó la hoja completa: se publica como copia vigente antes de borrar
+            _cache_put(sheet, df)
+
+            # Sólo se eliminan las de 0 si en su par CLAVE-RACK hay al menos una con stock
+            filas_a_borrar = _plan_duplicados_cero(df)
+
+            if not filas_a_borrar:
+                return True, "No se encontraron duplicados con 0 piezas eliminables."
+
+            _commit(_write_delete(sheet, filas_a_borrar))
 
         return True, f"{len(filas_a_borrar)} fila(s) duplicada(s) con 0 piezas eliminada(s) correctamente."
     except Exception as e:
         return False, f"Error en limpiar_duplicados_cero: {e}"
 
 
+# ═══════════════════════════════════════════════════════════════════════════
+# ARCHIVO DE LA BITÁCORA (PARTICIONES MENSUALES)
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _mov_particiones() -> list[str]:
+    """Particiones archivadas 'Movimientos_AAAA_MM', de la más reciente a la más antigua."""
+    return sorted((n for n in _backend().table_names("Movimientos_") if re.fullmatch(r"Movimientos_\d{4}_\d{2}", n)), reverse=True)
+
+@_medido("archivar_movimientos")
+def archivar_movimientos(dias: int = MOV_VENTANA_DIAS):
+    """
+    Mueve los movimientos con más de `dias` de antigüedad de la hoja viva a su
+    partición mensual 'Movimientos_AAAA_MM'. Sólo se archiva el prefijo
+    cronológico de la hoja (las filas siempre se agregan al final), así el
+    borrado es un único tramo contiguo. Si un intento anterior copió filas
+    pero no alcanzó a borrarlas, las que ya están en la partición no se
+    duplican. Todo ocurre bajo el candado de la hoja (el botón, otras sesiones
+    y otros procesos se turnan) y el borrado se condiciona a que el prefijo
+    siga siendo el copiado. Retorna (bool, str).
+    """
+    try:
+        with _sheet_lock("Movimientos"):
+            df = _load_df("Movimientos")
+            _cache_put("Movimientos", df)
+            if df.empty or "FECHA" not in df.columns:
+                return True, "La bitácora está vacía. No hay nada que archivar."
+            fechas = df["FECHA"].astype(str).str.slice(0, 10)
+            corte = (datetime.now() - timedelta(days=dias)).strftime("%Y-%m-%d")
+            viejas = fechas.str.fullmatch(r"\d{4}-\d{2}-\d{2}") & (fechas < corte)
+            k = int(viejas.cumprod().sum())  # longitud del prefijo de filas antiguas
+            if k == 0:
+                return True, f"No hay movimientos anteriores a {corte} para archivar."
+
+            bloque = df.iloc[:k]
+            rows = _a_valores(bloque[_headers("Movimientos")])
+            meses = fechas.iloc[:k].str.slice(0, 7).str.replace("-", "_")
+            existentes = set(_mov_particiones())
+            for mes in sorted(meses.unique()):
+                nombre = f"Movimientos_{mes}"
+                nuevas = [r for r, m in zip(rows, meses) if m == mes]
+                if nombre in existentes:
+                    # Reintento idempotente: descontar las filas que ya se copiaron
+                    ya = Counter(tuple(map(str, r)) for r in _a_valores(_backend().load_table(nombre)))
+                    pendientes = []
+                    for r in nuevas:
+                        t = tuple(map(str, r))
+                        if ya[t]: ya[t] -= 1
+                        else: pendientes.append(r)
+                    nuevas = pendientes
+                else:
+                    _backend().ensure_table(nombre)
+                if nuevas: _backend().append_rows(nombre, nuevas)
+                _cache_drop(nombre)
+            _load_particion.clear(); _filas_particion.clear()
+            # Borrado condicionado: la primera y la última fila del tramo siguen siendo las copiadas
+            if not all(_fila_igual("Movimientos", f, rows[f - 2]) for f in (2, k + 1)):
+                _refresh("Movimientos")
+                return False, "La bitácora cambió mientras se archivaba; no se borró nada. Intenta de nuevo (lo ya copiado no se duplica)."
+            _commit(_write_delete("Movimientos", range(2, k + 2)))
+        return True, f"{k} movimiento(s) anteriores a {corte} archivados en {meses.nunique()} partición(es) mensual(es)."
+    except Exception as e:
+        return False, f"Error al archivar movimientos: {e}"
+
+def _fila_igual(sheet_name: str, fila: int, valores: list) -> bool:
+    """Relectura de una fila de la hoja: True si sus celdas coinciden con `valores` (comparadas como texto)."""
+    r = _backend().read_rows(sheet_name, fila, fila)
+    return len(r) == 1 and list(map(str, _a_valores(r[_headers(sheet_name)])[0])) == list(map(str, valores))
+
+@st.cache_resource
+def _archivo_estado() -> dict:
+    return {"lock": threading.Lock(), "ultimo": 0.0, "resultado": None}
+
+def _archivar_si_toca():
+    """Archivo automático: como mucho una vez cada ARCHIVO_REVISION_SEG por proceso, en segundo plano."""
+    estado = _archivo_estado()
+    if time.time() - estado["ultimo"] < ARCHIVO_REVISION_SEG or not estado["lock"].acquire(blocking=False): return
+    estado["ultimo"] = time.time()
+    def run():
+        try:
+            estado["resultado"] = archivar_movimientos()
+        finally:
+            estado["lock"].release()
+    threading.Thread(target=run, daemon=True).start()
+
+@st.cache_data(ttl=RECONCILIACION_SEG, show_spinner=False)
+def _load_particion(nombre: str) -> pd.DataFrame:
+    return _load_df(nombre)
+
+@st.cache_data(ttl=RECONCILIACION_SEG, show_spinner=False)
+def _filas_particion(nombre: str) -> int:
+    return _backend().count_rows(nombre)
+
+def _filtrar_movimientos(df: pd.DataFrame, tipo: str, sucursal: str) -> pd.DataFrame:
+    # Comparación sobre los códigos de categoría y una sola selección de filas
+    sel = pd.Series(True, index=df.index)
+    if "TIPO" in df.columns and tipo != "Todos": sel &= df["TIPO"] == tipo
+    if "SUCURSAL" in df.columns and sucursal != "Todas": sel &= df["SUCURSAL"] == sucursal
+    return df if sel.all() else df[sel]
+
+def _pagina_historial(segmentos: list[tuple[str, pd.DataFrame | None, int]], ini: int, fin: int) -> pd.DataFrame:
+    """
+    Filas ini..fin-1 de la bitácora vista como una sola tabla cronológica
+    hecha de `segmentos` (hoja, frame en memoria o None, filas), del más
+    antiguo al más reciente. Sólo se leen los segmentos que la página toca;
+    los que no están en memoria, por rango de filas.
+    """
+    partes, base = [], 0
+    for nombre, df, n in segmentos:
+        a, b = max(ini, base), min(fin, base + n)
+        # Filas a..b-1 del segmento = filas a+2..b+1 de su hoja
+        if a < b: partes.append(_backend().read_rows(nombre, a - base + 2, b - base + 1) if df is None else df.iloc[a - base:b - base])
+        base += n
+    return partes[0] if len(partes) == 1 else pd.concat([p.astype(object) for p in partes], ignore_index=True)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# IMPORTACIÓN DE PEDIDOS DESDE ARCHIVO (CSV / XLSX)
+# ═══════════════════════════════════════════════════════════════════════════
+# El manifiesto del proveedor se lee por bloques (nunca completo en memoria),
+# se valida y se agrega por (CLAVE, RACK) antes de tocar Sheets, y se escribe
+# en lotes de PEDIDO_LOTE claves: cada lote es un op_alta_masiva, así que las
+# llamadas a la API crecen con las claves distintas, no con las líneas.
+
+def _tablas_manifiesto(archivo, nombre: str, bloque: int = PEDIDO_BLOQUE):
+    """
+    Genera el archivo en DataFrames de a lo más `bloque` filas, todo como
+    texto y sin cargarlo completo: el CSV con el lector en C de pandas por
+    trozos (separador detectado en la primera muestra) y el XLSX con openpyxl
+    en modo de sólo lectura.
+    """
+    if nombre.lower().endswith((".xlsx", ".xlsm")):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError("Para leer archivos .xlsx instala openpyxl (pip install openpyxl) o guarda el pedido como CSV.")
+        libro = load_workbook(archivo, read_only=True, data_only=True)
+        try:
+            filas = []
+            for fila in libro.worksheets[0].iter_rows(values_only=True):
+                filas.append(["" if v is None else str(int(v)) if isinstance(v, float) and v.is_integer() else str(v) for v in fila])
+                if len(filas) >= bloque:
+                    yield pd.DataFrame(filas)
+                    filas = []
+            if filas: yield pd.DataFrame(filas)
+        finally:
+            libro.close()
+        return
+    muestra = archivo.read(8192).decode("utf-8-sig", errors="replace")
+    archivo.seek(0)
+    try: sep = csv.Sniffer().sniff(muestra, delimiters=",;\t|").delimiter
+    except csv.Error: sep = ","
+    # Las filas cortas (sólo CLAVE) se completan y se conservan las columnas de la muestra (mínimo 3).
+    # El lector en C falla con una fila más ancha que `names`, así que el ancho leído es el de la fila con
+    # más separadores de todo el archivo (contar los entrecomillados sólo agrega columnas vacías) y lo que
+    # sobra de la muestra se descarta por bloque.
+    ancho = max(max((len(f) for f in csv.reader(muestra.splitlines()[:200], delimiter=sep)), default=1), 3)
+    maximo = max((linea.count(sep.encode()) + 1 for linea in archivo), default=1)
+    archivo.seek(0)
+    with pd.read_csv(archivo, sep=sep, header=None, names=range(max(maximo, ancho)), dtype=str, keep_default_na=False, skipinitialspace=True,
+                     encoding="utf-8-sig", encoding_errors="replace", chunksize=bloque) as lector:
+        for tabla in lector: yield tabla.iloc[:, :ancho] if tabla.shape[1] > ancho else tabla
+
+def _bloques_pedido(tablas, rack_comun: str):
+    """
+    Convierte cada tabla cruda en líneas LINEA/CLAVE_RAW/CANT_RAW/RACK_RAW.
+    Si la primera fila trae CLAVE (y opcionalmente CANTIDAD y RACK) se usa como
+    encabezado; si no, las columnas son posicionales como en la lista pegada.
+    """
+    pos, vistas = (0, 1, 2), 0
+    for tabla in tablas:
+        tabla = tabla.fillna("").astype(str)
+        tabla.index = pd.RangeIndex(vistas + 1, vistas + len(tabla) + 1, name="LINEA")
+        tabla.columns = range(tabla.shape[1])
+        primera, vistas = vistas == 0, vistas + len(tabla)
+        if primera and len(tabla):
+            head = [_clean(c) for c in tabla.iloc[0]]
+            if "CLAVE" in head:
+                pos = tuple(head.index(c) if c in head else None for c in ("CLAVE", "CANTIDAD", "RACK"))
+                tabla = tabla.iloc[1:]
+        col = lambda i: tabla[i].str.strip() if i is not None and i in tabla else pd.Series("", index=tabla.index, dtype=str)
+        df = pd.DataFrame({"CLAVE_RAW": col(pos[0]), "CANT_RAW": col(pos[1]), "RACK_RAW": col(pos[2])}).reset_index()
+        df = df[df["CLAVE_RAW"].ne("") | df["CANT_RAW"].ne("")]
+        df["RACK_RAW"] = df["RACK_RAW"].mask(df["RACK_RAW"].eq(""), rack_comun)
+        if len(df): yield df
+
+def _agregar_pedido(bloques) -> tuple[pd.DataFrame, dict]:
+    """
+    Valida y agrega por (CLAVE, RACK) bloque por bloque, en orden de aparición.
+    Cada bloque se normaliza vectorizado y se agrupa; el acumulado es un dict
+    por clave, así que la memoria depende de las claves distintas y no del
+    largo del archivo. Las líneas inválidas se cuentan y se conservan sólo las
+    primeras PEDIDO_ERRORES_MAX para mostrarlas.
+    Retorna (DataFrame LINEA/CLAVE/RACK/CANTIDAD/LINEAS, resumen); LINEA es la
+    primera línea del archivo con esa clave y rack.
+    """
+    acumulado: dict[tuple[str, str], list[int]] = {}
+    errores, leidas, invalidas = [], 0, 0
+    for df in bloques:
+        leidas += len(df)
+        clave = _clean_series(df["CLAVE_RAW"])
+        cant = pd.to_numeric(df["CANT_RAW"].replace("", "1"), errors="coerce")
+        ok = clave.ne("") & cant.gt(0) & cant.mod(1).eq(0)
+        if not ok.all():
+            malas = df[~ok]
+            invalidas += len(malas)
+            for linea, c, q in malas[["LINEA", "CLAVE_RAW", "CANT_RAW"]].head(PEDIDO_ERRORES_MAX - len(errores)).itertuples(index=False):
+                errores.append({"LINEA": linea, "CLAVE": c, "CANTIDAD": q, "DETALLE": "Clave vacía." if not _clean(c) else "Cantidad inválida."})
+        parte = pd.DataFrame({"CLAVE": clave[ok], "RACK": _normalize_rack_series(df.loc[ok, "RACK_RAW"]), "CANTIDAD": cant[ok].astype("int64"), "LINEA": df.loc[ok, "LINEA"]})
+        parte = parte.groupby(["CLAVE", "RACK"], sort=False).agg(q=("CANTIDAD", "sum"), n=("CANTIDAD", "size"), linea=("LINEA", "first"))
+        for k, q, n, linea in zip(parte.index, parte["q"].tolist(), parte["n"].tolist(), parte["linea"].tolist()):
+            a = acumulado.setdefault(k, [0, 0, linea])
+            a[0] += q
+            a[1] += n
+    agregado = pd.DataFrame([(linea, c, r, q, n) for (c, r), (q, n, linea) in acumulado.items()], columns=["LINEA", "CLAVE", "RACK", "CANTIDAD", "LINEAS"])
+    return agregado, {"leidas": leidas, "invalidas": invalidas, "errores": errores}
+
+@_medido("importar_pedido")
+def op_importar_pedido(sheet, agregado: pd.DataFrame, nombre, usuario, avance=None):
+    """
+    Escribe un pedido ya agregado en lotes de PEDIDO_LOTE claves (un
+    op_alta_masiva por lote). `avance(fraccion, texto)` se llama tras cada lote.
+    Retorna (bool, str, list[dict]) con las claves que no se registraron (con
+    la LINEA del archivo donde aparecen), incluidas las que no se alcanzaron a
+    procesar si hubo un error.
+    """
+    total, registradas, fallidas, hechas = len(agregado), 0, [], 0
+    try:
+        for inicio in range(0, total, PEDIDO_LOTE):
+            lote = agregado.iloc[inicio:inicio + PEDIDO_LOTE]
+            _, _, resultados = op_alta_masiva(sheet, list(zip(lote["CLAVE"], lote["CANTIDAD"].astype(int), lote["RACK"])), nombre, usuario)
+            # LINEA de op_alta_masiva es la posición dentro del lote; se traduce a la línea del archivo
+            lineas = lote["LINEA"].tolist()
+            registradas += sum(r["OK"] for r in resultados)
+            fallidas += [{**r, "LINEA": lineas[r["LINEA"] - 1]} for r in resultados if not r["OK"]]
+            hechas = inicio + len(lote)
+            if avance: avance(hechas / total, f"{hechas:,} de {total:,} claves")
+        return registradas > 0, f"{registradas:,} de {total:,} claves registradas ({int(agregado['CANTIDAD'].sum()):,} piezas en {-(-total // PEDIDO_LOTE)} lote(s)).", fallidas
+    except Exception as e:
+        resto = agregado.iloc[hechas:]
+        fallidas += [{"LINEA": l, "CLAVE": c, "RACK": r, "CANTIDAD": q, "OK": False, "DETALLE": f"No se procesó: {e}"}
+                     for l, c, r, q in zip(resto["LINEA"].tolist(), resto["CLAVE"], resto["RACK"], resto["CANTIDAD"].tolist())]
+        return False, f"Error al importar el pedido ({registradas:,} de {total:,} claves registradas): {e}", fallidas
+
+
 # ═══════════════════════════════════════════════════════════════════════════
 # HELPERS DE UI
 # ═══════════════════════════════════════════════════════════════════════════
@@ -486,6 +2692,7 @@ SECTION_LABELS: dict[str, str] = {
     "pedidos": "📋 Pedidos",
     "express": "⚡ Operación Express",    # MEJORA 2: nueva sección
     "auditoria": "📜 Auditoría",
+    "diagnostico": "🩺 Diagnóstico",
 }
 
 def ui_sidebar() -> tuple[str, str]:
@@ -503,14 +2710,26 @@ def ui_sidebar() -> tuple[str, str]:
             active_sheet = own_sheet
             st.markdown(f'<div class="sb-suc-label">🏢 Sucursal asignada</div><div class="sb-suc-name">{SUCURSALES.get(active_sheet, active_sheet)}</div>', unsafe_allow_html=True)
 
+        if "_load_info" in st.session_state:
+            seg, n_hojas = st.session_state["_load_info"]
+            st.caption(f"⏱️ Última sincronización: {seg:.2f} s · {n_hojas} hoja(s) descargada(s)")
+        if _instantaneas()["sincronizando"]:
+            st.caption(f"🗂️ {len(_instantaneas()['sincronizando'])} hoja(s) desde la copia local, poniéndose al día con Sheets…")
+        pendientes = _spool_pendientes()
+        if pendientes:
+            st.caption(f"📝 {pendientes} movimiento(s) en cola local, pendientes de enviar a Sheets")
+        espejo, _ = _backend().espejo_pendientes()
+        if espejo:
+            st.caption(f"🪞 {espejo} escritura(s) locales pendientes de replicar en Sheets")
         st.markdown(f'<div class="sb-user-chip"><div><div class="sb-user-name">👤 {user}</div><div class="sb-user-rol" style="color:{"#818CF8" if rol == "admin" else "#A7F3D0"}">{rol}</div></div></div>', unsafe_allow_html=True)
         st.markdown("---")
 
         # 🚨 CANDADO DE SEGURIDAD CORREGIDO: Ocultar Auditoría a usuarios regulares
         visible_sections = list(SECTION_LABELS.keys())
         if rol != "admin":
-            if "auditoria" in visible_sections:
-                visible_sections.remove("auditoria")
+            for solo_admin in ("auditoria", "diagnostico"):
+                if solo_admin in visible_sections:
+                    visible_sections.remove(solo_admin)
 
         seccion = st.radio(
             "Navegación Modular",
@@ -519,6 +2738,9 @@ def ui_sidebar() -> tuple[str, str]:
         )
 
         st.markdown("<br><br><br>", unsafe_allow_html=True)
+        if st.button("🔄 Sincronizar con Sheets", use_container_width=True):
+            _reconcile()
+            st.rerun()
         if st.button("🚪 Cerrar Sesión", use_container_width=True):
             st.session_state.clear()
             st.rerun()
@@ -533,12 +2755,9 @@ def ui_dashboard(sheet: str, rol: str):
     nombre_suc = SUCURSALES.get(sheet, sheet)
     _page_header("📊", f"Panel de Control — {nombre_suc}", "Visualización analítica integral y catálogo en tiempo real.")
 
-    df_all = _get_df(sheet)
-    df_pending = _get_df("Traslados_Pendientes")
-
-    total_qty = int(df_all["CANTIDAD"].sum()) if not df_all.empty else 0
-    unique_keys = int(df_all["CLAVE"].nunique()) if not df_all.empty else 0
-    pending_in = len(df_pending[df_pending["DESTINO"] == sheet]) if not df_pending.empty and "DESTINO" in df_pending.columns else 0
+    total_qty, unique_keys = _derivado(sheet, "kpis", lambda df: (int(df["CANTIDAD"].sum()), int(df["CLAVE"].nunique())) if not df.empty else (0, 0))
+    pending_in = _derivado("Traslados_Pendientes", ("por_recibir", sheet),
+                           lambda df: int((df["DESTINO"] == sheet).sum()) if not df.empty and "DESTINO" in df.columns else 0)
 
     c1, c2, c3 = st.columns(3)
     with c1: _kpi("📦", "Total de Cristales en Stock", f"{total_qty:,}", "unidades con existencias reales")
@@ -557,42 +2776,51 @@ def ui_dashboard(sheet: str, rol: str):
             with col_clean2:
                 if st.button("🗑️ Eliminar Duplicados con 0 Piezas", type="primary"):
                     # MEJORA 1b: limpiar filas con 0 piezas que son duplicados de otra con stock
-                    ws_inv = _sheet(sheet)
-                    ok, msg = limpiar_duplicados_cero(ws_inv)
-                    if ok:
-                        _ok(msg)
-                        _refresh(sheet)
-                    else:
-                        _err(msg)
+                    ok, msg = limpiar_duplicados_cero(sheet)
+                    _ok(msg) if ok else _err(msg)
+        with st.expander("🌐 Existencias en la Red — Todas las Sucursales"):
+            _ui_red()
 
-    if df_all.empty:
+    if _get_df(sheet).empty:
         st.info("No hay productos registrados en esta sucursal.")
         return
 
     _section("📋 Inventario Total (Con y Sin Existencia)")
+    _ui_inventario(sheet)
+
+# Regiones con rerun propio (st.fragment): teclear en un filtro o mover un
+# selector sólo vuelve a correr su región, sin reinyectar el CSS, rearmar la
+# barra lateral ni reenviar las tablas de las demás. Una operación exitosa
+# llama a st.rerun() para refrescar toda la página con los datos nuevos.
+
+@st.fragment
+def _ui_red():
+    clave_red = _clean(st.text_input("Clave a localizar:", placeholder="Ej: FW75", key="red_clave"))
+    matriz = _matriz_stock()
+    if clave_red: matriz = matriz[matriz["CLAVE"].str.contains(clave_red, regex=False)]
+    st.caption(f"{len(matriz):,} claves con existencia en la red.")
+    st.dataframe(matriz, use_container_width=True, hide_index=True)
+    if clave_red and (matriz["CLAVE"] == clave_red).any():
+        st.markdown(f"**{clave_red} por rack:** {_red_texto(clave_red)}")
+
+@st.fragment
+def _ui_inventario(sheet: str):
     with st.container(border=True):
         filtro = st.text_input("Buscar en inventario:", placeholder="Ej: 75, FW, Rack...", key="wh_filter").strip().upper()
-        df_view = df_all.copy()
-        if filtro:
-            mask = df_view.astype(str).apply(lambda col: col.str.contains(filtro, case=False, na=False)).any(axis=1)
-            df_view = df_view[mask]
-        
-        if df_view.empty:
+        # Llave de búsqueda y categorías precalculadas por versión de datos: cada tecla es un filtro sobre una sola columna
+        df_all, busq = _get_search(sheet)
+        mask = _search_mask(busq, filtro) if filtro else None
+
+        if mask is not None and not mask.any():
             st.warning(f"Sin resultados para la búsqueda: '{filtro}'")
             return
-            
+
         cfg = _stock_column_config()
         tab_pb, tab_med, tab_otros = st.tabs(["🚘 Parabrisas", "🔙 Medallones", "🚪 Otros"])
-
-        with tab_pb:
-            d = df_view[df_view["NOMBRE"].str.contains("Parabrisas", case=False, na=False)]
-            st.dataframe(d[["CLAVE", "NOMBRE", "RACK", "CANTIDAD"]], use_container_width=True, hide_index=True, column_config=cfg)
-        with tab_med:
-            d = df_view[df_view["NOMBRE"].str.contains("Medallón", case=False, na=False)]
-            st.dataframe(d[["CLAVE", "NOMBRE", "RACK", "CANTIDAD"]], use_container_width=True, hide_index=True, column_config=cfg)
-        with tab_otros:
-            d = df_view[~df_view["NOMBRE"].str.contains("Parabrisas|Medallón", case=False, na=False)]
-            st.dataframe(d[["CLAVE", "NOMBRE", "RACK", "CANTIDAD"]], use_container_width=True, hide_index=True, column_config=cfg)
+        for tab, cat in ((tab_pb, "pb"), (tab_med, "med"), (tab_otros, "otros")):
+            with tab:
+                sel = busq[cat] if mask is None else busq[cat] & mask
+                st.dataframe(df_all.loc[sel, ["CLAVE", "NOMBRE", "RACK", "CANTIDAD"]], use_container_width=True, hide_index=True, column_config=cfg)
 
 # ═══════════════════════════════════════════════════════════════════════════
 # MODULO 2: CENTRO DE OPERACIONES
@@ -602,107 +2830,114 @@ def ui_operations(sheet: str, usuario: str):
     nombre_suc = SUCURSALES.get(sheet, sheet)
     _page_header("🔄", f"Centro de Operaciones — {nombre_suc}", "Módulo de transacciones inmediatas: Compras, Ventas e Intercambios.")
 
-    df_stock = _get_df_stock(sheet)
     tab_alta, tab_baja = st.tabs(["📥 Registrar Entrada (Alta/Compra)", "📤 Transaccionar Existencias (Ventas / Traslados / Ajustes)"])
+    with tab_alta: _ui_alta(sheet, usuario)
+    with tab_baja: _ui_salida(sheet, usuario)
+
+@st.fragment
+def _ui_alta(sheet: str, usuario: str):
+    _section("Nueva Entrada de Mercancía a Almacén")
+    with st.form("form_alta", clear_on_submit=True):
+        c1, c2, c3, c4 = st.columns([1.5, 1, 1, 0.8])
+        clave_in = c1.text_input("Clave del Cristal").upper().strip()
+        tipo_in = c2.selectbox("Tipo de Pieza", TIPOS_PIEZA)
+        rack_in = c3.text_input("Rack / Ubicación", value="PISO").strip()
+        qty_in = c4.number_input("Cantidad", min_value=1, max_value=999, value=1)
+        _rack_tag(rack_in)
+        if st.form_submit_button("💾 Confirmar Entrada", type="primary"):
+            if not clave_in: st.warning("⚠️ La clave es obligatoria.")
+            else:
+                ok, msg = op_alta(sheet, clave_in, tipo_in, rack_in, qty_in, usuario)
+                if ok: _ok(msg); time.sleep(0.4); st.rerun()
+                else: _err(msg)
 
-    with tab_alta:
-        _section("Nueva Entrada de Mercancía a Almacén")
-        with st.form("form_alta", clear_on_submit=True):
-            c1, c2, c3, c4 = st.columns([1.5, 1, 1, 0.8])
-            clave_in = c1.text_input("Clave del Cristal").upper().strip()
-            tipo_in = c2.selectbox("Tipo de Pieza", TIPOS_PIEZA)
-            rack_in = c3.text_input("Rack / Ubicación", value="PISO").strip()
-            qty_in = c4.number_input("Cantidad", min_value=1, max_value=999, value=1)
-            _rack_tag(rack_in)
-            if st.form_submit_button("💾 Confirmar Entrada", type="primary"):
-                if not clave_in: st.warning("⚠️ La clave es obligatoria.")
-                else:
-                    ok, msg = op_alta(sheet, clave_in, tipo_in, rack_in, qty_in, usuario)
-                    if ok: _ok(msg); time.sleep(0.4); st.rerun()
-                    else: _err(msg)
-
-    with tab_baja:
-        _section("Buscador de Existencias para Salida")
-        with st.container(border=True):
-            col_search, col_match = st.columns([1.4, 1])
-            with col_search:
-                term = st.text_input("🔍 Buscar pieza para Operación (clave con stock activo)", placeholder="Ej: 756 · FW75 · JEEP", key="ops_search").strip()
-                if not term:
-                    with col_match: st.caption("💡 Escribe al menos 2 caracteres.")
-                    return
-
-            found = _search_keys(df_stock, term)
-            if not found:
-                with col_match: st.warning(f"Sin stock para **'{term.upper()}'**.")
+@st.fragment
+def _ui_salida(sheet: str, usuario: str):
+    _section("Buscador de Existencias para Salida")
+    with st.container(border=True):
+        col_search, col_match = st.columns([1.4, 1])
+        with col_search:
+            term = st.text_input("🔍 Buscar pieza para Operación (clave con stock activo)", placeholder="Ej: 756 · FW75 · JEEP", key="ops_search").strip()
+            if not term:
+                with col_match: st.caption("💡 Escribe al menos 2 caracteres.")
                 return
 
-            with col_match:
-                if len(found) == 1: clave_sel = found[0]; st.success(f"✅ {clave_sel}")
-                else: clave_sel = st.selectbox(f"{len(found)} coincidencias:", found, key="ops_key")
-
-            nombre_disp = ""
-            info_row = df_stock[df_stock["CLAVE"] == clave_sel]
-            if not info_row.empty: nombre_disp = info_row.iloc[0]["NOMBRE"]
-
-            st.markdown(f'<div class="prod-info"><span class="prod-clave">{clave_sel}</span><span class="prod-nombre">{nombre_disp or "Sin descripción"}</span></div>', unsafe_allow_html=True)
-
-            stock_rows = df_stock[df_stock["CLAVE"] == clave_sel].copy()
-            # ── MEJORA 1a: ordenar de mayor a menor stock para priorizar filas con existencia ──
-            stock_rows = stock_rows.sort_values(by="CANTIDAD", ascending=False)
-            rack_opts = stock_rows.apply(lambda r: f"{r['RACK']} ({r['CANTIDAD']} pz disponible)", axis=1).tolist()
-
-            c_rk, c_ac = st.columns([1.2, 1.4])
-            rack_sel_raw = c_rk.selectbox("Selecciona ubicación de origen:", rack_opts)
-            fila_stock = stock_rows.iloc[rack_opts.index(rack_sel_raw)]
-            rack_sel, stock_rack = fila_stock["RACK"], int(fila_stock["CANTIDAD"])
-
-            accion = c_ac.radio("Acción a Ejecutar:", ["💰 Venta / Instalación", "🚚 Traslado Inter-Sucursal", "📦 Reubicación (Mover Rack)"], horizontal=True)
+        found = _search_keys(sheet, term)
+        if not found:
+            with col_match: st.warning(f"Sin stock para **'{term.upper()}'**.")
+            en_red = _red_texto(term, excluir=sheet)
+            if en_red: st.info(f"🌐 Disponible en otras sucursales — {en_red}")
+            return
 
-            st.markdown("---")
+        with col_match:
+            if len(found) == 1: clave_sel = found[0]; st.success(f"✅ {clave_sel}")
+            else: clave_sel = st.selectbox(f"{len(found)} coincidencias:", found, key="ops_key")
 
-            if accion.startswith("💰"):
-                with st.form("form_venta"):
-                    c1, c2, c3 = st.columns([1, 1.2, 1.2])
-                    qty_v = c1.number_input("Cantidad", min_value=1, max_value=stock_rack, value=1)
-                    precio = c2.number_input("Precio Cobrado ($)", min_value=0.0, value=0.0, step=100.0)
-                    costo = c3.number_input("Costo de Pieza ($)", min_value=0.0, value=0.0, step=100.0)
-                    c4, c5 = st.columns(2)
-                    aseg = c4.text_input("Aseguradora (Vacío si es Público)")
-                    deducible = c5.number_input("Deducible ($)", min_value=0.0, value=0.0, step=50.0)
-                    nota = st.text_input("Nota / Observaciones (opcional)")
+        racks = _racks_clave(sheet, clave_sel)
+        st.markdown(f'<div class="prod-info"><span class="prod-clave">{clave_sel}</span><span class="prod-nombre">{racks["nombre"] or "Sin descripción"}</span></div>', unsafe_allow_html=True)
+        en_red = _red_texto(clave_sel, excluir=sheet)
+        if en_red: st.caption(f"🌐 También en: {en_red}")
 
-                    detalle = f"Asegurado: {aseg}" if aseg else "Público General"
-                    if deducible > 0: detalle += f" | Deducible: ${deducible:.2f}"
-                    if costo > 0: detalle += f" | Costo: ${costo:.2f}"
-                    if nota: detalle += f" — {nota}"
+        c_rk, c_ac = st.columns([1.2, 1.4])
+        rack_sel_raw = c_rk.selectbox("Selecciona ubicación de origen:", racks["etiquetas"])
+        fila_stock = racks["filas"].iloc[racks["etiquetas"].index(rack_sel_raw)]
+        rack_sel, stock_rack = fila_stock["RACK"], int(fila_stock["CANTIDAD"])
 
-                    if st.columns([3, 1])[1].form_submit_button("💰 Confirmar Venta", type="primary", use_container_width=True):
-                        ok, msg = op_venta(sheet, clave_sel, rack_sel, detalle, qty_v, precio, usuario)
-                        if ok: _ok(msg); time.sleep(0.4); st.rerun()
-                        else: _err(msg)
+        accion = c_ac.radio("Acción a Ejecutar:", ["💰 Venta / Instalación", "🚚 Traslado Inter-Sucursal", "📦 Reubicación (Mover Rack)"], horizontal=True)
 
-            elif accion.startswith("🚚"):
-                with st.form("form_traslado"):
-                    c_a, c_b, c_c = st.columns([1, 1.4, 1], vertical_alignment="bottom")
-                    qty_t = c_a.number_input("Cantidad", min_value=1, max_value=stock_rack, value=1)
-                    dest_ops = {k: v for k, v in SUCURSALES.items() if k != sheet}
-                    dest = c_b.selectbox("Sucursal destino", list(dest_ops.keys()), format_func=lambda x: SUCURSALES[x])
-                    if c_c.form_submit_button("🚚 Confirmar Traslado", type="primary", use_container_width=True):
-                        ok, msg = op_send_transfer(sheet, clave_sel, rack_sel, qty_t, dest, usuario)
-                        if ok: _ok(msg); time.sleep(0.4); st.rerun()
-                        else: _err(msg)
+        st.markdown("---")
 
-            elif accion.startswith("📦"):
-                with st.form("form_reubicacion"):
-                    c_a, c_b, c_c = st.columns([1, 1.4, 1], vertical_alignment="bottom")
-                    qty_r = c_a.number_input("Cantidad", min_value=1, max_value=stock_rack, value=1)
-                    rack_dest_r = c_b.text_input("Rack destino", placeholder="Ej: PISO").strip()
-                    if c_c.form_submit_button("📦 Confirmar", type="primary", use_container_width=True):
-                        if not rack_dest_r: st.warning("⚠️ Indica el rack destino.")
-                        else:
-                            ok, msg = op_relocate(sheet, clave_sel, fila_stock["NOMBRE"], rack_sel, rack_dest_r, qty_r, usuario)
-                            if ok: _ok(msg); time.sleep(0.4); st.rerun()
-                            else: _err(msg)
+        if accion.startswith("💰"): _ui_venta(sheet, usuario, clave_sel, rack_sel, stock_rack)
+        elif accion.startswith("🚚"): _ui_traslado(sheet, usuario, clave_sel, rack_sel, stock_rack)
+        elif accion.startswith("📦"): _ui_reubicacion(sheet, usuario, clave_sel, fila_stock["NOMBRE"], rack_sel, stock_rack)
+
+@st.fragment
+def _ui_venta(sheet: str, usuario: str, clave_sel: str, rack_sel: str, stock_rack: int):
+    with st.form("form_venta"):
+        c1, c2, c3 = st.columns([1, 1.2, 1.2])
+        qty_v = c1.number_input("Cantidad", min_value=1, max_value=stock_rack, value=1)
+        precio = c2.number_input("Precio Cobrado ($)", min_value=0.0, value=0.0, step=100.0)
+        costo = c3.number_input("Costo de Pieza ($)", min_value=0.0, value=0.0, step=100.0)
+        c4, c5 = st.columns(2)
+        aseg = c4.text_input("Aseguradora (Vacío si es Público)")
+        deducible = c5.number_input("Deducible ($)", min_value=0.0, value=0.0, step=50.0)
+        nota = st.text_input("Nota / Observaciones (opcional)")
+
+        detalle = f"Asegurado: {aseg}" if aseg else "Público General"
+        if deducible > 0: detalle += f" | Deducible: ${deducible:.2f}"
+        if costo > 0: detalle += f" | Costo: ${costo:.2f}"
+        if nota: detalle += f" — {nota}"
+
+        if st.columns([3, 1])[1].form_submit_button("💰 Confirmar Venta", type="primary", use_container_width=True):
+            ok, msg = op_venta(sheet, clave_sel, rack_sel, detalle, qty_v, precio, usuario)
+            if ok: _ok(msg); time.sleep(0.4); st.rerun()
+            else: _err(msg)
+
+@st.fragment
+def _ui_traslado(sheet: str, usuario: str, clave_sel: str, rack_sel: str, stock_rack: int):
+    with st.form("form_traslado"):
+        c_a, c_b, c_c = st.columns([1, 1.4, 1], vertical_alignment="bottom")
+        qty_t = c_a.number_input("Cantidad", min_value=1, max_value=stock_rack, value=1)
+        dest_ops = {k: v for k, v in SUCURSALES.items() if k != sheet}
+        stock_red = _stock_red(clave_sel)
+        dest = c_b.selectbox("Sucursal destino", list(dest_ops.keys()), format_func=lambda x: f"{SUCURSALES[x]} (tiene {sum(stock_red[x].values())} pz)")
+        if c_c.form_submit_button("🚚 Confirmar Traslado", type="primary", use_container_width=True):
+            ok, msg = op_send_transfer(sheet, clave_sel, rack_sel, qty_t, dest, usuario)
+            if ok: _ok(msg); time.sleep(0.4); st.rerun()
+            else: _err(msg)
+
+@st.fragment
+def _ui_reubicacion(sheet: str, usuario: str, clave_sel: str, nombre: str, rack_sel: str, stock_rack: int):
+    with st.form("form_reubicacion"):
+        c_a, c_b, c_c = st.columns([1, 1.4, 1], vertical_alignment="bottom")
+        qty_r = c_a.number_input("Cantidad", min_value=1, max_value=stock_rack, value=1)
+        rack_dest_r = c_b.text_input("Rack destino", placeholder="Ej: PISO").strip()
+        if c_c.form_submit_button("📦 Confirmar", type="primary", use_container_width=True):
+            if not rack_dest_r: st.warning("⚠️ Indica el rack destino.")
+            else:
+                ok, msg = op_relocate(sheet, clave_sel, nombre, rack_sel, rack_dest_r, qty_r, usuario)
+                if ok: _ok(msg); time.sleep(0.4); st.rerun()
+                else: _err(msg)
 
 # ═══════════════════════════════════════════════════════════════════════════
 # MODULO 3: TRÁNSITOS
@@ -716,7 +2951,7 @@ def ui_logistics(sheet: str, usuario: str):
     tab_recv, tab_sent = st.tabs(["📥 Recibir Pedidos / Traslados", "📤 Envíos Realizados Pendientes"])
 
     with tab_recv:
-        recv = df_p[df_p["DESTINO"] == sheet].reset_index(drop=False)
+        recv = df_p[df_p["DESTINO"] == sheet].reset_index(drop=True)
         if recv.empty:
             st.info("📥 No tienes traslados pendientes por recibir.")
         else:
@@ -730,7 +2965,7 @@ def ui_logistics(sheet: str, usuario: str):
             fila = recv.iloc[opts_r.index(sel_r)]
 
             clave_proc, nombre_proc, total_disp = fila["CLAVE"], fila["NOMBRE"], int(fila["CANTIDAD"])
-            pending_row, origen_proc = int(fila["index"]) + 2, fila["ORIGEN"]
+            traslado_id, origen_proc = fila["ID"], fila["ORIGEN"]
 
             tipo_proc = st.radio("Acción:", ["📥 Ingresar al Almacén (Asignar Racks)", "💥 Dar de baja inmediatamente (Siniestro/Venta)"], horizontal=True)
 
@@ -744,18 +2979,8 @@ def ui_logistics(sheet: str, usuario: str):
                 if st.button("📥 Confirmar Ingreso", type="primary"):
                     if not rack_rec: st.warning("⚠️ Debes especificar un rack.")
                     else:
-                        if qty_rec == total_disp:
-                            ok, msg = op_receive_transfer(sheet, clave_proc, nombre_proc, qty_rec, rack_rec, pending_row, usuario)
-                        else:
-                            try:
-                                ok, msg_alta = op_alta(sheet, clave_proc, nombre_proc, rack_rec, qty_rec, usuario)
-                                if ok:
-                                    _sheet("Traslados_Pendientes").update_cell(pending_row, 4, total_disp - qty_rec)
-                                    msg = f"Ingreso parcial de {qty_rec} pz al {rack_rec}. Restan {total_disp - qty_rec}."
-                                else: msg = msg_alta
-                            except Exception as e: ok, msg = False, f"Error: {e}"
-
-                        if ok: _ok(msg); _refresh("Traslados_Pendientes"); time.sleep(0.5); st.rerun()
+                        ok, msg = op_receive_transfer(sheet, clave_proc, nombre_proc, qty_rec, rack_rec, traslado_id, usuario)
+                        if ok: _ok(msg); time.sleep(0.5); st.rerun()
                         else: _err(msg)
 
             else:
@@ -778,20 +3003,12 @@ def ui_logistics(sheet: str, usuario: str):
                     if nota: detalle += f" — {nota}"
 
                     if st.form_submit_button("💥 Confirmar Baja", type="primary", use_container_width=True):
-                        try:
-                            _log_movement(clave_proc, "Venta/Instalación", detalle, qty_baja, precio, usuario, sheet)
-                            ws_p = _sheet("Traslados_Pendientes")
-                            if qty_baja == total_disp:
-                                ws_p.delete_rows(pending_row)
-                                msg = f"Baja total confirmada."
-                            else:
-                                ws_p.update_cell(pending_row, 4, total_disp - qty_baja)
-                                msg = f"Baja parcial de {qty_baja} pz."
-                            _ok(msg); _refresh("Traslados_Pendientes"); _refresh("Movimientos"); time.sleep(0.5); st.rerun()
-                        except Exception as e: _err(f"Error: {e}")
+                        ok, msg = op_writeoff_transfer(sheet, clave_proc, traslado_id, qty_baja, precio, detalle, usuario)
+                        if ok: _ok(msg); time.sleep(0.5); st.rerun()
+                        else: _err(msg)
 
     with tab_sent:
-        sent = df_p[df_p["ORIGEN"] == sheet].reset_index(drop=False)
+        sent = df_p[df_p["ORIGEN"] == sheet].reset_index(drop=True)
         if sent.empty:
             st.info("📭 No tienes envíos pendientes.")
         else:
@@ -819,68 +3036,127 @@ def ui_pedidos(sheet: str):
     
     _page_header("📋", "Carga de Pedidos Múltiples", f"Alta masiva de cristales para {nombre_suc}")
     
-    _section("Pega la lista de piezas")
-    with st.container(border=True):
-        st.markdown("**Formatos permitidos por línea:**")
-        st.code("CLAVE\nCLAVE,CANTIDAD\nCLAVE,CANTIDAD,RACK_DESTINO")
-        texto_pedido = st.text_area(
-            "Lista de pedido:",
-            placeholder="756\nFW2034,1\nDW1190,3,RACK 2\n1234,2,PEINE 1",
-            height=250
-        )
+    tab_lista, tab_archivo = st.tabs(["✍️ Pegar lista", "📂 Subir archivo (CSV / XLSX)"])
+    with tab_archivo: _ui_pedido_archivo(sheet, usuario)
+
+    with tab_lista:
+        _section("Pega la lista de piezas")
+        with st.container(border=True):
+            st.markdown("**Formatos permitidos por línea:**")
+            st.code("CLAVE\nCLAVE,CANTIDAD\nCLAVE,CANTIDAD,RACK_DESTINO")
+            texto_pedido = st.text_area(
+                "Lista de pedido:",
+                placeholder="756\nFW2034,1\nDW1190,3,RACK 2\n1234,2,PEINE 1",
+                height=250
+            )
         
-        c1, c2 = st.columns(2)
-        tipo_comun = c1.selectbox("Tipo de pieza (por defecto)", TIPOS_PIEZA)
-        rack_comun = c2.text_input("Rack común / Ubicación por defecto", value="PISO").strip()
-        _rack_tag(rack_comun)
+            c1, c2 = st.columns(2)
+            tipo_comun = c1.selectbox("Tipo de pieza (por defecto)", TIPOS_PIEZA)
+            rack_comun = c2.text_input("Rack común / Ubicación por defecto", value="PISO").strip()
+            _rack_tag(rack_comun)
         
-        procesar = st.button("🚀 Procesar Pedido Masivo", type="primary", use_container_width=True)
+            procesar = st.button("🚀 Procesar Pedido Masivo", type="primary", use_container_width=True)
         
-    if procesar:
-        if not texto_pedido.strip():
-            st.warning("⚠️ El cuadro de texto está vacío.")
-            return
+        if procesar:
+            if not texto_pedido.strip():
+                st.warning("⚠️ El cuadro de texto está vacío.")
+                return
             
-        lineas = [linea.strip() for linea in texto_pedido.split("\n") if linea.strip()]
-        exitos = 0
-        errores = 0
-        
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        for idx, linea in enumerate(lineas):
-            try:
-                status_text.caption(f"Procesando línea {idx+1}/{len(lineas)}: {linea}")
-                
+            lineas = []
+            for linea in (l.strip() for l in texto_pedido.split("\n")):
+                if not linea: continue
                 # Extracción dinámica de 1, 2 o 3 parámetros (Clave, Cantidad, Rack)
                 partes = [p.strip() for p in linea.split(",")]
                 clave_raw = partes[0]
                 cantidad = 1
                 rack_item = rack_comun
-                
+
                 if len(partes) >= 2:
                     try: cantidad = int(partes[1])
                     except ValueError: cantidad = 1
-                        
+
                 if len(partes) >= 3:
                     rack_item = partes[2]
-                
+
                 if not clave_raw:
                     continue
-                    
-                ok, msg = op_alta(sheet, clave_raw, tipo_comun, rack_item, cantidad, usuario)
-                if ok: exitos += 1
-                else: errores += 1
-            except Exception:
-                errores += 1
-            progress_bar.progress((idx + 1) / len(lineas))
-            
-        status_text.empty()
-        if exitos > 0: _ok(f"✅ ¡Pedido procesado con éxito! {exitos} líneas registradas.")
-        if errores > 0: _err(f"❌ Hubo problemas al procesar {errores} líneas.")
-            
-        time.sleep(1.0)
-        st.rerun()
+                lineas.append((clave_raw, cantidad, rack_item))
+
+            if not lineas:
+                st.warning("⚠️ No se encontraron líneas válidas.")
+                return
+
+            with st.spinner(f"Procesando {len(lineas)} líneas en bloque…"):
+                ok, msg, resultados = op_alta_masiva(sheet, lineas, tipo_comun, usuario)
+
+            errores = sum(1 for r in resultados if not r["OK"])
+            if ok: _ok(f"✅ ¡Pedido procesado con éxito! {msg}")
+            else: _err(f"❌ No se registró ninguna línea. {msg}")
+            if ok and errores: _err(f"❌ Hubo problemas al procesar {errores} líneas.")
+
+            df_res = pd.DataFrame(resultados)
+            df_res["ESTADO"] = df_res["OK"].map({True: "✅", False: "❌"})
+            st.dataframe(df_res[["LINEA", "ESTADO", "CLAVE", "RACK", "CANTIDAD", "DETALLE"]], use_container_width=True, hide_index=True)
+
+def _ui_pedido_archivo(sheet: str, usuario: str):
+    """Manifiesto del proveedor: lectura por bloques, vista previa agregada y alta en lotes."""
+    _section("Sube el manifiesto del proveedor")
+    with st.container(border=True):
+        st.markdown("**Columnas:** `CLAVE`, `CANTIDAD` (opcional, 1 por omisión) y `RACK` (opcional). Sin encabezado se toman en ese orden.")
+        archivo = st.file_uploader("Archivo del pedido", type=["csv", "txt", "xlsx", "xlsm"], key="pedido_archivo")
+        c1, c2 = st.columns(2)
+        tipo_comun = c1.selectbox("Tipo de pieza (por defecto)", TIPOS_PIEZA, key="pedido_archivo_tipo")
+        rack_comun = c2.text_input("Rack común / Ubicación por defecto", value="PISO", key="pedido_archivo_rack").strip()
+        _rack_tag(rack_comun)
+    if archivo is None:
+        st.session_state.pop("_pedido_archivo", None)
+        return
+
+    # La lectura y el agregado se hacen una vez por archivo; los reruns reutilizan la vista previa
+    origen = (archivo.name, archivo.size, rack_comun)
+    previa = st.session_state.get("_pedido_archivo")
+    if previa is None or previa["origen"] != origen:
+        archivo.seek(0)
+        try:
+            with st.spinner(f"Leyendo {archivo.name}…"):
+                agregado, resumen = _agregar_pedido(_bloques_pedido(_tablas_manifiesto(archivo, archivo.name), rack_comun))
+        except Exception as e:
+            _err(f"No se pudo leer el archivo: {e}")
+            return
+        pos = _get_index(sheet)["pos"]
+        agregado["ESTADO"] = ["Suma a existente" if k in pos else "Registro nuevo" for k in zip(agregado["CLAVE"], agregado["RACK"])]
+        previa = st.session_state["_pedido_archivo"] = {"origen": origen, "agregado": agregado, "resumen": resumen}
+    agregado, resumen = previa["agregado"], previa["resumen"]
+
+    _section("Vista previa")
+    nuevas = int(agregado["ESTADO"].eq("Registro nuevo").sum())
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: _kpi("📄", "Líneas leídas", f"{resumen['leidas']:,}", f"{resumen['invalidas']:,} inválidas", "amber" if resumen["invalidas"] else "green")
+    with c2: _kpi("🔑", "Claves distintas", f"{len(agregado):,}", "por clave y rack")
+    with c3: _kpi("📦", "Piezas", f"{int(agregado['CANTIDAD'].sum()):,}", "total del pedido", "green")
+    with c4: _kpi("🆕", "Registros nuevos", f"{nuevas:,}", f"{len(agregado) - nuevas:,} suman a existentes")
+    st.dataframe(agregado.head(PEDIDO_LOTE), use_container_width=True, hide_index=True)
+    if len(agregado) > PEDIDO_LOTE: st.caption(f"Mostrando {PEDIDO_LOTE:,} de {len(agregado):,} claves.")
+    if resumen["errores"]:
+        with st.expander(f"⚠️ {resumen['invalidas']:,} líneas inválidas (se omiten)"):
+            st.dataframe(pd.DataFrame(resumen["errores"]), use_container_width=True, hide_index=True)
+            if resumen["invalidas"] > len(resumen["errores"]): st.caption(f"Mostrando las primeras {len(resumen['errores']):,}.")
+    if agregado.empty:
+        st.warning("⚠️ El archivo no tiene líneas válidas.")
+        return
+
+    if previa.get("registrado"):
+        st.info("ℹ️ Este archivo ya se registró. Sube otro manifiesto para continuar.")
+        return
+    if st.button(f"🚀 Registrar {len(agregado):,} claves ({int(agregado['CANTIDAD'].sum()):,} pz)", type="primary", use_container_width=True, key="pedido_archivo_ok"):
+        barra = st.progress(0.0, text="Registrando…")
+        ok, msg, fallidas = op_importar_pedido(sheet, agregado, tipo_comun, usuario, avance=lambda f, t: barra.progress(f, text=t))
+        # Con al menos una clave escrita otro rerun con el mismo archivo no lo vuelve a dar de alta; si todo falló se puede reintentar
+        if len(fallidas) < len(agregado): previa["registrado"] = True
+        (_ok if ok else _err)(msg)
+        if fallidas:
+            _err(f"❌ {len(fallidas):,} claves no se registraron.")
+            st.dataframe(pd.DataFrame(fallidas)[["LINEA", "CLAVE", "RACK", "CANTIDAD", "DETALLE"]], use_container_width=True, hide_index=True)
 
 # ═══════════════════════════════════════════════════════════════════════════
 # MEJORA 2: MÓDULO DE OPERACIÓN EXPRESS (COMPRA + INSTALACIÓN INMEDIATA)
@@ -954,33 +3230,34 @@ def ui_operacion_express(sheet: str, usuario: str):
             detalle_salida += f" — Nota: {notas_exp.strip()}"
 
         try:
-            ws_historial = _sheet("Movimientos")
-
-            # Fila 1 — ENTRADA (Compra al proveedor externo)
-            ws_historial.append_row([
-                fecha_op,
-                _clean(clave_exp),
-                "ENTRADA Express",
-                detalle_entrada,
-                cantidad_exp,
-                0,           # Precio (se puede agregar en notas si es necesario)
-                usuario,
-                suc_nombre,
-            ])
-
-            # Fila 2 — SALIDA (Instalación a aseguradora/cliente)
-            ws_historial.append_row([
-                fecha_op,
-                _clean(clave_exp),
-                "SALIDA Express",
-                detalle_salida,
-                cantidad_exp,
-                0,
-                usuario,
-                suc_nombre,
-            ])
-
-            _refresh("Movimientos")
+            filas = [
+                # Fila 1 — ENTRADA (Compra al proveedor externo)
+                [
+                    fecha_op,
+                    _clean(clave_exp),
+                    "ENTRADA Express",
+                    detalle_entrada,
+                    cantidad_exp,
+                    0,           # Precio (se puede agregar en notas si es necesario)
+                    usuario,
+                    suc_nombre,
+                ],
+                # Fila 2 — SALIDA (Instalación a aseguradora/cliente)
+                [
+                    fecha_op,
+                    _clean(clave_exp),
+                    "SALIDA Express",
+                    detalle_salida,
+                    cantidad_exp,
+                    0,
+                    usuario,
+                    suc_nombre,
+                ],
+            ]
+
+            # Ambas filas en un solo append (vía spool de la bitácora)
+            _log_movements(filas)
+            _commit()
 
             _ok(
                 f"✅ Operación Express registrada: "
@@ -1003,24 +3280,148 @@ def ui_operacion_express(sheet: str, usuario: str):
 def ui_history(sheet: str):
     _page_header("📜", "Auditoría de Movimientos", "Historial estricto write-through indexado cronológicamente.")
 
-    df = _get_df("Movimientos")
-    if df.empty:
+    particiones = _mov_particiones()
+    periodos = ["Recientes (hoja activa)", "Todo el historial"] + particiones
+    c0, c00 = st.columns([3, 1])
+    periodo = c0.selectbox("Periodo:", periodos, format_func=lambda p: p if p in periodos[:2] else f"Archivo {p[12:16]}-{p[17:]}")
+    with c00:
+        st.markdown("<div style='height:28px'></div>", unsafe_allow_html=True)
+        if st.button("🗄️ Archivar antiguos", use_container_width=True, help=f"Mueve a particiones mensuales los movimientos con más de {MOV_VENTANA_DIAS} días."):
+            ok, msg = archivar_movimientos()
+            (_ok if ok else _err)(msg)
+
+    vivo = _get_df("Movimientos")
+    if periodo == periodos[0] and vivo.empty:
         st.info("No hay registros históricos en la bitácora global.")
         return
 
     _section("Filtros Avanzados de Auditoría")
     with st.container(border=True):
         c1, c2 = st.columns(2)
-        tipos = ["Todos"] + sorted(df["TIPO"].unique().tolist() if "TIPO" in df.columns else [])
-        sucs = ["Todas"] + sorted(df["SUCURSAL"].unique().tolist() if "SUCURSAL" in df.columns else [])
+        # Opciones tomadas de la hoja viva (ya en memoria) para no descargar las particiones sólo por los filtros
+        tipos = ["Todos"] + sorted(map(str, vivo["TIPO"].unique()) if "TIPO" in vivo.columns else [])
+        sucs = ["Todas"] + sorted(set(vivo["SUCURSAL"].astype(str)) | (set(SUCURSALES) if periodo != periodos[0] else set()) if "SUCURSAL" in vivo.columns else SUCURSALES)
         ft = c1.selectbox("Tipo de movimiento:", tipos)
         fs = c2.selectbox("Sucursal:", sucs)
 
-    df_v = df.copy()
-    if "TIPO" in df.columns and ft != "Todos": df_v = df_v[df_v["TIPO"] == ft]
-    if "SUCURSAL" in df.columns and fs != "Todas": df_v = df_v[df_v["SUCURSAL"] == fs]
+    # La bitácora como segmentos cronológicos (particiones de la más antigua a la más reciente y luego la hoja viva).
+    # Sin filtros sólo se cuentan las particiones y se lee el rango de la página; con filtros se descargan (con caché).
+    filtrado = ft != "Todos" or fs != "Todas"
+    nombres = ["Movimientos"] if periodo == periodos[0] else particiones[::-1] + ["Movimientos"] if periodo == periodos[1] else [periodo]
+    segmentos = []
+    for nombre in nombres:
+        if nombre != "Movimientos" and not filtrado:
+            segmentos.append((nombre, None, _filas_particion(nombre)))
+            continue
+        df_n = _filtrar_movimientos(vivo if nombre == "Movimientos" else _load_particion(nombre), ft, fs)
+        segmentos.append((nombre, df_n, len(df_n)))
+    total = sum(n for _, _, n in segmentos)
+    if total == 0:
+        st.info("No hay movimientos que coincidan con los filtros." if filtrado else "La partición está vacía.")
+        return
+    # Paginado del más reciente al más antiguo: sólo se renderiza (o descarga) una página
+    paginas = (total + MOV_PAGINA - 1) // MOV_PAGINA
+    pagina = st.number_input(f"Página (de {paginas}):", min_value=1, max_value=paginas, value=1, step=1)
+    fin = total - (pagina - 1) * MOV_PAGINA
+    ini = max(fin - MOV_PAGINA, 0)
+    pag = _pagina_historial(segmentos, ini, fin)
+    st.caption(f"{total:,} movimiento(s) · mostrando {ini + 1:,}–{fin:,}")
+    st.dataframe(pag.iloc[::-1], use_container_width=True, hide_index=True, column_config=_history_column_config())
 
-    st.dataframe(df_v.iloc[::-1], use_container_width=True, hide_index=True, column_config=_history_column_config())
+# ═══════════════════════════════════════════════════════════════════════════
+# MODULO 5: DIAGNÓSTICO (TELEMETRÍA)
+# ═══════════════════════════════════════════════════════════════════════════
+
+PERCENTILES = [50, 90, 95, 99]
+
+def _telemetria_df() -> pd.DataFrame:
+    tele = _telemetria()
+    with tele["lock"]: ops = list(tele["ops"])
+    return pd.DataFrame([{k: v for k, v in r.items() if k != "detalle"} for r in ops])
+
+def _telemetria_jsonl() -> str:
+    tele = _telemetria()
+    with tele["lock"]: ops = list(tele["ops"])
+    return "\n".join(json.dumps(r, ensure_ascii=False) for r in ops) + ("\n" if ops else "")
+
+def ui_diagnostics():
+    _page_header("🩺", "Diagnóstico de Rendimiento", "Costo en Google Sheets y latencia de cada operación del inventario (memoria del servidor).")
+
+    with st.expander("🧠 Memoria de la caché compartida (frames compactos)"):
+        hojas = sorted(_shared_cache()["hojas"])
+        if hojas:
+            medidas = {n: _derivado(n, "memoria", _memoria_frame) for n in hojas}
+            mem = pd.DataFrame([{"Hoja": n, "Filas": len(_get_df(n)), "MB": c / 1e6, "MB como texto": t / 1e6, "Reducción": 1 - c / t if t else 0.0}
+                                for n, (c, t) in medidas.items()])
+            st.dataframe(mem, use_container_width=True, hide_index=True,
+                         column_config={"MB": st.column_config.NumberColumn(format="%.2f"), "MB como texto": st.column_config.NumberColumn(format="%.2f"), "Reducción": st.column_config.NumberColumn(format="percent")})
+            st.caption(f"{mem['MB'].sum():,.1f} MB en memoria contra {mem['MB como texto'].sum():,.1f} MB con texto, int64 y FECHA como texto (tope {CACHE_MAX_MB} MB).")
+        else:
+            st.caption("La caché está vacía.")
+
+    df = _telemetria_df()
+    if df.empty:
+        st.info("Aún no hay operaciones medidas en este servidor.")
+        return
+
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: _kpi("⚙️", "Operaciones medidas", f"{len(df):,}", f"últimas {TELEMETRIA_MAX:,} como máximo")
+    with c2: _kpi("📡", "Peticiones HTTP", f"{int(df['http'].sum()):,}", f"{int(df['llamadas'].sum()):,} llamadas gspread", "green")
+    with c3: _kpi("📦", "Datos transferidos", f"{(df['bytes_in'].sum() + df['bytes_out'].sum()) / 1e6:,.2f} MB", f"{df['bytes_out'].sum() / 1e6:,.2f} MB enviados")
+    with c4: _kpi("⏳", "Espera por cuota", f"{df['espera_cuota_seg'].sum():,.1f} s", f"{int(df['reintentos'].sum())} reintento(s) 429/5xx", "amber" if df["reintentos"].sum() else "green")
+
+    _section("Resumen por operación")
+    g = df.groupby("op")
+    resumen = pd.DataFrame({
+        "N": g.size(),
+        "Errores": g["ok"].apply(lambda s: int((~s.astype(bool)).sum())),
+        **{f"p{p} (s)": g["seg"].quantile(p / 100) for p in PERCENTILES},
+        "HTTP prom.": g["http"].mean(),
+        "Llamadas prom.": g["llamadas"].mean(),
+        "KB prom.": (g["bytes_in"].mean() + g["bytes_out"].mean()) / 1024,
+        "Cuota prom. (s)": g["espera_cuota_seg"].mean(),
+    }).sort_values("N", ascending=False)
+    st.dataframe(resumen, use_container_width=True, column_config={c: st.column_config.NumberColumn(c, format="%.3f") for c in resumen.columns if c not in ("N", "Errores")})
+
+    _section("Distribución de latencia")
+    with st.container(border=True):
+        op = st.selectbox("Operación:", resumen.index.tolist())
+        seg = df.loc[df["op"] == op, "seg"]
+        cuantiles = seg.quantile([p / 100 for p in PERCENTILES])
+        st.caption(" · ".join(f"p{p}: {v:.3f} s" for p, v in zip(PERCENTILES, cuantiles)))
+        cortes = pd.cut(seg, bins=min(20, max(seg.nunique(), 1)))
+        hist = cortes.value_counts(sort=False)
+        st.bar_chart(pd.DataFrame({"operaciones": hist.values}, index=[f"{i.right:.3f}" for i in hist.index]), x_label="latencia (s, límite superior)", y_label="operaciones")
+
+        tele = _telemetria()
+        with tele["lock"]: detalle = [d for r in tele["ops"] if r["op"] == op for d in r["detalle"]]
+        if detalle:
+            dd = pd.DataFrame(detalle).groupby(["metodo", "hoja"])["seg"]
+            st.dataframe(pd.DataFrame({"N": dd.size(), "p50 (s)": dd.median(), "p95 (s)": dd.quantile(0.95)}).reset_index(), use_container_width=True, hide_index=True)
+
+    errores = list(_instantaneas()["errores"])
+    if errores:
+        with st.expander(f"🗂️ Instantáneas locales: {len(errores)} error(es) recientes"):
+            st.code("\n".join(errores))
+    errores = list(_revalidacion()["errores"])
+    if errores:
+        with st.expander(f"🔁 Revalidación en segundo plano: {len(errores)} error(es) recientes"):
+            st.code("\n".join(errores))
+    espejo, error = _backend().espejo_pendientes()
+    if espejo:
+        with st.expander(f"🪞 Espejo en Sheets: {espejo} escritura(s) pendientes de replicar", expanded=bool(error)):
+            st.caption(f"Se envían en orden; tras un error se reintenta cada {ESPEJO_REINTENTO_SEG} s.")
+            if error: st.code(error)
+            if st.button("🔁 Reintentar ahora", key="espejo_reintentar"):
+                _backend().replicar_espejo(forzar=True)
+                st.rerun()
+
+    c_exp, c_clr = st.columns(2)
+    c_exp.download_button("⬇️ Exportar JSON lines", _telemetria_jsonl(), file_name=f"telemetria_{datetime.now():%Y%m%d_%H%M%S}.jsonl", mime="application/jsonl", use_container_width=True)
+    if c_clr.button("🧹 Reiniciar mediciones", use_container_width=True):
+        tele = _telemetria()
+        with tele["lock"]: tele["ops"].clear()
+        st.rerun()
 
 # ═══════════════════════════════════════════════════════════════════════════
 # PUNTO DE ENTRADA (ENRUTAMIENTO PRINCIPAL)
@@ -1051,6 +3452,8 @@ def main():
         ui_operacion_express(active_sheet, user)
     elif section == "auditoria" and rol == "admin":
         ui_history(active_sheet)
+    elif section == "diagnostico" and rol == "admin":
+        ui_diagnostics()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,354 @@
+"""
+Benchmarks de Glass Inventory (sin conexión a Google Sheets).
+
+    python benchmark.py              # todas las pruebas
+    python benchmark.py normalizacion
+    python benchmark.py operaciones carga
+
+Las pruebas de algoritmos verifican primero que el camino optimizado produce
+exactamente el mismo resultado que la referencia y después reportan tiempos.
+Las de operaciones corren la app contra fake_sheets.FakeSpreadsheet y
+reportan llamadas a la API, 429 simulados y tiempo de pared simulado
+(LATENCIA_SIM por llamada, CUOTA_SIM llamadas por minuto) para detectar
+regresiones de costo antes de tocar la hoja real.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import app
+from fake_sheets import FakeSpreadsheet
+
+# Perfil de la API simulada: latencia típica de Sheets por petición y cuota por usuario
+LATENCIA_SIM = 0.25
+CUOTA_SIM = 60
+
+# ═══════════════════════════════════════════════════════════════════════════
+# UTILIDADES
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _mejor_de(fn, repeticiones: int = 5) -> float:
+    """Mejor tiempo (s) de varias corridas, para aislar el ruido del sistema."""
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor
+
+def _reporte(nombre: str, antes: float, despues: float):
+    print(f"  {nombre:<34} {antes * 1000:9.1f} ms → {despues * 1000:8.1f} ms   (x{antes / despues:,.1f})")
+
+def _app_simulada(filas: int, latencia: float = LATENCIA_SIM, cuota: int | None = CUOTA_SIM) -> FakeSpreadsheet:
+    """Conecta la app (estado limpio) a un spreadsheet simulado con `filas` (+2 % duplicadas) por sucursal."""
+    hojas = {s: hoja_inventario(filas, semilla=i, duplicados=0.02) for i, s in enumerate(app.SUCURSALES)}
+    hojas |= {name: [cols] for name, cols in app.ENCABEZADOS.items()}
+    ss = FakeSpreadsheet(hojas, latencia=latencia, cuota_min=cuota)
+    app._connect_gsheets = lambda: ss
+    app.STORAGE_BACKEND = "sheets"
+    # La cuota la impone el simulador en tiempo simulado; el cliente sólo reintenta los 429
+    app.SHEETS_LECTURAS_MIN = app.SHEETS_ESCRITURAS_MIN = 10 ** 6
+    app.SHEETS_ESPERA_BASE = 0.001
+    app.SPOOL_PATH = os.path.join(tempfile.mkdtemp(prefix="glass_bench_"), "spool.sqlite")
+    app.SNAPSHOT_DIR = ""  # sin instantáneas locales salvo en bench_arranque
+    for recurso in (app._client, app._backend, app._spool, app._shared_cache, app._telemetria, app._red, app._instantaneas, app._revalidacion): recurso.clear()
+    app._archivo_estado()["ultimo"] = float("inf")  # sin archivo automático en segundo plano
+    return ss
+
+def _medir_api(ss: FakeSpreadsheet, nombre: str, fn, veces: int = 1):
+    """Corre fn(i) `veces` y reporta promedio de llamadas, 429 y tiempo simulado por ejecución."""
+    ss.reset_stats()
+    t0 = time.perf_counter()
+    for i in range(veces):
+        res = fn(i)
+        if isinstance(res, tuple) and res and res[0] is False: raise AssertionError(f"{nombre}: {res[1]}")
+    cpu = time.perf_counter() - t0
+    detalle = ", ".join(f"{h}.{m}×{n / veces:g}" for (h, m), n in sorted(ss.llamadas.items(), key=lambda kv: -kv[1])[:4])
+    print(f"  {nombre:<40} {ss.total_llamadas / veces:6.1f} llamadas  {ss.throttled / veces:5.1f} × 429  "
+          f"{ss.reloj / veces:7.2f} s sim.  {cpu / veces * 1000:8.1f} ms CPU   [{detalle}]")
+
+def hoja_inventario(filas: int, semilla: int = 7, duplicados: float = 0.0) -> list[list]:
+    """
+    Valores crudos de una hoja de inventario como los entrega Sheets (texto),
+    con el desorden real de captura; `duplicados` es la fracción de filas que
+    repiten la CLAVE y el RACK de otra (lo que consolida op_clean_duplicates).
+    """
+    rnd = random.Random(semilla)
+    racks = ["1", "12", " rack 3", "RACK 4 ", "rack  5", "peine", "sin peine", "Piso", "", "  ", "bodega a", "RACK", "Rack Ñ", "7"]
+    nombres = ["Parabrisas", "Medallón", "Puerta delantera", "Aleta", "Costado"]
+    values = [list(app.ENCABEZADOS_INVENTARIO)]
+    for i in range(filas):
+        clave = rnd.choice([f"FW{i}", f"fw{i}", f"DW {i}", f"756{i}", f"{i}"] * 6 + [f" DW{i} ", f"ab  {i}\t", f"x\x0b{i}", f"ñ{i}"])
+        values.append([clave, rnd.choice(nombres), rnd.choice(racks), str(rnd.randint(0, 9)), "2026-01-01 10:00:00"])
+    for _ in range(int(filas * duplicados)):
+        fila = list(rnd.choice(values[1:]))
+        fila[3] = str(rnd.randint(0, 9))
+        values.append(fila)
+    return values
+
+# ═══════════════════════════════════════════════════════════════════════════
+# PRUEBAS
+# ═══════════════════════════════════════════════════════════════════════════
+
+def bench_normalizacion(filas: int = 20_000):
+    """_normalize_df: .apply fila por fila (referencia) contra la ruta vectorizada con memo de racks."""
+    values = hoja_inventario(filas)
+    head = values[0]
+    crudo = pd.DataFrame([app.numericise_all(r) for r in values[1:]], columns=head)
+
+    def referencia():
+        df = crudo.copy()
+        df["CLAVE"] = df["CLAVE"].apply(app._clean)
+        df["RACK"] = df["RACK"].apply(lambda raw: app._rack_canon.__wrapped__("" if raw is None else str(raw)))
+        df["NOMBRE"] = df["NOMBRE"].astype(str)
+        df["CANTIDAD"] = pd.to_numeric(df["CANTIDAD"], errors="coerce").fillna(0).astype(int)
+        return df
+
+    def vectorizado():
+        return app._normalize_df(crudo.copy())
+
+    pd.testing.assert_frame_equal(vectorizado(), app._compactar(referencia()))
+    print(f"normalización ({filas:,} filas) — resultado idéntico")
+    _reporte("_normalize_df", _mejor_de(referencia), _mejor_de(vectorizado))
+
+def bench_busqueda(filas: int = 20_000):
+    """Filtro del Panel de Control: regex sobre todo el frame + 3 pestañas contra la llave precalculada."""
+    df = app._values_to_df(hoja_inventario(filas))
+    filtros = ["7", "75", "FW1", "RACK 3", "MEDALLÓN"]
+
+    def referencia(filtro):
+        v = df[df.astype(str).apply(lambda col: col.str.contains(filtro, case=False, na=False)).any(axis=1)]
+        return [v[v["NOMBRE"].str.contains("Parabrisas", case=False, na=False)], v[v["NOMBRE"].str.contains("Medallón", case=False, na=False)],
+                v[~v["NOMBRE"].str.contains("Parabrisas|Medallón", case=False, na=False)]]
+
+    def indexado(filtro, busq):
+        mask = app._search_mask(busq, filtro)
+        return [df.loc[busq[cat] & mask] for cat in ("pb", "med", "otros")]
+
+    busq = app._build_search(df)
+    for f in filtros:
+        for a, b in zip(referencia(f), indexado(f, busq)): pd.testing.assert_frame_equal(a, b)
+    print(f"búsqueda del panel ({filas:,} filas) — resultado idéntico")
+    print(f"  {'construir llave (1 vez por versión)':<34} {_mejor_de(lambda: app._build_search(df)) * 1000:9.1f} ms")
+    _reporte("filtro + pestañas (por tecla)", _mejor_de(lambda: [referencia(f) for f in filtros]) / len(filtros),
+             _mejor_de(lambda: [indexado(f, {**busq, "memo": {}}) for f in filtros]) / len(filtros))
+def bench_claves(filas: int = 50_000):
+    """_search_keys: str.contains sobre las claves con stock contra el índice de n-gramas."""
+    df = app._values_to_df(hoja_inventario(filas))
+    app._cache_put("_bench", df)
+    terminos = ["7", "75", "756", "FW12", "DW 1", "AB  3", "FW1233X"]
+
+    def referencia(term):
+        pool = df[df["CANTIDAD"] > 0]
+        return sorted(pool.loc[pool["CLAVE"].str.contains(app._clean(term), case=False, na=False, regex=False), "CLAVE"].unique().tolist())
+
+    # Sin índice la primera tecla recorre las claves con stock y lo manda construir en segundo plano
+    t0 = time.perf_counter()
+    sin_indice = app._search_keys("_bench", terminos[3])
+    primera = time.perf_counter() - t0
+    assert sin_indice == sorted(referencia(terminos[3]), key=lambda c: app._rank_sub(c, app._clean(terminos[3])))[:app.LIMITE_COINCIDENCIAS]
+    app._key_index("_bench", esperar=True)
+    for term in terminos:
+        nuevo, viejo = app._search_keys("_bench", term), referencia(term)
+        # Mismas claves (hasta el límite), con las sugerencias por error de dedo sólo al final
+        assert set(nuevo[:len(viejo)]) <= set(viejo) and (len(viejo) > app.LIMITE_COINCIDENCIAS or set(viejo) <= set(nuevo)), term
+    print(f"claves con stock ({filas:,} filas, {len(app._key_index('_bench')['claves']):,} claves) — mismas coincidencias, ordenadas por relevancia")
+    print(f"  {'construir índice (en segundo plano)':<34} {_mejor_de(lambda: app._build_key_index(app._key_index('_bench')['claves']), 1) * 1000:9.1f} ms")
+    print(f"  {'primera tecla, sin índice aún':<34} {primera * 1000:9.1f} ms")
+    # Sin los términos recordados: cada tecla nueva recorre el índice
+    _reporte("búsqueda por tecla", _mejor_de(lambda: [referencia(t) for t in terminos]) / len(terminos),
+             _mejor_de(lambda: [app._key_index("_bench")["memo"].clear() or app._search_keys("_bench", t) for t in terminos]) / len(terminos))
+    app._cache_drop("_bench")
+
+def bench_rerun(filas: int = 50_000):
+    """Rerun del Centro de Operaciones con una clave elegida: stock + racks recalculados contra derivados por versión."""
+    _app_simulada(filas, latencia=0, cuota=None)
+    app._init_session()
+    s1 = list(app.SUCURSALES)[0]
+    clave = app._get_df_stock(s1)["CLAVE"].iloc[0]
+
+    def referencia():
+        df_stock = app._get_df(s1)
+        df_stock = df_stock[df_stock["CANTIDAD"] > 0].copy()
+        stock_rows = df_stock[df_stock["CLAVE"] == clave].copy().sort_values(by="CANTIDAD", ascending=False)
+        return stock_rows, stock_rows.apply(lambda r: f"{r['RACK']} ({r['CANTIDAD']} pz disponible)", axis=1).tolist()
+
+    filas_ref, etiquetas_ref = referencia()
+    racks = app._racks_clave(s1, clave)
+    pd.testing.assert_frame_equal(filas_ref, racks["filas"])
+    assert etiquetas_ref == racks["etiquetas"]
+    print(f"rerun del panel de salida ({filas:,} filas) — mismas filas y etiquetas")
+    _reporte("stock + racks de la clave (por rerun)", _mejor_de(referencia), _mejor_de(lambda: (app._get_df_stock(s1), app._racks_clave(s1, clave))))
+    print(f"  {'primera vez tras una escritura':<34} {_mejor_de(lambda: app._shared_cache()['hojas'][s1]['derivados'].clear() or app._racks_clave(s1, clave)) * 1000:9.1f} ms")
+
+def bench_red(filas: int = 20_000, veces: int = 200):
+    """Existencia de una CLAVE en las 4 sucursales: filtro + groupby por frame contra la matriz CLAVE × sucursal."""
+    ss = _app_simulada(filas, latencia=0, cuota=None)
+    app._init_session()
+    claves = app._get_df(list(app.SUCURSALES)[0])["CLAVE"].sample(50, random_state=1).tolist()
+
+    def referencia(clave):
+        out = {}
+        for s in app.SUCURSALES:
+            df = app._get_df(s)
+            g = df[(df["CLAVE"] == clave) & (df["CANTIDAD"] > 0)].groupby("RACK")["CANTIDAD"].sum()
+            out[s] = {r: q for r, q in g.items() if q > 0}
+        return out
+
+    for c in claves: assert app._stock_red(c) == referencia(c), c
+    # La matriz se parcha con cada escritura y sigue cuadrando con los frames
+    s1, s2 = list(app.SUCURSALES)[:2]
+    df = app._get_df(s1)
+    for c, r in list(zip(df["CLAVE"], df["RACK"]))[:veces // 10]:
+        app.op_venta(s1, c, r, "bench", 1, 0, "bench") if app._find_row(s1, c, r)[1] else app.op_alta(s1, c, "x", r, 2, "bench")
+        app.op_send_transfer(s1, c, r, 1, s2, "bench")
+    for c in claves + list(df["CLAVE"][:veces // 10]): assert app._stock_red(c) == referencia(c), c
+    print(f"existencias en la red ({filas:,} filas × {len(app.SUCURSALES)} sucursales) — mismo resultado, también tras {veces // 5} escrituras")
+    print(f"  {'armar matriz (1 vez por recarga)':<34} {_mejor_de(lambda: [app._red_sucursal(app._get_df(s)) for s in app.SUCURSALES], 1) * 1000:9.1f} ms")
+    _reporte("consulta por clave", _mejor_de(lambda: [referencia(c) for c in claves], 1) / len(claves),
+             _mejor_de(lambda: [app._stock_red(c) for c in claves]) / len(claves))
+
+def bench_pedido_archivo(lineas: int = 200_000, claves: int = 5_000):
+    """Manifiesto CSV de un proveedor: lectura por bloques y agregado, y su alta en lotes contra la API simulada."""
+    rnd = random.Random(3)
+    catalogo = [f"fw{i}" for i in range(claves)]
+    texto = "Clave;Cantidad;Rack\n" + "".join(f"{rnd.choice(catalogo)};{rnd.randint(1, 4)};{rnd.choice(['1', '2', 'peine', ''])}\n" for _ in range(lineas))
+    datos = texto.encode()
+
+    def referencia():
+        total: dict[tuple[str, str], int] = {}
+        for fila in texto.splitlines()[1:]:
+            c, q, r = fila.split(";")
+            k = (app._clean(c), app._normalize_rack(r or "PISO"))
+            total[k] = total.get(k, 0) + int(q)
+        return total
+
+    leer = lambda: app._agregar_pedido(app._bloques_pedido(app._tablas_manifiesto(io.BytesIO(datos), "pedido.csv"), "PISO"))
+    agregado, resumen = leer()
+    assert dict(zip(zip(agregado["CLAVE"], agregado["RACK"]), agregado["CANTIDAD"])) == referencia() and resumen["leidas"] == lineas
+    print(f"pedido desde archivo ({lineas:,} líneas, {len(datos) / 1e6:.1f} MB, {len(agregado):,} claves) — mismo agregado que línea por línea")
+    print(f"  {'leer y agregar por bloques':<34} {_mejor_de(leer, 3) * 1000:9.1f} ms   ({-(-lineas // app.PEDIDO_BLOQUE)} bloque(s) de {app.PEDIDO_BLOQUE:,} filas)")
+
+    ss = _app_simulada(10_000)
+    app._init_session()
+    _medir_api(ss, f"op_importar_pedido ({len(agregado):,} claves)", lambda i: app.op_importar_pedido(list(app.SUCURSALES)[0], agregado, "Parabrisas", "bench"))
+
+def bench_arranque(filas: int = 50_000, movimientos: int = 20_000):
+    """Reinicio del servidor: _init_session descargando todo contra publicar las instantáneas locales y sincronizar después."""
+    ss = _app_simulada(filas, latencia=0, cuota=None)
+    rnd = random.Random(5)
+    mov = ss.ws["Movimientos"].rows
+    mov += [[f"2026-01-{1 + i % 28:02d} 10:00:00", f"FW{rnd.randint(0, filas)}", "Venta/Instalación", "bench", "1", "0", "bench", "Inventario_Suc1"] for i in range(movimientos)]
+    app.SNAPSHOT_DIR = tempfile.mkdtemp(prefix="glass_snap_")
+    t0 = time.perf_counter()
+    app._init_session()
+    frio, llamadas_frio = time.perf_counter() - t0, ss.total_llamadas
+    app._instantaneas()["pool"].submit(lambda: None).result()  # instantáneas ya escritas
+
+    # Mientras el servidor estaba abajo: otra sucursal vendió y la bitácora creció
+    s1 = list(app.SUCURSALES)[0]
+    ss.ws[s1].rows[2][3] = "99"
+    mov += [list(mov[-1]) for _ in range(25)]
+    for recurso in (app._shared_cache, app._red, app._instantaneas): recurso.clear()
+    ss.reset_stats()
+    t0 = time.perf_counter()
+    app._init_session()
+    caliente = time.perf_counter() - t0
+    app._instantaneas()["hilo"].join()
+    llamadas_caliente = ss.total_llamadas
+    for name in [*app.SUCURSALES, "Movimientos"]:
+        pd.testing.assert_frame_equal(app._get_df(name), app._load_df(name), check_dtype=False)
+    print(f"arranque ({filas:,} filas/sucursal, {movimientos:,} movimientos) — tras sincronizar, mismos frames que una descarga completa")
+    _reporte("_init_session hasta mostrar datos", frio, caliente)
+    print(f"  {'llamadas (con la sincronización)':<34} {llamadas_frio:9d}    → {llamadas_caliente:8d}      (bitácora desde su última fila; de las sucursales, sólo la que cambió)")
+
+def bench_revalidacion(filas: int = 20_000, veces: int = 5):
+    """Reconciliación periódica: descargar todas las hojas contra revisión del libro + centinela por hoja."""
+    ss = _app_simulada(filas, cuota=None)
+    app._init_session()
+    hojas = [*app.SUCURSALES, "Movimientos", "Traslados_Pendientes"]
+    s1, s2 = list(app.SUCURSALES)[:2]
+    app._revalidar(hojas)  # primera pasada: guarda la revisión con la que se validó cada hoja
+    df = app._get_df(s1)
+    con_stock = df[df["CANTIDAD"] >= 1].drop_duplicates(["CLAVE", "RACK"]).head(veces)
+    print(f"revalidación ({filas:,} filas/sucursal, promedio de {veces}; API simulada: {LATENCIA_SIM} s/llamada)")
+    _medir_api(ss, "descarga completa (antes)", lambda i: app._load_many(hojas), veces)
+    def escenario(nombre: str, preparar, esperadas: list[str]):
+        llamadas = cpu = 0.0
+        for i in range(veces):
+            preparar(i)
+            ss.reset_stats()
+            t0 = time.perf_counter()
+            assert app._revalidar(hojas) == esperadas, nombre
+            cpu, llamadas = cpu + time.perf_counter() - t0, llamadas + ss.total_llamadas
+        print(f"  {nombre:<40} {llamadas / veces:6.1f} llamadas  {cpu / veces * 1000:8.1f} ms CPU   descargadas: {', '.join(esperadas) or '—'}")
+    escenario("sin cambios", lambda i: None, [])
+    # La venta ya parchó la caché (inventario y bitácora): el centinela cuadra y no se descarga nada
+    escenario("tras una venta de esta app", lambda i: (app.op_venta(s1, con_stock["CLAVE"].iloc[i], con_stock["RACK"].iloc[i], "bench", 1, 0, "bench"), app._flush_movements()), [])
+    escenario("tras editar otra hoja a mano", lambda i: ss.ws[s2].update_cell(filas // 2 + i, 4, "77"), [s2])
+    for name in hojas:
+        pd.testing.assert_frame_equal(app._get_df(name), app._load_df(name), check_dtype=False)
+    print("  (tras cada escenario, mismos frames que una descarga completa)")
+
+def bench_memoria(filas: int = 50_000, movimientos: int = 100_000):
+    """Memoria de los frames en caché: texto/int64 (antes) contra categorías, int32 y FECHA datetime."""
+    rnd = random.Random(11)
+    tipos = ["Venta/Instalación", "Alta/Compra", "Traslado Enviado", "Traslado Recibido", "Reubicación Interna"]
+    mov = [app.ENCABEZADOS["Movimientos"]] + [[f"2026-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:00:00", f"FW{rnd.randint(0, filas)}", rnd.choice(tipos), "bench",
+                                                str(rnd.randint(1, 4)), str(rnd.choice([0, 1500, 2500])), f"usuario{i % 9}", rnd.choice(list(app.SUCURSALES))] for i in range(movimientos)]
+    hojas = {f"sucursal ({filas:,} filas) × {len(app.SUCURSALES)}": app._values_to_df(hoja_inventario(filas)), f"Movimientos ({movimientos:,} filas)": app._values_to_df(mov)}
+    for df in hojas.values(): pd.testing.assert_frame_equal(app._values_to_df([list(df.columns)] + app._a_valores(df)), df)
+    print("memoria de la caché — _a_valores reconstruye el mismo frame (ida y vuelta sin pérdida)")
+    total_c = total_t = 0
+    for nombre, df in hojas.items():
+        veces = len(app.SUCURSALES) if nombre.startswith("sucursal") else 1
+        c, t = app._memoria_frame(df)
+        total_c, total_t = total_c + c * veces, total_t + t * veces
+        print(f"  {nombre:<34} {t * veces / 1e6:9.1f} MB → {c * veces / 1e6:8.1f} MB   (-{1 - c / t:.0%})")
+    print(f"  {'total':<34} {total_t / 1e6:9.1f} MB → {total_c / 1e6:8.1f} MB   (-{1 - total_c / total_t:.0%})")
+
+def bench_carga(tamanos: tuple[int, ...] = (1_000, 10_000, 50_000)):
+    """_init_session en frío (las 6 hojas) con hojas de sucursal de distintos tamaños."""
+    print(f"carga inicial (API simulada: {LATENCIA_SIM} s/llamada, {CUOTA_SIM}/min)")
+    for filas in tamanos:
+        ss = _app_simulada(filas)
+        _medir_api(ss, f"_init_session {filas:,} filas/sucursal", lambda i: app._init_session())
+
+def bench_operaciones(filas: int = 10_000, veces: int = 20):
+    """Costo por operación con la caché ya cargada (lo que paga un usuario en mostrador)."""
+    ss = _app_simulada(filas)
+    app._init_session()
+    s1, s2 = list(app.SUCURSALES)[:2]
+    df = app._get_df(s1)
+    con_stock = df[df["CANTIDAD"] >= 3].drop_duplicates(["CLAVE", "RACK"]).head(3 * veces)
+    claves = list(zip(con_stock["CLAVE"], con_stock["RACK"]))
+    print(f"operaciones ({filas:,} filas/sucursal, promedio de {veces}; API simulada: {LATENCIA_SIM} s/llamada, {CUOTA_SIM}/min)")
+    _medir_api(ss, "op_alta (clave existente)", lambda i: app.op_alta(s1, claves[i][0], "Parabrisas", claves[i][1], 1, "bench"), veces)
+    _medir_api(ss, "op_alta (clave nueva)", lambda i: app.op_alta(s1, f"BENCH{i}", "Parabrisas", "9", 1, "bench"), veces)
+    _medir_api(ss, "op_venta", lambda i: app.op_venta(s1, claves[veces + i][0], claves[veces + i][1], "bench", 1, 0, "bench"), veces)
+    _medir_api(ss, "op_send_transfer", lambda i: app.op_send_transfer(s1, claves[2 * veces + i][0], claves[2 * veces + i][1], 1, s2, "bench"), veces)
+    pendientes = app._get_df("Traslados_Pendientes").to_dict("records")
+    _medir_api(ss, "op_receive_transfer", lambda i: app.op_receive_transfer(s2, pendientes[i]["CLAVE"], "Parabrisas", 1, "9", pendientes[i]["ID"], "bench"), veces // 2)
+    _medir_api(ss, "op_cancel_transfer", lambda i: app.op_cancel_transfer(s1, pendientes[veces // 2 + i], "9", "bench"), veces // 2)
+
+    lineas = [(c, 1, r) for c, r in claves[:250]] + [(f"PED{i}", 2, "PISO") for i in range(500 - len(claves[:250]))]
+    _medir_api(ss, "pedido de 500 líneas (op_alta_masiva)", lambda i: app.op_alta_masiva(s2, lineas, "Parabrisas", "bench"))
+    _medir_api(ss, "limpiar_duplicados_cero", lambda i: app.limpiar_duplicados_cero(s1))
+    _medir_api(ss, "op_clean_duplicates", lambda i: app.op_clean_duplicates(s1))
+
+
+PRUEBAS = {"normalizacion": bench_normalizacion, "busqueda": bench_busqueda, "claves": bench_claves, "red": bench_red, "rerun": bench_rerun, "carga": bench_carga, "arranque": bench_arranque,
+           "revalidacion": bench_revalidacion, "memoria": bench_memoria,
+           "operaciones": bench_operaciones, "pedido_archivo": bench_pedido_archivo}
+
+if __name__ == "__main__":
+    for nombre in sys.argv[1:] or PRUEBAS:
+        PRUEBAS[nombre]()
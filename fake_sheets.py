@@ -0,0 +1,238 @@
+"""
+Spreadsheet simulado para medir la app sin tocar 'Inventario_Cristales'.
+
+Implementa la parte de gspread que usa app.py (Spreadsheet y Worksheet) sobre
+listas en memoria. Cada llamada cuenta como una petición a la API: avanza un
+reloj simulado `latencia` segundos (sin dormir) y respeta una cuota de
+peticiones por minuto simulado; al excederla responde 429 como Google Sheets
+y adelanta el reloj hasta que la ventana se libera.
+
+    ss = FakeSpreadsheet({"Inventario_Suc1": [encabezado, *filas]}, latencia=0.25, cuota_min=60)
+    app._connect_gsheets = lambda: ss
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import Counter, deque
+from types import SimpleNamespace
+
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_to_rowcol, numericise_all
+
+
+# Métodos que no modifican el libro (no avanzan su hora de última modificación)
+LECTURAS = {"get_all_values", "get_all_records", "col_values", "cell", "get", "batch_get", "values_batch_get", "worksheet", "worksheets", "get_lastUpdateTime"}
+
+
+def _error_429() -> APIError:
+    body = {"error": {"code": 429, "message": "Quota exceeded (simulado)", "status": "RESOURCE_EXHAUSTED"}}
+    return APIError(SimpleNamespace(json=lambda: body, text="", status_code=429))
+
+
+def _valor(celda: dict) -> str:
+    v = celda.get("userEnteredValue", {})
+    num = v.get("numberValue")
+    if num is None: return str(v.get("stringValue", ""))
+    return str(int(num)) if float(num).is_integer() else str(num)
+
+
+class FakeWorksheet:
+    def __init__(self, ss: FakeSpreadsheet, title: str, values: list[list], sheet_id: int):
+        self.spreadsheet = ss
+        self.title = title
+        self.id = sheet_id
+        self.rows = [[str(v) for v in r] for r in values]
+
+    def _api(self, metodo: str):
+        self.spreadsheet._api(self.title, metodo)
+
+    @property
+    def row_count(self) -> int:
+        return max(len(self.rows), 1000)
+
+    # ── Lecturas ─────────────────────────────────────────────────────────
+    def get_all_values(self, **kwargs):
+        self._api("get_all_values")
+        return [list(r) for r in self.rows]
+
+    def get_all_records(self, **kwargs):
+        self._api("get_all_records")
+        if not self.rows: return []
+        head = self.rows[0]
+        return [dict(zip(head, numericise_all((r + [""] * len(head))[:len(head)]))) for r in self.rows[1:]]
+
+    def col_values(self, col: int, **kwargs):
+        self._api("col_values")
+        vals = [r[col - 1] if len(r) >= col else "" for r in self.rows]
+        while vals and vals[-1] == "": vals.pop()
+        return vals
+
+    def cell(self, row: int, col: int, **kwargs):
+        self._api("cell")
+        r = self.rows[row - 1] if row - 1 < len(self.rows) else []
+        return SimpleNamespace(row=row, col=col, value=r[col - 1] if col - 1 < len(r) else None)
+
+    def _rango(self, rng: str) -> list[list]:
+        a, _, b = rng.partition(":")
+        if a.isalpha():  # columna completa, p. ej. "A:A"
+            col = a1_to_rowcol(f"{a}1")[1]
+            vals = [[r[col - 1]] if len(r) >= col and r[col - 1] != "" else [] for r in self.rows]
+        else:
+            r0, c0 = a1_to_rowcol(a)
+            # Rango abierto hacia abajo ("A5:H"): hasta la última fila con datos
+            r1, c1 = (len(self.rows), a1_to_rowcol(f"{b}1")[1]) if b.isalpha() else a1_to_rowcol(b or a)
+            vals = [self.rows[r - 1][c0 - 1:c1] for r in range(r0, min(r1, len(self.rows)) + 1)]
+        while vals and not any(vals[-1]): vals.pop()
+        return vals
+
+    def get(self, rng: str, **kwargs):
+        self._api("get")
+        return self._rango(rng)
+
+    def batch_get(self, ranges: list[str], **kwargs):
+        self._api("batch_get")
+        return [self._rango(rng) for rng in ranges]
+
+    # ── Escrituras ───────────────────────────────────────────────────────
+    def _set(self, row: int, col: int, value):
+        while len(self.rows) < row: self.rows.append([])
+        r = self.rows[row - 1]
+        while len(r) < col: r.append("")
+        r[col - 1] = "" if value is None else str(value)
+
+    def _write_range(self, rng: str, values: list[list]):
+        r0, c0 = a1_to_rowcol(rng.split(":")[0])
+        for i, row in enumerate(values):
+            for j, v in enumerate(row): self._set(r0 + i, c0 + j, v)
+
+    def update_cell(self, row: int, col: int, value):
+        self._api("update_cell")
+        self._set(row, col, value)
+
+    def update(self, values=None, range_name=None, **kwargs):
+        self._api("update")
+        if isinstance(values, str): values, range_name = range_name, values
+        self._write_range(range_name or "A1", values)
+
+    def batch_update(self, data: list[dict], **kwargs):
+        self._api("batch_update")
+        for d in data: self._write_range(d["range"], d["values"])
+
+    def append_row(self, values: list, **kwargs):
+        self._api("append_row")
+        self.rows.append([str(v) for v in values])
+
+    def append_rows(self, values: list[list], **kwargs):
+        self._api("append_rows")
+        self.rows.extend([str(v) for v in r] for r in values)
+
+    def delete_rows(self, start: int, end: int | None = None):
+        self._api("delete_rows")
+        del self.rows[start - 1:end or start]
+
+    def clear(self):
+        self._api("clear")
+        self.rows = []
+
+
+class FakeSpreadsheet:
+    """
+    `latencia`: segundos simulados por petición. `cuota_min`: peticiones por
+    minuto simulado (None = sin límite). `llamadas` cuenta (hoja, método) y
+    `reloj` acumula el tiempo simulado; `throttled` cuenta los 429 emitidos.
+    `modificaciones` cuenta las escrituras (get_lastUpdateTime la refleja).
+    """
+
+    def __init__(self, sheets: dict[str, list[list]], latencia: float = 0.0, cuota_min: int | None = None):
+        self.ws = {name: FakeWorksheet(self, name, values, i + 1) for i, (name, values) in enumerate(sheets.items())}
+        self.latencia = latencia
+        self.cuota_min = cuota_min
+        self.llamadas: Counter = Counter()
+        self.reloj = 0.0
+        self.throttled = 0
+        self.modificaciones = 0
+        self._ventana: deque = deque()
+        self._lock = threading.Lock()
+
+    def _api(self, hoja: str, metodo: str):
+        with self._lock:
+            if self.cuota_min is not None:
+                while self._ventana and self._ventana[0] <= self.reloj - 60: self._ventana.popleft()
+                if len(self._ventana) >= self.cuota_min:
+                    # Se rechaza y el reloj avanza hasta que la ventana de un minuto se libera
+                    self.throttled += 1
+                    self.reloj = self._ventana[0] + 60
+                    raise _error_429()
+                self._ventana.append(self.reloj)
+            self.llamadas[(hoja, metodo)] += 1
+            self.reloj += self.latencia
+            if metodo not in LECTURAS: self.modificaciones += 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.llamadas.clear()
+            self.reloj = 0.0
+            self.throttled = 0
+            self._ventana.clear()
+
+    @property
+    def total_llamadas(self) -> int:
+        return sum(self.llamadas.values())
+
+    def worksheet(self, name: str) -> FakeWorksheet:
+        self._api(name, "worksheet")
+        if name not in self.ws: raise WorksheetNotFound(name)
+        return self.ws[name]
+
+    def worksheets(self) -> list[FakeWorksheet]:
+        self._api("*", "worksheets")
+        return list(self.ws.values())
+
+    def add_worksheet(self, title: str, rows: int = 1, cols: int = 1, **kwargs) -> FakeWorksheet:
+        self._api(title, "add_worksheet")
+        self.ws[title] = FakeWorksheet(self, title, [], len(self.ws) + 1)
+        return self.ws[title]
+
+    def batch_update(self, body: dict):
+        """spreadsheets.batchUpdate: updateCells, appendCells, appendDimension y deleteDimension, todo o nada."""
+        self._api("*", "batch_update")
+        por_id = {ws.id: ws for ws in self.ws.values()}
+        tocadas = {por_id[(d.get("start") or d.get("range") or d)["sheetId"]] for req in body["requests"] for d in req.values()}
+        respaldo = {ws: [list(r) for r in ws.rows] for ws in tocadas}
+        try:
+            for req in body["requests"]:
+                (tipo, d), = req.items()
+                if tipo == "updateCells":
+                    ws, r0, c0 = por_id[d["start"]["sheetId"]], d["start"]["rowIndex"], d["start"]["columnIndex"]
+                    for i, row in enumerate(d["rows"]):
+                        for j, celda in enumerate(row["values"]): ws._set(r0 + i + 1, c0 + j + 1, _valor(celda))
+                elif tipo == "appendCells":
+                    ws = por_id[d["sheetId"]]
+                    while ws.rows and not any(ws.rows[-1]): ws.rows.pop()
+                    ws.rows.extend([_valor(c) for c in row["values"]] for row in d["rows"])
+                elif tipo == "appendDimension":
+                    pass  # la cuadrícula simulada crece sola
+                elif tipo == "deleteDimension":
+                    rng = d["range"]
+                    del por_id[rng["sheetId"]].rows[rng["startIndex"]:rng["endIndex"]]
+                else:
+                    raise ValueError(f"petición no soportada: {tipo}")
+        except Exception:
+            for ws, rows in respaldo.items(): ws.rows = rows
+            raise
+        return {"replies": [{} for _ in body["requests"]]}
+
+    def values_batch_get(self, ranges: list[str], params=None):
+        self._api("*", "values_batch_get")
+        out = []
+        for rng in ranges:
+            hoja, _, celdas = rng.partition("!")
+            ws = self.ws[hoja.strip("'")]
+            out.append({"range": rng, "values": ws._rango(celdas) if celdas else [list(r) for r in ws.rows]})
+        return {"valueRanges": out}
+
+    def get_lastUpdateTime(self) -> str:
+        """Hora de última modificación (Drive); aquí, derivada del contador de escrituras."""
+        self._api("*", "get_lastUpdateTime")
+        return f"2024-01-01T00:00:00.{self.modificaciones:06d}Z"
@@ -0,0 +1,110 @@
+"""
+Mantenimiento de Glass Inventory fuera de la app (pensado para cron).
+
+    python mantenimiento.py                          # ceros + consolidación en todas las sucursales
+    python mantenimiento.py --dry-run                # sólo muestra lo que cambiaría
+    python mantenimiento.py --tareas ceros --sucursales Inventario_Suc1 Inventario_Suc3
+
+Reutiliza la lógica de app.py (limpiar_duplicados_cero y op_clean_duplicates)
+y su cliente de Google Sheets, así que las sucursales se procesan en paralelo
+(a lo más --hilos a la vez) sin rebasar la cuota por minuto; con --cuota se
+le deja margen a la app en vivo. Se corre desde la carpeta de la app (lee
+.streamlit/secrets.toml y GLASS_STORAGE) y sale con código 1 si algo falló.
+Usa su propio spool de bitácora (el de la app lo envía sólo la app) y los
+mismos candados de archivo por hoja, así no escribe a la vez que la app.
+
+Cron, todas las noches a las 3:30:
+    30 3 * * * cd /ruta/a/la/app && python mantenimiento.py >> mantenimiento.log 2>&1
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+import streamlit.logger
+
+streamlit.logger.set_log_level("error")  # sin los avisos de Streamlit fuera de `streamlit run`
+import app
+
+# Spool propio: si enviara el de la app, los dos procesos podrían anexar el mismo lote a 'Movimientos'
+app.SPOOL_PATH = "mantenimiento_spool.sqlite"
+
+# Las de cero van primero: la consolidación ya no tiene que reescribir esas filas
+TAREAS = {"ceros": app.limpiar_duplicados_cero, "consolidar": app.op_clean_duplicates}
+
+# ═══════════════════════════════════════════════════════════════════════════
+# SIMULACIÓN (--dry-run)
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _diff_ceros(df: pd.DataFrame, detalle: int) -> tuple[pd.DataFrame, list[str]]:
+    filas = app._plan_duplicados_cero(df)
+    lineas = [f"  - fila {f}: {df.at[f - 2, 'CLAVE']} en {df.at[f - 2, 'RACK']} (0 pz)" for f in filas[:detalle]]
+    if len(filas) > detalle: lineas.append(f"  … y {len(filas) - detalle} más")
+    return df.drop(index=[f - 2 for f in filas]).reset_index(drop=True), [f"{len(filas)} fila(s) con 0 piezas por eliminar", *lineas]
+
+def _diff_consolidacion(df: pd.DataFrame, detalle: int) -> tuple[pd.DataFrame, list[str]]:
+    dup = df[df.duplicated(["CLAVE", "RACK"], keep=False)].assign(FILA=lambda d: d.index + 2)
+    grupos = dup.groupby(["CLAVE", "RACK"], sort=False).agg(FILAS=("FILA", list), CANTIDADES=("CANTIDAD", list), TOTAL=("CANTIDAD", "sum"))
+    lineas = [f"  ~ {clave} en {rack}: filas {', '.join(map(str, g.FILAS))} ({' + '.join(map(str, g.CANTIDADES))}) → 1 fila con {g.TOTAL} pz"
+              for (clave, rack), g in grupos.head(detalle).iterrows()]
+    if len(grupos) > detalle: lineas.append(f"  … y {len(grupos) - detalle} grupos más")
+    consolidado = app._plan_consolidacion(df)
+    return consolidado, [f"{len(df) - len(consolidado)} fila(s) por consolidar en {len(grupos)} grupo(s)", *lineas]
+
+DIFFS = {"ceros": _diff_ceros, "consolidar": _diff_consolidacion}
+
+# ═══════════════════════════════════════════════════════════════════════════
+# EJECUCIÓN
+# ═══════════════════════════════════════════════════════════════════════════
+
+def mantener(sheet: str, tareas: list[str], dry_run: bool, detalle: int) -> tuple[bool, list[str]]:
+    """Corre las tareas de una sucursal en orden; retorna (todo_ok, líneas de reporte)."""
+    t0 = time.perf_counter()
+    salida, todo_ok = [f"■ {app.SUCURSALES[sheet]} ({sheet})"], True
+    if dry_run:
+        try:
+            # Una sola descarga; cada simulación parte del resultado de la anterior
+            df = app._load_df(sheet)
+            for tarea in tareas:
+                df, lineas = DIFFS[tarea](df, detalle)
+                salida += [f"  [{tarea}] {lineas[0]}", *lineas[1:]]
+        except Exception as e:
+            todo_ok = False
+            salida.append(f"  ERROR: {e}")
+    else:
+        for tarea in tareas:
+            ok, msg = TAREAS[tarea](sheet)
+            todo_ok &= ok
+            salida.append(f"  [{tarea}] {'OK' if ok else 'ERROR'}: {msg}")
+    salida.append(f"  ({time.perf_counter() - t0:.1f} s)")
+    return todo_ok, salida
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Consolidación y limpieza de duplicados de todas las sucursales.")
+    parser.add_argument("--tareas", nargs="+", choices=list(TAREAS), default=list(TAREAS), help="tareas a correr (ceros siempre antes que consolidar)")
+    parser.add_argument("--sucursales", nargs="+", choices=list(app.SUCURSALES), default=list(app.SUCURSALES))
+    parser.add_argument("--hilos", type=int, default=app.CARGA_HILOS, help="sucursales procesadas a la vez")
+    parser.add_argument("--cuota", type=int, help="llamadas por minuto (lectura y escritura) para este proceso")
+    parser.add_argument("--dry-run", action="store_true", help="no escribe: muestra qué filas se borrarían o consolidarían")
+    parser.add_argument("--detalle", type=int, default=20, help="líneas de detalle por tarea en --dry-run")
+    args = parser.parse_args(argv)
+
+    if args.cuota: app.SHEETS_LECTURAS_MIN = app.SHEETS_ESCRITURAS_MIN = args.cuota
+    tareas = [t for t in TAREAS if t in args.tareas]
+
+    print(f"{datetime.now():%Y-%m-%d %H:%M:%S} mantenimiento{' (simulación)' if args.dry_run else ''}: {', '.join(tareas)}")
+    with ThreadPoolExecutor(max_workers=max(args.hilos, 1)) as pool:
+        resultados = list(pool.map(lambda s: mantener(s, tareas, args.dry_run, args.detalle), args.sucursales))
+    for _, salida in resultados: print("\n".join(salida))
+    fallas = sum(not ok for ok, _ in resultados)
+    print(f"{len(resultados) - fallas} de {len(resultados)} sucursales sin errores.")
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Accesorios de las pruebas: la app conectada a un fake_sheets.FakeSpreadsheet
+pequeño y determinista, con spool, candados y SQLite en un directorio
+temporal y todos los recursos compartidos (st.cache_resource) limpios.
+
+    python -m pytest -q
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+
+import pytest
+import streamlit.logger
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+streamlit.logger.set_log_level("error")  # sin los avisos de Streamlit fuera de `streamlit run`
+
+import app
+from fake_sheets import FakeSpreadsheet
+
+FECHA = "2026-01-01 10:00:00"
+S1, S2 = "Inventario_Suc1", "Inventario_Suc2"
+
+RECURSOS = (app._client, app._backend, app._spool, app._shared_cache, app._write_locks, app._telemetria,
+            app._red, app._instantaneas, app._revalidacion, app._indices_claves, app._archivo_estado)
+
+
+def inventario() -> list[list]:
+    """Hoja de sucursal como la entrega Sheets: texto, con una clave repetida en el mismo rack."""
+    return [list(app.ENCABEZADOS_INVENTARIO),
+            ["756", "Parabrisas", "RACK 1", "5", FECHA],
+            ["FW1", "Medallón", "PISO", "0", FECHA],
+            ["FW1", "Medallón", "PISO", "3", FECHA],
+            ["DW2", "Aleta", "RACK 2", "4", FECHA]]
+
+
+@pytest.fixture(params=["sheets", "sqlite+sheets"])
+def libro(request, tmp_path, monkeypatch) -> FakeSpreadsheet:
+    """Spreadsheet simulado con la app apuntando a él, con cada backend."""
+    hojas = {s: inventario() for s in app.SUCURSALES} | {n: [list(c)] for n, c in app.ENCABEZADOS.items()}
+    ss = FakeSpreadsheet(hojas)
+    monkeypatch.setattr(app, "_connect_gsheets", lambda: ss)
+    monkeypatch.setattr(app, "STORAGE_BACKEND", request.param)
+    monkeypatch.setattr(app, "SQLITE_PATH", str(tmp_path / "inventario.sqlite"))
+    monkeypatch.setattr(app, "SPOOL_PATH", str(tmp_path / "spool.sqlite"))
+    monkeypatch.setattr(app, "BLOQUEOS_DIR", str(tmp_path / "bloqueos"))
+    monkeypatch.setattr(app, "SNAPSHOT_DIR", "")
+    monkeypatch.setattr(app, "SHEETS_ESPERA_BASE", 0.001)
+    for recurso in RECURSOS: recurso.clear()
+    app._archivo_estado()["ultimo"] = float("inf")  # sin archivo automático en segundo plano
+    yield ss
+    be = app._backend()
+    if getattr(be, "_mirror_pool", None): be._mirror_pool.shutdown(wait=True)
+    for recurso in RECURSOS: recurso.clear()
+
+
+def espejo_al_dia():
+    """Espera a que el espejo (sqlite+sheets) termine de replicar lo encolado."""
+    be = app._backend()
+    if getattr(be, "_mirror_pool", None): be._mirror_pool.submit(lambda: None).result()
+
+
+def filas(ss: FakeSpreadsheet, hoja: str) -> list[list]:
+    """Filas de datos de la hoja simulada, con el espejo ya replicado."""
+    espejo_al_dia()
+    return [list(r) for r in ss.ws[hoja].rows[1:]]
+
+
+def cache_igual_a_hoja(hoja: str) -> bool:
+    """El frame en caché (parchado con deltas) coincide con una descarga fresca del backend."""
+    espejo_al_dia()
+    fresca = app.SheetsBackend().load_table(hoja)
+    return app._get_df(hoja).astype(str).values.tolist() == fresca.astype(str).values.tolist()
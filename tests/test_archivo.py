@@ -0,0 +1,89 @@
+"""
+Archivo de la bitácora: el prefijo antiguo pasa a particiones mensuales sin
+perder ni duplicar filas aunque otro archivador borre en medio, y la
+Auditoría pagina la bitácora completa (particiones + hoja viva) leyendo
+sólo los segmentos que toca cada página.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+import app
+from conftest import filas
+
+HOY = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+BITACORA = [["2020-01-15 10:00:00", "A1", "Venta/Instalación", "d", "1", "0", "u", "Inventario_Suc1"],
+            ["2020-01-20 10:00:00", "A2", "Venta/Instalación", "d", "1", "0", "u", "Inventario_Suc1"],
+            ["2020-02-03 10:00:00", "A3", "Alta/Compra", "d", "2", "0", "u", "Inventario_Suc2"],
+            [HOY, "B1", "Venta/Instalación", "d", "1", "0", "u", "Inventario_Suc1"],
+            [HOY, "B2", "Alta/Compra", "d", "3", "0", "u", "Inventario_Suc2"]]
+
+
+@pytest.fixture
+def ss(libro):
+    libro.ws["Movimientos"].rows += [list(r) for r in BITACORA]
+    app._init_session()
+    return libro
+
+
+def bitacora_completa(ss) -> Counter:
+    hojas = ["Movimientos"] + [n for n in ss.ws if n.startswith("Movimientos_")]
+    return Counter(tuple(r) for n in hojas for r in filas(ss, n))
+
+
+def test_archiva_prefijo_por_mes(ss):
+    ok, msg = app.archivar_movimientos()
+    assert ok, msg
+    assert [r[1] for r in filas(ss, "Movimientos")] == ["B1", "B2"]
+    assert [r[1] for r in filas(ss, "Movimientos_2020_01")] == ["A1", "A2"]
+    assert [r[1] for r in filas(ss, "Movimientos_2020_02")] == ["A3"]
+    assert app._get_df("Movimientos")["CLAVE"].tolist() == ["B1", "B2"]
+    assert app.archivar_movimientos()[1].startswith("No hay movimientos anteriores")
+    assert bitacora_completa(ss) == Counter(tuple(r) for r in BITACORA)
+
+
+def test_otro_archivador_en_medio_no_borra_filas_nuevas(ss, monkeypatch):
+    orig, n = app._cache_drop, {"c": 0}
+    def otro_archivador(nombre):
+        # Tras copiar y antes de borrar: el candado de la hoja está tomado, y "otro proceso" ya borró el prefijo
+        tomado = []
+        hilo = threading.Thread(target=lambda: tomado.append(not app._sheet_lock("Movimientos").lock.acquire(blocking=False)))
+        hilo.start(); hilo.join()
+        assert tomado == [True]
+        if not n["c"]: app._backend().delete_rows("Movimientos", [2, 3, 4])
+        n["c"] += 1
+        orig(nombre)
+    monkeypatch.setattr(app, "_cache_drop", otro_archivador)
+    ok, msg = app.archivar_movimientos()
+    assert not ok and "no se borró nada" in msg
+    assert [r[1] for r in filas(ss, "Movimientos")] == ["B1", "B2"]
+    assert app._get_df("Movimientos")["CLAVE"].tolist() == ["B1", "B2"]
+    assert app.archivar_movimientos()[1].startswith("No hay movimientos anteriores")
+    assert bitacora_completa(ss) == Counter(tuple(r) for r in BITACORA)
+
+
+def test_pagina_cruza_particiones(ss):
+    assert app.archivar_movimientos()[0]
+    segmentos = [(n, None, app._filas_particion(n)) for n in app._mov_particiones()[::-1]]
+    segmentos.append(("Movimientos", app._get_df("Movimientos"), len(app._get_df("Movimientos"))))
+    assert [n for _, _, n in segmentos] == [2, 1, 2]
+    ss.reset_stats()
+    pag = app._pagina_historial(segmentos, 1, 4)  # A2 (2020_01), A3 (2020_02) y B1 (hoja viva)
+    assert pag["CLAVE"].astype(str).tolist() == ["A2", "A3", "B1"]
+    assert pag["FECHA"].astype(str).str.slice(0, 10).tolist() == ["2020-01-20", "2020-02-03", HOY[:10]]
+    assert app._pagina_historial(segmentos, 3, 5)["CLAVE"].astype(str).tolist() == ["B1", "B2"]
+    if app.STORAGE_BACKEND == "sheets":
+        # Una lectura por rango de la partición tocada; la hoja viva sale de memoria
+        assert {h for h, _ in ss.llamadas} == {"Movimientos_2020_01", "Movimientos_2020_02"}
+
+
+def test_filtro_de_auditoria():
+    df = app._normalize_df(app._values_to_df([app.ENCABEZADOS["Movimientos"]] + [list(r) for r in BITACORA]))
+    assert app._filtrar_movimientos(df, "Todos", "Todas") is df
+    assert app._filtrar_movimientos(df, "Alta/Compra", "Todas")["CLAVE"].astype(str).tolist() == ["A3", "B2"]
+    assert app._filtrar_movimientos(df, "Venta/Instalación", "Inventario_Suc1")["CLAVE"].astype(str).tolist() == ["A1", "A2", "B1"]
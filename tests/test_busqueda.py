@@ -0,0 +1,53 @@
+"""
+Filtro del Panel de Control: la llave de texto precalculada y las máscaras
+de categoría dan las mismas filas que el str.contains sobre todo el frame,
+y se reconstruyen con cada versión de la hoja.
+"""
+
+from __future__ import annotations
+
+import pandas as pd
+import pytest
+
+import app
+from benchmark import hoja_inventario
+from conftest import S1
+
+DF = app._values_to_df(hoja_inventario(2_000))
+
+
+def referencia(df: pd.DataFrame, filtro: str) -> list[pd.DataFrame]:
+    v = df[df.astype(str).apply(lambda col: col.str.contains(filtro, case=False, na=False, regex=False)).any(axis=1)]
+    return [v[v["NOMBRE"].str.contains("Parabrisas", case=False, na=False)], v[v["NOMBRE"].str.contains("Medallón", case=False, na=False)],
+            v[~v["NOMBRE"].str.contains("Parabrisas|Medallón", case=False, na=False)]]
+
+
+@pytest.mark.parametrize("filtro", ["7", "75", "fw1", "RACK 3", "medallón", "PEINE", "2026-01", "(", "a.b", "DW 1"])
+def test_filtro_y_pestanas_igual_que_contains(filtro):
+    busq = app._build_search(DF)
+    mask = app._search_mask(busq, filtro)
+    for esperado, cat in zip(referencia(DF, filtro), ("pb", "med", "otros")):
+        pd.testing.assert_frame_equal(DF.loc[busq[cat] & mask], esperado)
+
+
+def test_categorias_cubren_todo_sin_traslape():
+    busq = app._build_search(DF)
+    assert not (busq["pb"] & busq["med"]).any()
+    assert (busq["pb"] | busq["med"] | busq["otros"]).all()
+
+
+def test_memo_acotado():
+    busq = app._build_search(DF)
+    for i in range(app.BUSQ_MEMO + 5): app._search_mask(busq, str(i))
+    assert len(busq["memo"]) == app.BUSQ_MEMO
+    assert app._search_mask(busq, "fw1") is app._search_mask(busq, "FW1")
+
+
+def test_se_reconstruye_con_la_version(libro):
+    app._init_session()
+    df, busq = app._get_search(S1)
+    assert not app._search_mask(busq, "NUEVA9").any()
+    assert app._get_search(S1)[1] is busq
+    assert app.op_alta(S1, "NUEVA9", "Parabrisas", "RACK 3", 1, "u")[0]
+    df, busq = app._get_search(S1)
+    assert df.loc[busq["pb"] & app._search_mask(busq, "nueva9"), "CLAVE"].tolist() == ["NUEVA9"]
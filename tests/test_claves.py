@@ -0,0 +1,67 @@
+"""
+Búsqueda de claves del Centro de Operaciones: el índice de n-gramas da las
+mismas claves, en el mismo orden, que recorrer todas (subcadena por
+relevancia y, si casi no hay, claves a un error de dedo), y los parches
+clave por clave dejan el mismo índice que reconstruirlo.
+"""
+
+from __future__ import annotations
+
+import random
+
+import pytest
+
+import app
+from conftest import S1
+
+rnd = random.Random(4)
+CLAVES = sorted({rnd.choice(["FW", "DW", "756", "AB", "X"]) + "".join(rnd.choice("0123456789AB") for _ in range(rnd.randint(1, 5))) for _ in range(3_000)})
+
+
+def referencia(claves: list[str], t: str) -> list[str]:
+    res = sorted((c for c in claves if t in c), key=lambda c: app._rank_sub(c, t))[:app.LIMITE_COINCIDENCIAS]
+    if len(t) >= 3 and len(res) < app.SUGERENCIAS_TYPO:
+        res += sorted(c for c in claves if c not in res and app._casi_igual(t, c))[:app.SUGERENCIAS_TYPO - len(res)]
+    return res
+
+
+@pytest.mark.parametrize("t", ["7", "FW", "75", "756", "FW12", "DW1A", "AB9B", "X0", "FW1233", "7561", "ZZZZ", "WF12", "FWW12", "F12"])
+def test_indice_igual_que_recorrido(t):
+    assert app._search_keys_idx(app._build_key_index(CLAVES), t) == referencia(CLAVES, t)
+
+
+def test_todos_los_terminos_cortos_y_errores_de_dedo():
+    kidx = app._build_key_index(CLAVES)
+    terminos = {c[i:j] for c in CLAVES[::25] for i in range(len(c)) for j in range(i + 1, len(c) + 1)}
+    terminos |= {c[:k] + c[k + 1:] for c in CLAVES[::40] for k in range(len(c))}  # borrado de un carácter
+    for t in sorted(terminos): assert app._search_keys_idx(kidx, t) == referencia(CLAVES, t), t
+
+
+@pytest.mark.parametrize("a,b,esperado", [("FW12", "FW13", True), ("FW12", "FW123", True), ("FW12", "F12", True), ("FW12", "WF12", True),
+                                           ("FW12", "FW12", False), ("FW12", "FW1234", False), ("FW12", "WF21", False), ("AB", "BA", True)])
+def test_casi_igual(a, b, esperado):
+    assert app._casi_igual(a, b) is esperado and app._casi_igual(b, a) is esperado
+
+
+def test_parches_igual_que_reconstruir():
+    kidx = app._build_key_index(CLAVES)
+    quitar, agregar = CLAVES[::7], ["NUEVA1", "FW00000", "7"]
+    for c in quitar: app._kidx_remove(kidx, c)
+    for c in agregar: app._kidx_add(kidx, c)
+    nuevo = app._build_key_index(sorted(set(CLAVES) - set(quitar) | set(agregar)))
+    assert kidx["claves"] == nuevo["claves"] and kidx["por_largo"] == nuevo["por_largo"]
+    assert {g: l for g, l in kidx["ranking"].items() if l} == nuevo["ranking"]
+
+
+def test_busqueda_sigue_al_stock(libro):
+    app._init_session()
+    # Sin índice todavía: recorrido directo y construcción en segundo plano
+    assert app._search_keys(S1, "75") == ["756"]
+    app._key_index(S1, esperar=True)
+    assert app._search_keys(S1, "w") == ["DW2", "FW1"]
+    assert app.op_venta(S1, "DW2", "RACK 2", "d", 4, 0, "u")[0]
+    assert app._search_keys(S1, "w") == ["FW1"]
+    assert app.op_alta(S1, "DW9", "Aleta", "RACK 1", 1, "u")[0]
+    assert app._search_keys(S1, "DW") == ["DW9"]
+    # Con tan pocas claves cada cambio es grande y el índice se reconstruye en segundo plano
+    assert app._key_index(S1, esperar=True)["version"] == app._cache_entry(S1)["version"]
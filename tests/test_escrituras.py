@@ -0,0 +1,197 @@
+"""
+Capa de escritura contra fake_sheets: los deltas parchan la caché igual que
+una recarga, las escrituras condicionadas detectan existencias cambiadas
+(y reintentan o rechazan sin escribir), y los traslados viajan en un solo
+batchUpdate. Cada prueba corre con "sheets" y con "sqlite+sheets".
+"""
+
+from __future__ import annotations
+
+import pytest
+
+import app
+from conftest import FECHA, S1, S2, cache_igual_a_hoja, espejo_al_dia, filas
+
+HOJAS = list(app.SUCURSALES) + ["Movimientos", "Traslados_Pendientes"]
+
+
+@pytest.fixture
+def ss(libro):
+    app._init_session()
+    libro.reset_stats()
+    return libro
+
+
+def todo_al_dia():
+    for hoja in HOJAS: assert cache_igual_a_hoja(hoja), hoja
+
+
+def interferir(monkeypatch, nombre, cambio, veces=1):
+    """Envuelve la lectura fresca `nombre` para que otra "sesión" cambie la fila justo después de leerla."""
+    orig, n = getattr(app, nombre), {"c": 0}
+    def envoltura(*args):
+        out = orig(*args)
+        if n["c"] < veces:
+            n["c"] += 1; cambio(out)
+        return out
+    monkeypatch.setattr(app, nombre, envoltura)
+    return n
+
+
+# ── Deltas: la caché parchada coincide con la hoja ──
+
+def test_alta_existente_y_nueva(ss):
+    assert app.op_alta(S1, "756", "Parabrisas", "RACK 1", 2, "u")[0]
+    assert app.op_alta(S1, "NUEVA1", "Puerta", "RACK 3", 4, "u")[0]
+    assert filas(ss, S1)[0][3] == "7"
+    assert filas(ss, S1)[-1][:4] == ["NUEVA1", "Puerta", "RACK 3", "4"]
+    assert app._find_row(S1, "NUEVA1", "RACK 3") == (6, 4)
+    todo_al_dia()
+
+
+def test_alta_masiva(ss):
+    ok, _, resultados = app.op_alta_masiva(S1, [("756", 3, "1"), ("NUEVA2", 2, "9"), ("756", 1, "RACK 1")], "Parabrisas", "u")
+    assert ok and all(r["OK"] for r in resultados)
+    assert filas(ss, S1)[0][3] == "9"
+    assert [f[:4] for f in filas(ss, S1) if f[0] == "NUEVA2"] == [["NUEVA2", "Parabrisas", "RACK 9", "2"]]
+    todo_al_dia()
+
+
+def test_venta(ss):
+    ok, msg = app.op_venta(S1, "756", "RACK 1", "d", 2, 100, "u")
+    assert ok, msg
+    assert filas(ss, S1)[0][3] == "3"
+    assert app.op_venta(S1, "756", "RACK 1", "d", 9, 100, "u") == (False, "Stock insuficiente. Disponible: 3 pz.")
+    todo_al_dia()
+    assert app._get_df("Movimientos")["TIPO"].tolist() == ["Venta/Instalación"]
+
+
+@pytest.mark.parametrize("destino,esperadas", [
+    ("RACK 2", [["756", "RACK 1", "3"], ["DW2", "RACK 2", "4"], ["756", "RACK 2", "3"]]),  # rack con fila: dos updates
+    ("RACK 9", [["756", "RACK 1", "3"], ["DW2", "RACK 2", "4"], ["756", "RACK 9", "2"]]),  # rack nuevo: update + append
+])
+def test_reubicar(ss, destino, esperadas):
+    if destino == "RACK 2": assert app.op_alta(S1, "756", "Parabrisas", "RACK 2", 1, "u")[0]
+    ss.reset_stats()
+    assert app.op_relocate(S1, "756", "Parabrisas", "RACK 1", destino, 2, "u")[0]
+    assert ss.llamadas[("*", "batch_update")] == 1  # descuento, destino y bitácora juntos
+    assert [[f[0], f[2], f[3]] for f in filas(ss, S1) if f[0] != "FW1"] == esperadas
+    todo_al_dia()
+
+
+def test_limpiezas(ss):
+    assert app.limpiar_duplicados_cero(S1)[0]
+    assert [f[:4] for f in filas(ss, S1) if f[0] == "FW1"] == [["FW1", "Medallón", "PISO", "3"]]
+    assert app.op_clean_duplicates(S2)[0]
+    assert [f[:4] for f in filas(ss, S2) if f[0] == "FW1"] == [["FW1", "Medallón", "RACK PISO", "3"]]
+    assert len(filas(ss, S2)) == 3
+    todo_al_dia()
+
+
+# ── Conflictos: otra escritura entre la lectura y la escritura ──
+# La interferencia va al almacenamiento primario sin pasar por la caché, como la de otro proceso
+
+def sumar_en(hoja, piezas):
+    def cambio(out):
+        row, current = next(iter(out.values()))
+        app._backend().update_cells(hoja, {row: {"CANTIDAD": current + piezas}})
+    return cambio
+
+
+def test_venta_reintenta_tras_conflicto(ss, monkeypatch):
+    n = interferir(monkeypatch, "_find_rows", sumar_en(S1, 10))
+    ok, msg = app.op_venta(S1, "756", "RACK 1", "d", 1, 0, "u")
+    assert ok and n["c"] == 1
+    assert msg == "Venta confirmada. Quedan 14 pz en RACK 1."
+    assert filas(ss, S1)[0][3] == "14"
+    todo_al_dia()
+
+
+def test_venta_conflicto_persistente_no_escribe(ss, monkeypatch):
+    interferir(monkeypatch, "_find_rows", sumar_en(S1, 1), veces=app.CONFLICTO_REINTENTOS)
+    assert app.op_venta(S1, "756", "RACK 1", "d", 1, 0, "u") == (False, app.CONFLICTO_MSG)
+    assert filas(ss, S1)[0][3] == str(5 + app.CONFLICTO_REINTENTOS)
+    assert not app._get_df("Movimientos").shape[0]
+
+
+def test_recepcion_conflicto(ss, monkeypatch):
+    assert app.op_send_transfer(S1, "756", "RACK 1", 3, S2, "u")[0]
+    tid = app._get_df("Traslados_Pendientes")["ID"].iloc[-1]
+    def cambio(out): app._backend().update_cells("Traslados_Pendientes", {out[0]: {"CANTIDAD": 2}})
+    n = interferir(monkeypatch, "_find_transfer", cambio)
+    assert app.op_receive_transfer(S2, "756", "Parabrisas", 3, "9", tid, "u") == (False, "Sólo quedan 2 pz pendientes de este traslado.")
+    assert n["c"] == 1
+    assert app.op_receive_transfer(S2, "756", "Parabrisas", 2, "9", tid, "u")[0]
+    assert filas(ss, "Traslados_Pendientes") == []
+    todo_al_dia()
+
+
+def test_write_batch_rechaza_esperado_viejo(ss):
+    be = app._backend()
+    escrituras = [("update", S1, {2: {"CANTIDAD": 1}})]
+    assert not be.write_batch(escrituras, {S1: {2: 4}})
+    assert filas(ss, S1)[0][3] == "5"
+    assert be.write_batch(escrituras, {S1: {2: 5}})
+    assert filas(ss, S1)[0][3] == "1"
+
+
+# ── Traslados: un solo batchUpdate por operación ──
+
+def test_envio_en_un_lote(ss):
+    app._backend().update_cells(S1, {2: {"NOMBRE": "Parabrisas Tintado"}})  # la caché aún dice "Parabrisas"
+    espejo_al_dia(); ss.reset_stats()
+    ok, msg = app.op_send_transfer(S1, "756", "RACK 1", 2, S2, "u")
+    assert ok, msg
+    assert ss.llamadas[("*", "batch_update")] == 1
+    assert not any(m in {"update", "append_rows", "append_row", "delete_rows"} for _, m in ss.llamadas)
+    assert filas(ss, S1)[0][3] == "3"
+    (pendiente,) = filas(ss, "Traslados_Pendientes")
+    assert pendiente[1:6] == ["756", "Parabrisas Tintado", "2", S1, S2]
+    assert filas(ss, "Movimientos")[0][2] == "Envío Traslado"
+
+
+def test_recepcion_parcial_y_total(ss):
+    assert app.op_send_transfer(S1, "DW2", "RACK 2", 4, S2, "u")[0]
+    tid = app._get_df("Traslados_Pendientes")["ID"].iloc[-1]
+    ss.reset_stats()
+    assert app.op_receive_transfer(S2, "DW2", "Aleta", 1, "RACK 2", tid, "u")[0]
+    assert ss.llamadas[("*", "batch_update")] == 1
+    assert filas(ss, "Traslados_Pendientes")[0][3] == "3"
+    assert filas(ss, S2)[3][3] == "5"
+    assert app.op_receive_transfer(S2, "DW2", "Aleta", 3, "5", tid, "u")[0]
+    assert filas(ss, "Traslados_Pendientes") == []
+    assert filas(ss, S2)[-1][:4] == ["DW2", "Aleta", "RACK 5", "3"]
+    assert app.op_receive_transfer(S2, "DW2", "Aleta", 1, "5", tid, "u")[1] == "El traslado ya no está pendiente (fue recibido o cancelado)."
+    todo_al_dia()
+
+
+def test_cancelacion(ss):
+    assert app.op_send_transfer(S1, "756", "RACK 1", 5, S2, "u")[0]
+    item = app._get_df("Traslados_Pendientes").iloc[0]
+    assert app.op_cancel_transfer(S1, item, "RACK 1", "u")[0]
+    assert filas(ss, S1)[0][:4] == ["756", "Parabrisas", "RACK 1", "5"]
+    assert filas(ss, "Traslados_Pendientes") == []
+    assert [f[2] for f in filas(ss, "Movimientos")] == ["Envío Traslado", "Alta/Compra", "Cancelación Traslado"]
+    todo_al_dia()
+
+
+# ── Espejo: lo que no llegó a Sheets se repite desde la salida local ──
+
+def test_espejo_repite_pendientes(ss, monkeypatch):
+    be = app._backend()
+    if not isinstance(be, app.SQLiteBackend) or not be._mirror_pool: pytest.skip("sólo con sqlite+sheets")
+    espejo_al_dia()
+    orig = ss.batch_update
+    def caida(*args, **kwargs): raise ConnectionError("sin red")
+    monkeypatch.setattr(ss, "batch_update", caida)
+    assert app.op_venta(S1, "756", "RACK 1", "d", 1, 0, "u")[0]
+    espejo_al_dia()
+    assert be.espejo_pendientes()[0] > 0
+    assert filas(ss, S1)[0][3] == "5"
+    monkeypatch.setattr(ss, "batch_update", orig)
+    be.replicar_espejo(forzar=True)
+    espejo_al_dia()
+    assert be.espejo_pendientes() == (0, None)
+    assert filas(ss, S1)[0][:4] == ["756", "Parabrisas", "RACK 1", "4"]
+    assert FECHA not in filas(ss, S1)[0]
+    todo_al_dia()
@@ -0,0 +1,89 @@
+"""
+Instantáneas locales: un proceso nuevo publica las hojas desde su Parquet
+sin esperar a Sheets y la sincronización en segundo plano deja los mismos
+frames que una descarga completa, bajando sólo lo que cambió mientras el
+servidor estaba abajo. Una instantánea de otra versión o que no cuadra con
+su control se ignora.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import app
+from conftest import FECHA, S1, S2
+
+pytestmark = pytest.mark.parametrize("libro", ["sheets"], indirect=True)  # sólo con Sheets como almacenamiento
+
+
+@pytest.fixture
+def snap(libro, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "SNAPSHOT_DIR", str(tmp_path / "instantaneas"))
+    libro.ws["Movimientos"].rows += [["2026-01-02 10:00:00", "756", "Venta/Instalación", "d", "1", "0", "u", S1]]
+    app._init_session()
+    app._instantaneas()["pool"].submit(lambda: None).result()  # instantáneas ya escritas
+    return libro
+
+
+def reinicio():
+    """Lo que pierde un proceso nuevo: la caché, la matriz de la red y el estado de las instantáneas."""
+    for recurso in (app._shared_cache, app._red, app._instantaneas): recurso.clear()
+
+
+def test_guarda_las_hojas_grandes(snap):
+    guardadas = sorted(f for f in os.listdir(app.SNAPSHOT_DIR) if f.endswith(".parquet"))
+    assert guardadas == sorted(f"{n}.parquet" for n in app.INSTANTANEAS)
+    for name in app.INSTANTANEAS:
+        df, meta = app._instantanea_cargar(name)
+        pd.testing.assert_frame_equal(df, app._get_df(name))
+        assert meta["filas"] == len(df) and meta["version"] == app.SNAPSHOT_VERSION
+
+
+def test_arranque_desde_instantanea_y_sincroniza_lo_cambiado(snap, monkeypatch):
+    # Mientras el servidor estaba abajo: otra sucursal vendió y la bitácora creció
+    snap.ws[S2].update_cell(3, 4, "99")
+    snap.ws["Movimientos"].append_rows([["2026-01-03 10:00:00", "FW1", "Alta/Compra", "d", "2", "0", "u", S2]])
+    reinicio()
+    completas, cargar = [], app._load_many
+    monkeypatch.setattr(app, "_load_many", lambda nombres: completas.extend(nombres) or cargar(nombres))
+    app._init_session()
+    # Publicadas desde la copia local (aún sin la venta de S2); sólo Traslados, que no tiene instantánea, se descargó
+    assert completas == ["Traslados_Pendientes"]
+    app._instantaneas()["hilo"].join()
+    assert not app._instantaneas()["sincronizando"] and not app._instantaneas()["errores"]
+    # De las sucursales sólo se descargó completa la que cambió; la bitácora se leyó desde su última fila
+    assert completas == ["Traslados_Pendientes", S2]
+    for name in [*app.SUCURSALES, "Movimientos", "Traslados_Pendientes"]:
+        pd.testing.assert_frame_equal(app._get_df(name), app._load_df(name), check_dtype=False)
+    assert app._get_df(S2)["CANTIDAD"].iloc[1] == 99
+    assert app._get_df("Movimientos")["CLAVE"].tolist() == ["756", "FW1"]
+
+
+def test_instantanea_invalida_se_ignora(snap):
+    base = os.path.join(app.SNAPSHOT_DIR, S1)
+    with open(base + ".json") as f: meta = json.load(f)
+    with open(base + ".json", "w") as f: json.dump(meta | {"version": app.SNAPSHOT_VERSION + 1}, f)
+    assert app._instantanea_cargar(S1) is None
+    with open(base + ".json", "w") as f: json.dump(meta | {"filas": meta["filas"] + 1}, f)
+    assert app._instantanea_cargar(S1) is None
+    os.remove(base + ".parquet")
+    assert app._instantanea_cargar(S1) is None
+    reinicio()
+    app._init_session()
+    pd.testing.assert_frame_equal(app._get_df(S1), app._load_df(S1))
+
+
+def test_columnas_mixtas_vuelven_con_su_tipo(snap):
+    # DETALLE con números y texto queda como object: se guarda como texto y vuelve con numericise_all
+    df = app._values_to_df([app._headers("Movimientos"), [FECHA, "756", "Venta/Instalación", "12", "1", "0", "u", S1],
+                            [FECHA, "FW1", "Venta/Instalación", "sin nota", "2", "0", "u", S2]])
+    assert df["DETALLE"].tolist() == [12, "sin nota"]
+    app._instantanea_guardar("Movimientos", df, None)
+    app._instantaneas()["pool"].submit(lambda: None).result()
+    copia, meta = app._instantanea_cargar("Movimientos")
+    assert meta["mixtas"] == ["DETALLE"]
+    pd.testing.assert_frame_equal(copia, df)
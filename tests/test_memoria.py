@@ -0,0 +1,69 @@
+"""
+Frames compactos en caché: categorías, CANTIDAD int32 y FECHA datetime.
+_a_valores devuelve los mismos valores de celda que se leyeron, así que
+volver a armar el frame con ellos da el mismo frame (ida y vuelta sin
+pérdida), y las escrituras parchadas siguen cuadrando con la hoja.
+"""
+
+from __future__ import annotations
+
+import random
+
+import pandas as pd
+import pytest
+
+import app
+from benchmark import hoja_inventario
+from conftest import FECHA, S1, S2, espejo_al_dia
+
+rnd = random.Random(11)
+TIPOS = ["Venta/Instalación", "Alta/Compra", "Traslado Enviado", "Traslado Recibido", "Reubicación Interna"]
+MOVIMIENTOS = [app.ENCABEZADOS["Movimientos"]] + [[f"2026-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:00:00", f"FW{rnd.randint(0, 500)}", rnd.choice(TIPOS),
+                                                   rnd.choice(["", "nota", "12"]), str(rnd.randint(1, 4)), str(rnd.choice([0, 1500])), f"usuario{i % 9}",
+                                                   rnd.choice(list(app.SUCURSALES))] for i in range(3_000)]
+
+
+def ida_y_vuelta(df: pd.DataFrame):
+    pd.testing.assert_frame_equal(app._values_to_df([list(df.columns)] + app._a_valores(df)), df)
+
+
+@pytest.mark.parametrize("values", [hoja_inventario(3_000), hoja_inventario(500, semilla=3, duplicados=0.2), MOVIMIENTOS], ids=["inventario", "duplicados", "movimientos"])
+def test_ida_y_vuelta(values):
+    df = app._values_to_df(values)
+    assert all(isinstance(df[c].dtype, pd.CategoricalDtype) for c in app.CATEGORICAS if c in df.columns)
+    assert df["CANTIDAD"].dtype == "int32" and pd.api.types.is_datetime64_any_dtype(df["FECHA"])
+    ida_y_vuelta(df)
+    c, t = app._memoria_frame(df)
+    assert c < t
+
+
+def test_fecha_fuera_de_formato_queda_como_texto():
+    df = app._values_to_df(MOVIMIENTOS[:3] + [["ayer", *MOVIMIENTOS[1][1:]], ["", *MOVIMIENTOS[2][1:]]])
+    assert not pd.api.types.is_datetime64_any_dtype(df["FECHA"]) and df["FECHA"].tolist()[-2:] == ["ayer", ""]
+    ida_y_vuelta(df)
+    # Una fecha vacía sí cabe en la columna datetime (NaT) y vuelve como ""
+    df = app._values_to_df(MOVIMIENTOS[:3] + [["", *MOVIMIENTOS[2][1:]]])
+    assert pd.api.types.is_datetime64_any_dtype(df["FECHA"]) and app._a_valores(df)[-1][0] == ""
+    ida_y_vuelta(df)
+
+
+def test_concat_compacto_une_categorias():
+    a, b = app._values_to_df(MOVIMIENTOS[:1500]), app._values_to_df(MOVIMIENTOS[:1] + MOVIMIENTOS[1500:] + [[FECHA, "X", "Tipo nuevo", "", "1", "0", "u", S1]])
+    df = app._concat_compacto(a, b)
+    assert isinstance(df["TIPO"].dtype, pd.CategoricalDtype) and "Tipo nuevo" in df["TIPO"].cat.categories
+    pd.testing.assert_frame_equal(df, app._values_to_df(MOVIMIENTOS + [[FECHA, "X", "Tipo nuevo", "", "1", "0", "u", S1]]), check_categorical=False)
+    ida_y_vuelta(df)
+
+
+def test_escrituras_parchadas_siguen_compactas(libro):
+    app._init_session()
+    assert app.op_alta(S1, "NUEVA", "Techo", "RACK 9", 2, "u")[0]
+    assert app.op_relocate(S1, "756", "Parabrisas", "RACK 1", "BODEGA", 1, "u")[0]
+    assert app.op_send_transfer(S2, "DW2", "RACK 2", 1, S1, "u")[0]
+    app._flush_movements()
+    espejo_al_dia()
+    for hoja in (S1, S2, "Movimientos", "Traslados_Pendientes"):
+        df = app._get_df(hoja)
+        assert all(isinstance(df[c].dtype, pd.CategoricalDtype) for c in app.CATEGORICAS if c in df.columns), hoja
+        assert df["CANTIDAD"].dtype == "int32", hoja
+        assert app._a_valores(df) == app._a_valores(app._load_df(hoja)), hoja
@@ -0,0 +1,43 @@
+"""
+Normalización vectorizada: _clean_series y _normalize_rack_series dan lo
+mismo celda por celda que _clean y _normalize_rack, y _normalize_df lo
+mismo que el .apply fila por fila.
+"""
+
+from __future__ import annotations
+
+import pandas as pd
+import pytest
+
+import app
+from benchmark import hoja_inventario
+
+RAROS = ["fw1", " DW 2 ", "ab  3\t", "x\x0b4", "ñandú", "Ünico", "756", "", "  ", "a b", "\tT\n", "rack  5", "A-1/b"]
+
+
+@pytest.mark.parametrize("valores", [RAROS, [756, 12.5, 0, -3], [None, "fw1", float("nan")], ["PLAIN", "YA LIMPIA"]])
+def test_clean_series_igual_que_escalar(valores):
+    s = pd.Series(valores, dtype=object)
+    assert app._clean_series(s).tolist() == [app._clean(v) for v in s]
+
+
+def test_clean_series_sobre_texto_de_pandas():
+    s = pd.Series(RAROS, dtype="str")
+    assert app._clean_series(s).tolist() == [app._clean(v) for v in RAROS]
+
+
+def test_normalize_rack_series_igual_que_escalar():
+    crudos = ["1", "12", " rack 3", "RACK 4 ", "rack  5", "peine", "sin peine", "Piso", "", "  ", "bodega a", "RACK", "Rack Ñ", 7, None, float("nan")]
+    s = pd.Series(crudos * 3, dtype=object)
+    assert app._normalize_rack_series(s).tolist() == [app._normalize_rack(v) for v in s]
+
+
+def test_normalize_df_igual_que_fila_por_fila():
+    values = hoja_inventario(3_000)
+    crudo = pd.DataFrame([app.numericise_all(r) for r in values[1:]], columns=values[0])
+    ref = crudo.copy()
+    ref["CLAVE"] = ref["CLAVE"].apply(app._clean)
+    ref["RACK"] = ref["RACK"].apply(lambda raw: app._rack_canon.__wrapped__("" if raw is None else str(raw)))
+    ref["NOMBRE"] = ref["NOMBRE"].astype(str)
+    ref["CANTIDAD"] = pd.to_numeric(ref["CANTIDAD"], errors="coerce").fillna(0).astype(int)
+    pd.testing.assert_frame_equal(app._normalize_df(crudo.copy()), app._compactar(ref))
@@ -0,0 +1,84 @@
+"""
+Importación de pedidos desde archivo: lectura por bloques del CSV/XLSX
+(separador, encabezado, filas cortas y filas más anchas que la muestra),
+agregado por (CLAVE, RACK) con la línea del archivo de cada clave y de
+cada error, y el alta por lotes contra la hoja simulada.
+"""
+
+from __future__ import annotations
+
+import io
+
+import pandas as pd
+import pytest
+
+import app
+from conftest import S1, filas
+
+
+def leer(texto: str | bytes, nombre: str = "pedido.csv", bloque: int = app.PEDIDO_BLOQUE, rack: str = "PISO"):
+    datos = texto.encode() if isinstance(texto, str) else texto
+    return app._agregar_pedido(app._bloques_pedido(app._tablas_manifiesto(io.BytesIO(datos), nombre, bloque), rack))
+
+
+def totales(agregado: pd.DataFrame) -> dict:
+    return dict(zip(zip(agregado["CLAVE"], agregado["RACK"]), agregado["CANTIDAD"]))
+
+
+def test_posicional_con_filas_cortas():
+    agregado, resumen = leer("fw1,2,1\nfw1,3,RACK 1\ndw2\n  756 ,1,peine\n")
+    assert totales(agregado) == {("FW1", "RACK 1"): 5, ("DW2", "RACK PISO"): 1, ("756", "RACK PEINE"): 1}
+    assert agregado["LINEA"].tolist() == [1, 3, 4] and agregado["LINEAS"].tolist() == [2, 1, 1]
+    assert resumen == {"leidas": 4, "invalidas": 0, "errores": []}
+
+
+def test_encabezado_y_separador():
+    agregado, _ = leer("Rack;Notas;Cantidad;Clave\n1;x;2;fw1\n;;4;fw1\n")
+    assert totales(agregado) == {("FW1", "RACK 1"): 2, ("FW1", "RACK PISO"): 4}
+    assert agregado["LINEA"].tolist() == [2, 3]
+
+
+def test_fila_ancha_despues_de_la_muestra():
+    # La muestra (8 KB) sólo ve filas de dos columnas; la fila ancha llega después
+    agregado, resumen = leer("ABC123,1\n" * 1500 + "XYZ,2,R1,extra,more\n" + "Q,3\n")
+    assert totales(agregado) == {("ABC123", "RACK PISO"): 1500, ("XYZ", "RACK R1"): 2, ("Q", "RACK PISO"): 3}
+    assert agregado.set_index("CLAVE")["LINEA"].to_dict() == {"ABC123": 1, "XYZ": 1501, "Q": 1502}
+    assert resumen["leidas"] == 1502 and not resumen["invalidas"]
+
+
+def test_fila_ancha_con_encabezado_y_comillas():
+    texto = 'Clave,Cantidad,Rack\n' + 'fw1,1,2\n' * 800 + '"dw2",2,3,"nota, con, comas",x,y,z\n'
+    agregado, _ = leer(texto, bloque=300)
+    assert totales(agregado) == {("FW1", "RACK 2"): 800, ("DW2", "RACK 3"): 2}
+
+
+def test_lineas_invalidas_con_su_linea():
+    agregado, resumen = leer("fw1,2\n,3\nfw2,cero\nfw3,-1\nfw4,1.5\nfw1,1\n", bloque=2)
+    assert totales(agregado) == {("FW1", "RACK PISO"): 3}
+    assert resumen["invalidas"] == 4
+    assert [(e["LINEA"], e["DETALLE"]) for e in resumen["errores"]] == [
+        (2, "Clave vacía."), (3, "Cantidad inválida."), (4, "Cantidad inválida."), (5, "Cantidad inválida.")]
+
+
+def test_xlsx():
+    from openpyxl import Workbook
+    libro = Workbook()
+    for fila in [["CLAVE", "CANTIDAD", "RACK"], ["fw1", 2.0, 1], ["dw2", None, "peine"]]: libro.active.append(fila)
+    buf = io.BytesIO(); libro.save(buf)
+    agregado, _ = leer(buf.getvalue(), "pedido.xlsx")
+    assert totales(agregado) == {("FW1", "RACK 1"): 2, ("DW2", "RACK PEINE"): 1}
+
+
+def test_bloques_igual_que_de_una_vez():
+    texto = "".join(f"k{i % 37},{i % 4 + 1},{i % 5}\n" for i in range(2000))
+    assert totales(leer(texto, bloque=128)[0]) == totales(leer(texto)[0])
+
+
+def test_importar_en_lotes(libro, monkeypatch):
+    app._init_session()
+    monkeypatch.setattr(app, "PEDIDO_LOTE", 2)
+    agregado, _ = leer("756,2,1\nx1,1,9\nx2,4,9\n756,1,1\n")
+    ok, msg, fallidas = app.op_importar_pedido(S1, agregado, "Parabrisas", "u")
+    assert ok and not fallidas, msg
+    assert filas(libro, S1)[0][3] == "8"
+    assert [f[:4] for f in filas(libro, S1) if f[0].startswith("X")] == [["X1", "Parabrisas", "RACK 9", "1"], ["X2", "Parabrisas", "RACK 9", "4"]]
@@ -0,0 +1,60 @@
+"""
+Existencias en la red: la matriz CLAVE × sucursal, parchada con el delta de
+cada escritura, da lo mismo que agrupar los frames de las sucursales, igual
+que el pivote con TOTAL de la vista de administrador.
+"""
+
+from __future__ import annotations
+
+import pandas as pd
+
+import app
+from conftest import S1, S2
+
+
+def referencia(clave: str) -> dict:
+    out = {}
+    for s in app.SUCURSALES:
+        df = app._get_df(s)
+        g = df[(df["CLAVE"] == clave) & (df["CANTIDAD"] > 0)].groupby("RACK", observed=True)["CANTIDAD"].sum()
+        out[s] = {r: int(q) for r, q in g.items() if q > 0}
+    return out
+
+
+def matriz_referencia() -> pd.DataFrame:
+    piv = pd.DataFrame({app.SUCURSALES[s]: app._get_df(s).groupby("CLAVE")["CANTIDAD"].sum() for s in app.SUCURSALES}).fillna(0).astype(int)
+    piv["TOTAL"] = piv.sum(axis=1)
+    return piv[piv["TOTAL"] > 0].sort_index().rename_axis("CLAVE").reset_index()
+
+
+def todo_cuadra():
+    claves = set().union(*(app._get_df(s)["CLAVE"] for s in app.SUCURSALES))
+    for c in claves: assert app._stock_red(c) == referencia(c), c
+    pd.testing.assert_frame_equal(app._matriz_stock(), matriz_referencia())
+
+
+def test_matriz_inicial(libro):
+    app._init_session()
+    assert app._stock_red("fw1") == {s: {"RACK PISO": 3} for s in app.SUCURSALES}
+    assert app._red_texto("756", excluir=S1) == " · ".join(f"{n}: 5 pz (RACK 1: 5)" for s, n in app.SUCURSALES.items() if s != S1)
+    todo_cuadra()
+
+
+def test_parches_de_cada_escritura(libro):
+    app._init_session()
+    todo_cuadra()
+    pivote = app._matriz_stock()
+    assert app.op_venta(S1, "756", "RACK 1", "d", 5, 0, "u")[0]
+    assert app._matriz_stock() is not pivote
+    todo_cuadra()
+    assert app.op_alta(S1, "NUEVA", "Puerta", "RACK 3", 2, "u")[0]
+    assert app.op_relocate(S1, "NUEVA", "Puerta", "RACK 3", "RACK 4", 1, "u")[0]
+    todo_cuadra()
+    assert app.op_send_transfer(S2, "DW2", "RACK 2", 3, S1, "u")[0]
+    tid = app._get_df("Traslados_Pendientes")["ID"].iloc[-1]
+    assert app.op_receive_transfer(S1, "DW2", "Aleta", 3, "RACK 7", tid, "u")[0]
+    todo_cuadra()
+    assert app.limpiar_duplicados_cero(S2)[0]
+    assert app.op_clean_duplicates(S1)[0]
+    todo_cuadra()
+    assert app._stock_red("DW2") == {S1: {"RACK 2": 4, "RACK 7": 3}, S2: {"RACK 2": 1}} | {s: {"RACK 2": 4} for s in list(app.SUCURSALES)[2:]}
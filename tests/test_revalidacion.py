@@ -0,0 +1,74 @@
+"""
+Revalidación por revisión del libro y centinela por hoja: sin cambios no se
+descarga nada, las escrituras de esta app ya parcharon la caché, una edición
+a mano baja sólo su hoja y la bitácora se lee desde su última fila. Tras
+cada pasada la caché queda igual que una descarga completa.
+"""
+
+from __future__ import annotations
+
+import pandas as pd
+import pytest
+
+import app
+from conftest import FECHA, S1, S2
+
+HOJAS = [*app.SUCURSALES, "Movimientos", "Traslados_Pendientes"]
+
+
+@pytest.fixture
+def completas(libro, monkeypatch):
+    """Hojas descargadas completas por _revalidar (vía _load_many)."""
+    app._init_session()
+    app._revalidar(HOJAS)  # primera pasada: guarda la revisión con la que se validó cada hoja
+    bajadas, cargar = [], app._load_many
+    monkeypatch.setattr(app, "_load_many", lambda nombres: bajadas.extend(nombres) or cargar(nombres))
+    return bajadas
+
+
+def igual_que_descarga():
+    for name in HOJAS: pd.testing.assert_frame_equal(app._get_df(name), app._load_df(name), check_dtype=False)
+
+
+def test_sin_cambios(completas):
+    assert app._revalidar(HOJAS) == [] and completas == []
+
+
+def test_tras_escrituras_de_esta_app(completas):
+    assert app.op_venta(S1, "756", "RACK 1", "d", 2, 0, "u")[0]
+    assert app.op_send_transfer(S2, "DW2", "RACK 2", 1, S1, "u")[0]
+    app._flush_movements()
+    assert app._revalidar(HOJAS) == [] and completas == []
+    igual_que_descarga()
+
+
+def test_edicion_a_mano_baja_solo_su_hoja(libro, completas):
+    app._backend().update_cells(S2, {3: {"CANTIDAD": 77}})  # otra instancia o una edición a mano
+    assert app._revalidar(HOJAS) == [S2] and completas == [S2]
+    assert app._get_df(S2)["CANTIDAD"].iloc[1] == 77
+    igual_que_descarga()
+    assert app._huella(app._get_df(S2)) == app._backend().huellas({S2: len(app._get_df(S2))})[S2]
+
+
+def test_bitacora_se_lee_desde_su_ultima_fila(libro, completas):
+    app._backend().append_rows("Movimientos", [[FECHA, "FW1", "Alta/Compra", "a mano", "2", "0", "u", S1]])
+    assert app._revalidar(HOJAS) == ["Movimientos"] and completas == []
+    assert app._get_df("Movimientos")["DETALLE"].tolist() == ["a mano"]
+    igual_que_descarga()
+
+
+def test_bitacora_que_perdio_filas_se_recarga(libro, completas):
+    mov = [[FECHA, c, "Alta/Compra", "d", "1", "0", "u", S1] for c in ("A1", "A2", "A3")]
+    app._backend().append_rows("Movimientos", mov)
+    assert app._revalidar(HOJAS) == ["Movimientos"] and completas == []
+    app._backend().delete_rows("Movimientos", [2])  # p. ej. el archivo movió la primera fila a una partición
+    assert app._revalidar(HOJAS) == ["Movimientos"] and completas == ["Movimientos"]
+    assert app._get_df("Movimientos")["CLAVE"].tolist() == ["A2", "A3"]
+    igual_que_descarga()
+
+
+def test_edad_maxima_fuerza_descarga(libro, completas, monkeypatch):
+    monkeypatch.setattr(app, "RECONCILIACION_MAX_SEG", -1)
+    app._revalidar(HOJAS)
+    assert sorted(completas) == sorted(HOJAS)
+    igual_que_descarga()
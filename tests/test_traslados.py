@@ -0,0 +1,54 @@
+"""
+IDs de traslado: las filas que llegan sin ID (hojas anteriores a la
+columna o agregadas a mano) lo reciben en cada carga completa de la hoja,
+y un ID vacío nunca se resuelve a otra fila.
+"""
+
+from __future__ import annotations
+
+import pytest
+
+import app
+from conftest import S1, S2, filas
+
+TRASLADO = ["2026-01-01 10:00:00", "756", "Parabrisas", "2", S1, S2]
+
+
+def ids(ss) -> list[str]:
+    return [f[6] if len(f) > 6 else "" for f in filas(ss, "Traslados_Pendientes")]
+
+
+def test_hoja_sin_columna_id(libro):
+    libro.ws["Traslados_Pendientes"].rows = [app.ENCABEZADOS["Traslados_Pendientes"][:6], list(TRASLADO), list(TRASLADO)]
+    app._init_session()
+    assert libro.ws["Traslados_Pendientes"].rows[0][6] == "ID"
+    assert all(ids(libro)) and len(set(ids(libro))) == 2
+    assert app._get_df("Traslados_Pendientes")["ID"].tolist() == ids(libro)
+
+
+@pytest.mark.parametrize("carga", ["revalidación", "recarga"])
+def test_fila_agregada_a_mano(libro, carga):
+    app._init_session()
+    assert app.op_send_transfer(S1, "DW2", "RACK 2", 1, S2, "u")[0]
+    app._backend().append_rows("Traslados_Pendientes", [TRASLADO + [""]])  # a mano, sin pasar por la caché
+    if carga == "revalidación": assert app._revalidar(["Traslados_Pendientes"]) == ["Traslados_Pendientes"]
+    else: app._refresh("Traslados_Pendientes")
+    df = app._get_df("Traslados_Pendientes")
+    assert len(df) == 2 and (df["ID"].str.strip() != "").all()
+    assert df["ID"].tolist() == ids(libro)
+    assert app.op_receive_transfer(S2, "756", "Parabrisas", 2, "9", df["ID"].iloc[1], "u")[0]
+    assert [f[1] for f in filas(libro, "Traslados_Pendientes")] == ["DW2"]
+
+
+def test_id_vacio_se_rechaza(libro):
+    app._init_session()
+    assert app.op_send_transfer(S1, "756", "RACK 1", 2, S2, "u")[0]
+    with pytest.raises(ValueError, match="no tiene ID"): app._find_transfer("")
+    with pytest.raises(ValueError, match="no tiene ID"): app._id_lookup(app._sheet("Traslados_Pendientes"), [" "])
+    ok, msg = app.op_receive_transfer(S2, "756", "Parabrisas", 2, "9", "", "u")
+    assert not ok and app.SIN_ID_MSG in msg
+    item = app._get_df("Traslados_Pendientes").iloc[0].copy()
+    item["ID"] = ""
+    assert not app.op_cancel_transfer(S1, item, "RACK 1", "u")[0]
+    assert filas(libro, "Traslados_Pendientes")[0][3] == "2"
+    assert filas(libro, S1)[0][3] == "3"